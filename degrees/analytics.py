@@ -0,0 +1,290 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import struct
+import sys
+
+import numpy as np
+
+from graph import load_graph
+
+# Header of the binary distance files written by write_binary
+DISTANCES_MAGIC = b"DEGDIST\0"
+
+# CSR arrays of the graph being analysed, shared with worker processes
+arrays = None
+
+
+class GraphArrays():
+    """
+    NumPy views of the CSR arrays of a CompactGraph.
+    """
+
+    def __init__(self, graph):
+        self.person_offsets = np.frombuffer(graph.person_offsets, np.int32)
+        self.person_movies = np.frombuffer(graph.person_movies, np.int32)
+        self.movie_offsets = np.frombuffer(graph.movie_offsets, np.int32)
+        self.movie_people = np.frombuffer(graph.movie_people, np.int32)
+        self.people = len(self.person_offsets) - 1
+        self.movies = len(self.movie_offsets) - 1
+
+
+def gather(offsets, values, rows):
+    """
+    Returns the concatenated CSR rows `rows` of `values`.
+    """
+    starts = offsets[rows].astype(np.int64)
+    lengths = offsets[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return values[:0]
+
+    # Index of every value: its row's start plus its position in the row
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return values[shifts + np.arange(total)]
+
+
+def distances_from(arrays, source):
+    """
+    Returns the degrees of separation from the person with index `source`
+    to every person, or -1 for people who are not connected, found by one
+    level-synchronous breadth-first search.
+    """
+    distance = np.full(arrays.people, -1, np.int16)
+    seen_movie = np.zeros(arrays.movies, bool)
+    distance[source] = 0
+    frontier = np.array([source], np.int32)
+    level = 0
+    while frontier.size:
+        level += 1
+        movies = np.unique(gather(
+            arrays.person_offsets, arrays.person_movies, frontier
+        ))
+        movies = movies[~seen_movie[movies]]
+        seen_movie[movies] = True
+
+        people = np.unique(gather(
+            arrays.movie_offsets, arrays.movie_people, movies
+        ))
+        frontier = people[distance[people] == -1]
+        distance[frontier] = level
+    return distance
+
+
+def components(arrays):
+    """
+    Returns the connected component of every person, labelled by the
+    lowest person index in the component.
+    """
+    labels = np.arange(arrays.people, dtype=np.int32)
+    no_label = np.full(arrays.movies, arrays.people, np.int32)
+    while True:
+
+        # Give each movie the lowest label of its stars, and each person
+        # the lowest label of their movies
+        movie_labels = segment_min(
+            labels[arrays.movie_people], arrays.movie_offsets, no_label
+        )
+        updated = np.minimum(labels, segment_min(
+            movie_labels[arrays.person_movies], arrays.person_offsets, labels
+        ))
+
+        # Follow labels to their own labels until they settle
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def segment_min(values, offsets, default):
+    """
+    Returns the minimum of each CSR row of `values`, or the row's entry
+    in `default` for empty rows.
+    """
+    result = default.copy()
+    nonempty = offsets[1:] > offsets[:-1]
+    if values.size:
+        result[nonempty] = np.minimum.reduceat(values, offsets[:-1][nonempty])
+    return result
+
+
+def init_worker(graph_arrays):
+    global arrays
+    arrays = graph_arrays
+
+
+def distances_for(source):
+    return distances_from(arrays, source)
+
+
+def distances_for_sources(graph_arrays, sources, workers):
+    """
+    Yields the distance array of each source in turn, searching from
+    several sources at once on a pool of `workers` processes.
+    """
+    if workers <= 1 or len(sources) <= 1:
+        for source in sources:
+            yield distances_from(graph_arrays, source)
+        return
+    with multiprocessing.Pool(workers, init_worker, (graph_arrays,)) as pool:
+        yield from pool.imap(distances_for, sources)
+
+
+def resolve_person(graph, name):
+    """
+    Returns the index of the person with the person_id or unique name
+    `name`, or raises ValueError.
+    """
+    if name in graph.person_index:
+        return graph.person_index[name]
+    person_ids = sorted(graph.names.get(name.lower(), set()))
+    if not person_ids:
+        raise ValueError(f"Person not found: {name}")
+    if len(person_ids) > 1:
+        raise ValueError(
+            f"Ambiguous name: {name} (IDs {', '.join(person_ids)})"
+        )
+    return graph.person_index[person_ids[0]]
+
+
+def summarize(label, distance):
+    """
+    Prints the distribution of degrees of separation in `distance`.
+    """
+    reachable = distance[distance > 0]
+    counts = np.bincount(reachable) if reachable.size else np.zeros(1, int)
+    print(f"{label}:")
+    for degrees, count in enumerate(counts):
+        if degrees and count:
+            print(f"  {degrees}: {count}")
+    print(f"  Not connected: {int(np.sum(distance < 0))}")
+    if reachable.size:
+        print(f"  Mean: {reachable.mean():.3f}")
+
+
+def write_binary(path, graph, sources, rows, labels=None):
+    """
+    Writes a header naming the sources, followed by one row of
+    little-endian int16 distances per source, with people in the
+    order of people.csv and -1 for people who are not connected.
+
+    If `labels` is given, a final row of little-endian int32 follows
+    with the index of the person labelling each person's component.
+    """
+    header = {
+        "people": len(graph.person_ids),
+        "sources": [graph.person_ids[source] for source in sources],
+        "dtype": "<i2"
+    }
+    if labels is not None:
+        header["components"] = "<i4"
+    header = json.dumps(header).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(DISTANCES_MAGIC + struct.pack("<I", len(header)) + header)
+        for row in rows:
+            f.write(row.astype("<i2").tobytes())
+        if labels is not None:
+            f.write(labels.astype("<i4").tobytes())
+
+
+def write_csv(path, graph, sources, rows, labels=None):
+    """
+    Writes one row per person with their distance from each source,
+    blank if not connected, and their component if `labels` is given.
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        header = ["person_id"]
+        header += [graph.person_ids[source] for source in sources]
+        if labels is not None:
+            header.append("component")
+        writer.writerow(header)
+        for person, person_id in enumerate(graph.person_ids):
+            row = [person_id]
+            row += [
+                row_distances[person] if row_distances[person] >= 0 else ""
+                for row_distances in rows
+            ]
+            if labels is not None:
+                row.append(graph.person_ids[labels[person]])
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="degrees.py analytics",
+        description="Degrees of separation from people to everyone, "
+                    "and the connected components of the graph."
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument(
+        "--source", action="append", default=[], metavar="PERSON",
+        help="person_id or unique name to measure from; may be repeated"
+    )
+    parser.add_argument(
+        "--sources-file", metavar="FILE",
+        help="file with one person_id or name per line to measure from"
+    )
+    parser.add_argument(
+        "--components", action="store_true",
+        help="find the connected components of the graph"
+    )
+    parser.add_argument(
+        "--output", metavar="PATH",
+        help="write the per-person distances to PATH"
+    )
+    parser.add_argument("--format", choices=["csv", "binary"], default="csv")
+    parser.add_argument(
+        "--workers", type=int, default=multiprocessing.cpu_count(),
+        help="processes searching from different sources at once"
+    )
+    parser.add_argument("--no-cache", dest="cache", action="store_false")
+    args = parser.parse_args(argv)
+
+    graph = load_graph(args.directory, cache=args.cache)
+    graph_arrays = GraphArrays(graph)
+
+    names = list(args.source)
+    if args.sources_file:
+        with open(args.sources_file, encoding="utf-8") as f:
+            names += [line.strip() for line in f if line.strip()]
+    try:
+        sources = [resolve_person(graph, name) for name in names]
+    except ValueError as error:
+        sys.exit(str(error))
+
+    labels = None
+    if args.components:
+        labels = components(graph_arrays)
+        roots, sizes = np.unique(labels, return_counts=True)
+        print(f"{len(roots)} connected components")
+        for root, size in sorted(zip(roots, sizes), key=lambda c: -c[1])[:10]:
+            print(f"  {size} people, including "
+                  f"{graph.person_names[root]} ({graph.person_ids[root]})")
+
+    rows = distances_for_sources(graph_arrays, sources, args.workers)
+    if args.output and args.format == "binary":
+        def summarized(rows):
+            for source, row in zip(sources, rows):
+                summarize(graph.person_names[source], row)
+                yield row
+        write_binary(
+            args.output, graph, sources, summarized(rows), labels
+        )
+        return
+
+    rows = list(rows)
+    for source, row in zip(sources, rows):
+        summarize(graph.person_names[source], row)
+    if args.output:
+        write_csv(args.output, graph, sources, rows, labels)
+
+
+if __name__ == "__main__":
+    main()
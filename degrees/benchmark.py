@@ -0,0 +1,245 @@
+import argparse
+import random
+import time
+import tracemalloc
+
+import degrees
+from util import Node, StackFrontier, QueueFrontier
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the degrees search implementations."
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--frontier", type=int, metavar="CYCLES",
+        help="benchmark frontier add/remove cycles instead of searches"
+    )
+    parser.add_argument(
+        "--representations", action="store_true",
+        help="compare memory and latency of the dict and compact data"
+    )
+    parser.add_argument(
+        "--landmarks", type=int, metavar="K",
+        help="compare K-landmark bounds and search against plain BFS"
+    )
+    args = parser.parse_args()
+
+    if args.frontier:
+        benchmark_frontiers(args.frontier)
+        return
+    if args.representations:
+        benchmark_representations(args.directory, args.queries, args.seed)
+        return
+    if args.landmarks:
+        benchmark_landmarks(
+            args.directory, args.landmarks, args.queries, args.seed
+        )
+        return
+
+    print("Loading data...")
+    degrees.load_data(args.directory)
+    print("Data loaded.")
+
+    pairs = random_pairs(args.queries, args.seed)
+    searches = [
+        ("bfs", degrees.shortest_path),
+        ("bidirectional", degrees.shortest_path_bidirectional),
+    ]
+    results = {}
+    for label, search in searches:
+        results[label] = run_search(search, pairs)
+
+    print(f"{len(pairs)} queries")
+    for label, (expanded, elapsed, lengths) in results.items():
+        print(f"  {label}: {expanded} nodes expanded, {elapsed:.3f}s")
+
+    # Both searches must agree on the length of every path
+    baseline = results["bfs"][2]
+    for label, (_, _, lengths) in results.items():
+        if lengths != baseline:
+            print(f"  {label}: path lengths differ from bfs")
+
+
+def random_pairs(count, seed):
+    """
+    Returns `count` random (source, target) pairs of people
+    who have starred in at least one movie.
+    """
+    rng = random.Random(seed)
+    candidates = sorted(
+        person_id for person_id, person in degrees.people.items()
+        if person["movies"]
+    )
+    return [
+        (rng.choice(candidates), rng.choice(candidates))
+        for _ in range(count)
+    ]
+
+
+def run_search(search, pairs):
+    """
+    Runs `search` over every pair and returns the number of expanded
+    people, the total wall time and the list of path lengths.
+    """
+    expanded = 0
+    neighbors_for_person = degrees.neighbors_for_person
+
+    def counting_neighbors(person_id):
+        nonlocal expanded
+        expanded += 1
+        return neighbors_for_person(person_id)
+
+    degrees.neighbors_for_person = counting_neighbors
+    degrees.clear_caches()
+    lengths = []
+    try:
+        start = time.perf_counter()
+        for source, target in pairs:
+            path = search(source, target)
+            lengths.append(None if path is None else len(path))
+        elapsed = time.perf_counter() - start
+    finally:
+        degrees.neighbors_for_person = neighbors_for_person
+    return expanded, elapsed, lengths
+
+
+def benchmark_landmarks(directory, count, queries, seed):
+    """
+    Reports the time to build the landmark tables, and compares landmark
+    bounds and pruned search with plain BFS over the compact graph.
+    """
+    degrees.load_data(directory, compact=True)
+    pairs = random_pairs(queries, seed)
+
+    start = time.perf_counter()
+    degrees.load_landmarks(directory, count)
+    print(f"  {count} landmarks loaded in "
+          f"{time.perf_counter() - start:.2f}s")
+    oracle = degrees.oracle
+
+    start = time.perf_counter()
+    bounds = [degrees.separation_bounds(*pair) for pair in pairs]
+    bounds_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bfs = [degrees.graph.shortest_path(*pair) for pair in pairs]
+    bfs_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    guided = [oracle.shortest_path(*pair) for pair in pairs]
+    guided_time = time.perf_counter() - start
+
+    exact = 0
+    for (lower, upper), path, pruned in zip(bounds, bfs, guided):
+        length = None if path is None else len(path)
+        if length != (None if pruned is None else len(pruned)):
+            print("  landmark path length differs from bfs")
+        if length is None or lower == upper == length:
+            exact += 1
+    print(f"  bounds: {bounds_time / len(pairs) * 1e6:.0f}us per query, "
+          f"exact for {exact} of {len(pairs)}")
+    print(f"  bfs: {bfs_time / len(pairs) * 1e3:.2f}ms per search")
+    print(f"  landmark search: "
+          f"{guided_time / len(pairs) * 1e3:.2f}ms per search")
+
+
+def benchmark_representations(directory, queries, seed):
+    """
+    Loads the data as dicts and as a CompactGraph, and reports the memory
+    held by each along with load time, neighbor lookup and search latency.
+    """
+    pairs = None
+    for label, compact in [("dicts", False), ("compact", True)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        degrees.load_data(directory, compact=compact)
+        load_time = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if pairs is None:
+            pairs = random_pairs(queries, seed)
+        degrees.clear_caches()
+
+        start = time.perf_counter()
+        for source, target in pairs:
+            degrees.neighbors_for_person(source)
+        neighbors_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for source, target in pairs:
+            degrees.shortest_path(source, target)
+        search_time = time.perf_counter() - start
+
+        print(f"  {label}: {memory / 2**20:.1f} MiB, "
+              f"loaded in {load_time:.2f}s, "
+              f"{neighbors_time / len(pairs) * 1e6:.0f}us per neighbors, "
+              f"{search_time / len(pairs) * 1e3:.2f}ms per search")
+
+
+def benchmark_frontiers(cycles, size=1000):
+    """
+    Times `cycles` add/remove/contains_state cycles on frontiers that
+    hold `size` nodes, alongside the list-backed reference frontiers.
+    """
+    frontiers = [
+        ("StackFrontier", StackFrontier),
+        ("QueueFrontier", QueueFrontier),
+        ("ListStackFrontier", ListStackFrontier),
+        ("ListQueueFrontier", ListQueueFrontier),
+    ]
+    for label, frontier_class in frontiers:
+
+        # The list-backed frontiers copy on every remove, so give them
+        # fewer cycles and report the time per cycle
+        count = cycles if not label.startswith("List") else cycles // 100
+        frontier = frontier_class()
+        for i in range(size):
+            frontier.add(Node(i, None, None))
+
+        start = time.perf_counter()
+        for i in range(size, size + count):
+            frontier.add(Node(i, None, None))
+            frontier.contains_state(i - size)
+            frontier.remove()
+        elapsed = time.perf_counter() - start
+        print(f"  {label}: {count} cycles, {elapsed:.3f}s, "
+              f"{elapsed / count * 1e9:.0f}ns per cycle")
+
+
+class ListStackFrontier():
+    """
+    The original list-backed frontier, kept as a benchmark reference.
+    """
+    def __init__(self):
+        self.frontier = []
+
+    def add(self, node):
+        self.frontier.append(node)
+
+    def contains_state(self, state):
+        return any(node.state == state for node in self.frontier)
+
+    def empty(self):
+        return len(self.frontier) == 0
+
+    def remove(self):
+        node = self.frontier[-1]
+        self.frontier = self.frontier[:-1]
+        return node
+
+
+class ListQueueFrontier(ListStackFrontier):
+
+    def remove(self):
+        node = self.frontier[0]
+        self.frontier = self.frontier[1:]
+        return node
+
+
+if __name__ == "__main__":
+    main()
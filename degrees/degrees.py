@@ -1,7 +1,14 @@
-import csv
+import argparse
+import functools
+import os
 import sys
 
-from util import Node, StackFrontier, QueueFrontier
+from fuzzy import load_index, split_birth
+from graph import load_graph
+from ingest import IngestReport, read_chunks
+from landmarks import load_oracle
+from service import make_server, run_batch
+from util import LRUCache, Node, ReadWriteLock, StackFrontier, QueueFrontier
 
 # Maps names to a set of corresponding person_ids
 names = {}
@@ -12,63 +19,366 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# CompactGraph backing the three maps above, when loaded with compact=True
+graph = None
 
-def load_data(directory):
-    """
-    Load data from CSV files into memory.
-    """
-    # Load people
-    with open(f"{directory}/people.csv", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            people[row["id"]] = {
-                "name": row["name"],
-                "birth": row["birth"],
-                "movies": set()
-            }
-            if row["name"].lower() not in names:
-                names[row["name"].lower()] = {row["id"]}
-            else:
-                names[row["name"].lower()].add(row["id"])
-
-    # Load movies
-    with open(f"{directory}/movies.csv", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            movies[row["id"]] = {
-                "title": row["title"],
-                "year": row["year"],
-                "stars": set()
-            }
-
-    # Load stars
-    with open(f"{directory}/stars.csv", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                people[row["person_id"]]["movies"].add(row["movie_id"])
-                movies[row["movie_id"]]["stars"].add(row["person_id"])
-            except KeyError:
-                pass
+# LandmarkOracle over the graph, when loaded with load_landmarks
+oracle = None
+
+# FuzzyNameIndex of everyone's names, when loaded with load_name_index
+name_index = None
+
+# Bounded caches of co-star sets by person_id, and of completed searches
+# by (source, target)
+neighbor_cache = LRUCache(10000)
+path_cache = LRUCache(10000)
+
+# Marks a cache miss, since None is a valid search result
+MISSING = object()
+
+# Held for reading while answering queries, and for writing while
+# applying delta files
+data_lock = ReadWriteLock()
+
+
+def load_data(directory, compact=False, cache=True):
+    """
+    Load data from CSV files into memory, streaming each file in chunks.
+    Returns an IngestReport of the rows that were accepted and rejected.
+
+    With `compact`, the data is stored in an integer-indexed CompactGraph
+    and `names`, `people` and `movies` become read-only views over it.
+    The graph is memory-mapped from a binary snapshot next to the CSV
+    files, which is rebuilt whenever they change, unless `cache` is False.
+    """
+    global graph, oracle, name_index, names, people, movies
+    oracle = None
+    name_index = None
+    clear_caches()
+    if compact:
+        graph = load_graph(directory, cache=cache)
+        names, people, movies = graph.names, graph.people, graph.movies
+        return graph.report
+    graph = None
+    names, people, movies = {}, {}, {}
+
+    report = IngestReport()
+    for filename, add in [("people.csv", add_people),
+                          ("movies.csv", add_movies),
+                          ("stars.csv", add_stars)]:
+        path = os.path.join(directory, filename)
+        for chunk in read_chunks(path, filename):
+            add(chunk, report)
+    return report
+
+
+def apply_delta(directory):
+    """
+    Add the new people, movies and credits in the append-only delta files
+    (people.csv, movies.csv and stars.csv, each optional) in `directory`
+    to the loaded data, without reloading it.
+    Returns an IngestReport of the rows that were accepted and rejected.
+
+    Cached co-stars of everyone in a changed movie are invalidated, and
+    cached searches are dropped since new credits can shorten any path.
+    Landmark distances may no longer hold, so the oracle is unloaded.
+    New people, and the new popularity of anyone with new credits, are
+    added to the name index.
+    """
+    global oracle, names, people, movies
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"No such delta directory: {directory}")
+    report = IngestReport()
+    with data_lock.write():
+        for filename, add in [("people.csv", add_people),
+                              ("movies.csv", add_movies),
+                              ("stars.csv", add_stars)]:
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                continue
+            for chunk in read_chunks(path, filename):
+                changed = add(chunk, report)
+                for person_id in changed or ():
+                    neighbor_cache.invalidate(person_id)
+                if name_index is not None:
+                    update_name_index(chunk, changed or ())
+        if graph is not None:
+            names, people, movies = graph.names, graph.people, graph.movies
+        if report.accepted["stars.csv"]:
+            path_cache.clear()
+            oracle = None
+    return report
+
+
+def add_people(rows, report):
+    """
+    Add people from people.csv rows, rejecting rows with known IDs.
+    """
+    if graph is not None:
+        return graph.add_people(rows, report)
+    for row in rows:
+        if not row["id"] or row["name"] is None:
+            report.reject("people.csv", "malformed row")
+            continue
+        if row["id"] in people:
+            report.reject("people.csv", "duplicate id")
+            continue
+        people[row["id"]] = {
+            "name": row["name"],
+            "birth": row["birth"] or "",
+            "movies": set()
+        }
+        if row["name"].lower() not in names:
+            names[row["name"].lower()] = {row["id"]}
+        else:
+            names[row["name"].lower()].add(row["id"])
+        report.accept("people.csv")
+
+
+def add_movies(rows, report):
+    """
+    Add movies from movies.csv rows, rejecting rows with known IDs.
+    """
+    if graph is not None:
+        return graph.add_movies(rows, report)
+    for row in rows:
+        if not row["id"] or row["title"] is None:
+            report.reject("movies.csv", "malformed row")
+            continue
+        if row["id"] in movies:
+            report.reject("movies.csv", "duplicate id")
+            continue
+        movies[row["id"]] = {
+            "title": row["title"],
+            "year": row["year"] or "",
+            "stars": set()
+        }
+        report.accept("movies.csv")
+
+
+def add_stars(rows, report):
+    """
+    Add credits from stars.csv rows, rejecting unknown people and movies
+    and credits already present.
+
+    Returns the person_ids whose co-stars have changed.
+    """
+    if graph is not None:
+        return graph.add_stars(rows, report)
+    changed = set()
+    for row in rows:
+        person = people.get(row["person_id"])
+        movie = movies.get(row["movie_id"])
+        if person is None:
+            report.reject("stars.csv", "unknown person")
+        elif movie is None:
+            report.reject("stars.csv", "unknown movie")
+        elif row["movie_id"] in person["movies"]:
+            report.reject("stars.csv", "duplicate credit")
+        else:
+            person["movies"].add(row["movie_id"])
+            movie["stars"].add(row["person_id"])
+            changed.update(movie["stars"])
+            report.accept("stars.csv")
+    return changed
+
+
+def update_name_index(rows, changed):
+    """
+    Adds the people in people.csv `rows` to the name index, and updates
+    the popularity of the `changed` people.
+    """
+    person_ids = {row.get("id") for row in rows} | set(changed)
+    for person_id in person_ids:
+        if person_id in people:
+            person = people[person_id]
+            name_index.add(person_id, person["name"], person["birth"],
+                           len(person["movies"]))
+
+
+def clear_caches():
+    """
+    Empties the neighbor and search caches, which must be done
+    whenever the data changes.
+    """
+    neighbor_cache.clear()
+    path_cache.clear()
+
+
+def cache_stats():
+    """
+    Returns the size, hit, miss and eviction counts of each cache.
+    """
+    return {
+        "neighbors": neighbor_cache.stats(),
+        "paths": path_cache.stats()
+    }
+
+
+def load_landmarks(directory, count):
+    """
+    Load or precompute distance tables for `count` landmark people,
+    which bound the degrees of separation and guide shortest_path.
+    Requires the data to have been loaded with compact=True.
+    """
+    global oracle
+    if graph is None:
+        raise ValueError("landmarks require compact data")
+    oracle = load_oracle(graph, directory, count)
+
+
+def load_name_index(directory):
+    """
+    Load or build the fuzzy index of everyone's names, which suggests
+    people for misspelled names and resolves ambiguous names without
+    asking.
+    """
+    global name_index
+    name_index = load_index(directory, name_entries)
+
+
+def name_entries():
+    """
+    Yields the person_id, name, birth and number of movies of everyone.
+    """
+    if graph is not None:
+        for person, person_id in enumerate(graph.person_ids):
+            birth = graph.person_births[person]
+            yield (person_id, graph.person_names[person],
+                   str(birth) if birth else "", len(graph.movies_of(person)))
+        return
+    for person_id, person in people.items():
+        yield person_id, person["name"], person["birth"], len(person["movies"])
+
+
+def name_candidates(query, limit=10):
+    """
+    Returns up to `limit` people whose names best match `query`, as
+    dictionaries of id, name, birth and score, or an empty list if no
+    name index is loaded.
+    """
+    if name_index is None:
+        return []
+    with data_lock.read():
+        return [
+            candidate._asdict()
+            for candidate in name_index.search(query, limit)
+        ]
 
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    if sys.argv[1:2] == ["analytics"]:
+
+        # Imported here since only analytics needs NumPy
+        import analytics
+        analytics.main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Find the degrees of separation between two people.",
+        epilog="Run 'degrees.py analytics --help' for whole-graph statistics."
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument(
+        "--bidirectional", action="store_true",
+        help="search from both people at once"
+    )
+    parser.add_argument(
+        "--compact", action="store_true",
+        help="store the data as an integer-indexed CSR graph"
+    )
+    parser.add_argument(
+        "--no-cache", dest="cache", action="store_false",
+        help="parse the CSV files instead of using the compact snapshot"
+    )
+    parser.add_argument(
+        "--landmarks", type=int, metavar="K",
+        help="guide searches with K precomputed landmarks (implies --compact)"
+    )
+    parser.add_argument(
+        "--names", action="store_true",
+        help="index names to suggest misspelled ones and resolve ambiguous "
+             "ones by birth year and popularity"
+    )
+    parser.add_argument(
+        "--delta", action="append", default=[], metavar="DIRECTORY",
+        help="apply append-only delta CSV files from DIRECTORY after loading"
+    )
+    parser.add_argument(
+        "--batch", metavar="FILE",
+        help="answer source,target lines from FILE (or - for stdin) as JSONL"
+    )
+    parser.add_argument(
+        "--serve", metavar="ADDRESS",
+        help="answer queries over HTTP on [HOST:]PORT, or on unix:PATH"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4,
+        help="number of worker threads for --batch and --serve"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=10000,
+        help="entries kept in each of the neighbor and search caches"
+    )
+    args = parser.parse_args()
+    directory = args.directory
+    neighbor_cache.maxsize = path_cache.maxsize = args.cache_size
+    if args.bidirectional:
+        search = shortest_path_bidirectional
+    else:
+        search = shortest_path
+
+    # Keep stdout for results when answering many queries
+    log = sys.stderr if args.batch or args.serve else sys.stdout
 
     # Load data from files into memory
-    print("Loading data...")
-    load_data(directory)
-    print("Data loaded.")
+    print("Loading data...", file=log)
+    compact = args.compact or bool(args.landmarks)
+    report = load_data(directory, compact=compact, cache=args.cache)
+    if args.names:
+        load_name_index(directory)
+    for delta in args.delta:
+        delta_report = apply_delta(delta)
+        print(f"Applied delta {delta}.", file=log)
+        if delta_report.rejected_count():
+            print(delta_report, file=log)
+    if args.landmarks:
+        load_landmarks(directory, args.landmarks)
+    print("Data loaded.", file=log)
+    if report.rejected_count():
+        print(report, file=log)
 
-    source = person_id_for_name(input("Name: "))
+    answer = functools.partial(answer_query, search=search)
+    if args.batch:
+        if args.batch == "-":
+            run_batch(sys.stdin, sys.stdout, answer, args.workers)
+        else:
+            with open(args.batch, encoding="utf-8") as f:
+                run_batch(f, sys.stdout, answer, args.workers)
+        print(f"Cache: {cache_stats()}", file=log)
+        return
+    if args.serve:
+        server = make_server(args.serve, answer, args.workers, cache_stats,
+                             lambda delta: apply_delta(delta).to_dict(),
+                             name_candidates)
+        print(f"Serving on {args.serve}", file=log)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    name = input("Name: ")
+    source = person_id_for_name(name)
     if source is None:
-        sys.exit("Person not found.")
-    target = person_id_for_name(input("Name: "))
+        not_found(name)
+    name = input("Name: ")
+    target = person_id_for_name(name)
     if target is None:
-        sys.exit("Person not found.")
-    path = shortest_path(source, target)
+        not_found(name)
+    path = find_path(source, target, search=search)
 
     if path is None:
         print("Not connected.")
@@ -83,6 +393,34 @@ def main():
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
+def not_found(name):
+    """
+    Exits after suggesting people with names like `name`, if there is
+    a name index to find them in.
+    """
+    suggestions = name_candidates(split_birth(name)[0], limit=5)
+    if suggestions:
+        print("Did you mean:")
+        for suggestion in suggestions:
+            print(f"ID: {suggestion['person_id']}, "
+                  f"Name: {suggestion['name']}, "
+                  f"Birth: {suggestion['birth']}")
+    sys.exit("Person not found.")
+
+
+def find_path(source, target, search=None):
+    """
+    Returns `search(source, target)`, by default `shortest_path`, reusing
+    the result of an earlier query for the same pair of people while it
+    is still cached.
+    """
+    path = path_cache.get((source, target), MISSING)
+    if path is MISSING:
+        path = (search or shortest_path)(source, target)
+        path_cache.put((source, target), path)
+    return path
+
+
 def shortest_path(source, target):
     """
     Returns the shortest list of (movie_id, person_id) pairs
@@ -90,6 +428,11 @@ def shortest_path(source, target):
 
     If no possible path, returns None.
     """
+    if oracle is not None:
+        return oracle.shortest_path(source, target)
+    if graph is not None:
+        return graph.shortest_path(source, target)
+
     nsource = Node(source, None, None)
     # action is the movie
     frontier = QueueFrontier()
@@ -99,8 +442,7 @@ def shortest_path(source, target):
     while True:
 
         # If nothing left in frontier, then no path
-        if len(frontier.frontier) == 0:
-            print("frontier is empty")
+        if frontier.empty():
             return None
 
         node = frontier.remove()
@@ -117,20 +459,177 @@ def shortest_path(source, target):
         # If goal is not reached
         neighbors = neighbors_for_person(node.state)
         for neighbor in neighbors:
-            if neighbor[1] not in explored:
+            if (neighbor[1] not in explored
+                    and not frontier.contains_state(neighbor[1])):
                 child = Node(state=neighbor[1], parent=node, action=neighbor[0])
                 frontier.add(child)
 
 
-def person_id_for_name(name):
+def separation_bounds(source, target):
+    """
+    Returns (lower, upper) bounds on the degrees of separation between
+    two people from the landmark distance tables, without searching.
+    Both bounds are None if the people are known not to be connected,
+    and upper is None if no landmark reaches them.
+    """
+    if oracle is None:
+        raise ValueError("no landmarks loaded")
+    return oracle.bounds(source, target)
+
+
+def shortest_path_bidirectional(source, target):
+    """
+    Returns the shortest list of (movie_id, person_id) pairs
+    that connect the source to the target, searching outwards from
+    both people and always expanding the smaller of the two frontiers.
+
+    If no possible path, returns None.
+    """
+    if source == target:
+        return []
+
+    # Maps each reached person to the (movie_id, person_id) step
+    # that leads back towards the source or onwards to the target
+    forward = {source: None}
+    backward = {target: None}
+    forward_frontier = [source]
+    backward_frontier = [target]
+
+    while forward_frontier and backward_frontier:
+
+        # Expand one whole level of the smaller side
+        if len(forward_frontier) <= len(backward_frontier):
+            frontier, reached, other = forward_frontier, forward, backward
+        else:
+            frontier, reached, other = backward_frontier, backward, forward
+
+        next_frontier = []
+        for person_id in frontier:
+            for movie_id, neighbor in neighbors_for_person(person_id):
+                if neighbor in reached:
+                    continue
+                reached[neighbor] = (movie_id, person_id)
+
+                # The first meeting point found is on a shortest path,
+                # since every meeting within a level has the same length
+                if neighbor in other:
+                    return join_paths(forward, backward, neighbor)
+                next_frontier.append(neighbor)
+
+        if reached is forward:
+            forward_frontier = next_frontier
+        else:
+            backward_frontier = next_frontier
+
+    return None
+
+
+def join_paths(forward, backward, meeting):
+    """
+    Builds the (movie_id, person_id) path through `meeting` from the
+    parent links of a bidirectional search.
+    """
+    path = []
+    person_id = meeting
+    while forward[person_id] is not None:
+        movie_id, parent = forward[person_id]
+        path.append((movie_id, person_id))
+        person_id = parent
+    path.reverse()
+
+    person_id = meeting
+    while backward[person_id] is not None:
+        movie_id, child = backward[person_id]
+        path.append((movie_id, child))
+        person_id = child
+    return path
+
+
+def answer_query(source_name, target_name, search=shortest_path):
+    """
+    Returns a JSON-serializable dictionary answering a query between two
+    names, without prompting for anything.
+
+    Names may end with a birth year, as in "Name (1958)". Names that
+    match no one born in that year, or more than one person, are
+    reported in an "error" field along with any candidate people, or
+    suggested people with similar names if the name index is loaded,
+    which also resolves ambiguous names. Safe to call from several
+    threads, including while apply_delta runs.
+    """
+    with data_lock.read():
+        answer = {"source": source_name, "target": target_name}
+        person_ids = []
+        for name in [source_name, target_name]:
+            person_id = person_id_for_name(name, interactive=False)
+            if person_id is None:
+                base, birth = split_birth(name)
+                candidates = sorted(
+                    candidate
+                    for candidate in names.get(base.lower(), set())
+                    if birth is None or people[candidate]["birth"] == birth
+                )
+                if candidates:
+                    answer["error"] = f"Ambiguous name: {name}"
+                    answer["candidates"] = [
+                        {"id": candidate, "birth": people[candidate]["birth"]}
+                        for candidate in candidates
+                    ]
+                else:
+                    answer["error"] = f"Person not found: {name}"
+                    suggestions = name_candidates(base, 5)
+                    if suggestions:
+                        answer["suggestions"] = suggestions
+                return answer
+            person_ids.append(person_id)
+
+        if oracle is not None:
+            answer["bounds"] = list(separation_bounds(*person_ids))
+
+        path = find_path(*person_ids, search=search)
+        if path is None:
+            answer["degrees"] = None
+            answer["path"] = None
+        else:
+            answer["degrees"] = len(path)
+            answer["path"] = [
+                {
+                    "movie_id": movie_id,
+                    "movie": movies[movie_id]["title"],
+                    "person_id": person_id,
+                    "person": people[person_id]["name"]
+                }
+                for movie_id, person_id in path
+            ]
+        return answer
+
+
+def person_id_for_name(name, interactive=True):
     """
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
+
+    A birth year in parentheses after the name narrows down the people
+    it could refer to. If `interactive` is False, ambiguous names are
+    resolved by the name index, if loaded, and otherwise return None
+    instead of asking which person was intended.
     """
+    name, birth = split_birth(name)
     person_ids = list(names.get(name.lower(), set()))
+    if birth is not None:
+        person_ids = [
+            person_id for person_id in person_ids
+            if people[person_id]["birth"] == birth
+        ]
     if len(person_ids) == 0:
+        if name_index is not None:
+            return name_index.resolve(name, birth)
         return None
     elif len(person_ids) > 1:
+        if not interactive:
+            if name_index is not None:
+                return name_index.resolve(name, birth)
+            return None
         print(f"Which '{name}'?")
         for person_id in person_ids:
             person = people[person_id]
@@ -153,11 +652,19 @@ def neighbors_for_person(person_id):
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
-    movie_ids = people[person_id]["movies"]
-    neighbors = set()
-    for movie_id in movie_ids:
-        for person_id in movies[movie_id]["stars"]:
-            neighbors.add((movie_id, person_id))
+    neighbors = neighbor_cache.get(person_id)
+    if neighbors is not None:
+        return neighbors
+
+    if graph is not None:
+        neighbors = frozenset(graph.neighbors_for_person(person_id))
+    else:
+        neighbors = set()
+        for movie_id in people[person_id]["movies"]:
+            for costar in movies[movie_id]["stars"]:
+                neighbors.add((movie_id, costar))
+        neighbors = frozenset(neighbors)
+    neighbor_cache.put(person_id, neighbors)
     return neighbors
 
 
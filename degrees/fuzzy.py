@@ -0,0 +1,302 @@
+import array
+import bisect
+import json
+import os
+import re
+import struct
+import unicodedata
+from collections import Counter, namedtuple
+
+from graph import snapshot_key
+
+# Saved name index, written next to the CSV files
+NAME_INDEX = "degrees.names"
+NAME_INDEX_MAGIC = b"NAMEINDX"
+NAME_INDEX_VERSION = 1
+
+# Lowest similarity for a fuzzy match to be returned
+MIN_SCORE = 0.3
+
+Candidate = namedtuple("Candidate", ["person_id", "name", "birth", "score"])
+
+
+class FuzzyNameIndex():
+    """
+    Index over everyone's names for ranked, non-interactive lookups.
+
+    Names are normalized (lowercase, no accents or punctuation) and
+    indexed both in sorted order, for prefix matches, and by the
+    trigrams they contain, for approximate matches.
+    """
+
+    def __init__(self):
+        self.person_ids = []
+        self.names = []
+        self.births = []
+        self.popularity = array.array("i")
+        self.normalized = []
+        self.trigrams = {}
+
+        # Position of each person_id in the lists above
+        self.positions = {}
+
+        # Positions of the people sorted by normalized name
+        self.order = array.array("i")
+
+    def add(self, person_id, name, birth, popularity):
+        """
+        Adds a person, with `popularity` their number of movies,
+        or updates the popularity of a person already indexed.
+        """
+        if person_id in self.positions:
+            self.popularity[self.positions[person_id]] = popularity
+            return
+        i = self.append(person_id, name, birth, popularity)
+        position = bisect.bisect(
+            self.order, self.normalized[i], key=self.normalized.__getitem__
+        )
+        self.order.insert(position, i)
+
+    def append(self, person_id, name, birth, popularity):
+        """
+        Adds a person without placing them in the sorted order,
+        and returns their position.
+        """
+        i = len(self.person_ids)
+        normalized = normalize(name)
+        self.person_ids.append(person_id)
+        self.names.append(name)
+        self.births.append(birth)
+        self.popularity.append(popularity)
+        self.normalized.append(normalized)
+        self.positions[person_id] = i
+        for trigram in set(trigrams(normalized)):
+            postings = self.trigrams.get(trigram)
+            if postings is None:
+                postings = self.trigrams[trigram] = array.array("i")
+            postings.append(i)
+        return i
+
+    def sort(self):
+        """
+        Rebuilds the sorted order after people were appended.
+        """
+        self.order = array.array("i", sorted(
+            range(len(self.person_ids)), key=self.normalized.__getitem__
+        ))
+
+    def search(self, query, limit=10):
+        """
+        Returns up to `limit` Candidates for `query`, best first: exact
+        matches, then names starting with the query, then names sharing
+        the most trigrams with it, with ties going to the more popular.
+        """
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        scores = {}
+
+        # Names starting with the query, including exact matches
+        key = self.normalized.__getitem__
+        start = bisect.bisect_left(self.order, normalized, key=key)
+        for position in range(start, len(self.order)):
+            i = self.order[position]
+            if not self.normalized[i].startswith(normalized):
+                break
+            scores[i] = 2.0 if self.normalized[i] == normalized else 1.0 + (
+                len(normalized) / len(self.normalized[i])
+            )
+            if len(scores) >= limit * 10:
+                break
+
+        # Names sharing trigrams, scored by Jaccard similarity, can only
+        # rank below the prefix matches
+        if len(scores) < limit:
+            self.add_similar(normalized, scores, limit)
+
+        ranked = sorted(
+            scores, key=lambda i: (-scores[i], -self.popularity[i])
+        )[:limit]
+        return [
+            Candidate(self.person_ids[i], self.names[i], self.births[i],
+                      round(scores[i], 3))
+            for i in ranked
+        ]
+
+    def add_similar(self, normalized, scores, limit):
+        """
+        Scores the names whose trigram sets have a Jaccard similarity of
+        at least MIN_SCORE with the query's, skipping names already scored.
+
+        Only the names sharing the most trigrams with the query are scored,
+        since counting shared trigrams is done in C by Counter while each
+        score takes a set intersection in Python.
+        """
+        query_trigrams = set(trigrams(normalized))
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(self.trigrams.get(trigram, ()))
+        for i, count in shared.most_common(limit * 10):
+            if i in scores:
+                continue
+            name_trigrams = len(set(trigrams(self.normalized[i])))
+            score = count / (len(query_trigrams) + name_trigrams - count)
+            if score >= MIN_SCORE:
+                scores[i] = score
+
+    def resolve(self, name, birth=None):
+        """
+        Returns the person_id that `name` most likely refers to, without
+        asking: among exact matches, those born in `birth` if given, then
+        the one in the most movies. Returns None if nobody matches.
+        """
+        normalized = normalize(name)
+        key = self.normalized.__getitem__
+        start = bisect.bisect_left(self.order, normalized, key=key)
+        matches = []
+        for position in range(start, len(self.order)):
+            i = self.order[position]
+            if self.normalized[i] != normalized:
+                break
+            matches.append(i)
+        if birth is not None:
+            matches = [i for i in matches if self.births[i] == str(birth)]
+        if not matches:
+            return None
+        return self.person_ids[max(matches, key=self.popularity.__getitem__)]
+
+
+def normalize(name):
+    """
+    Returns `name` in lowercase, without accents or punctuation and with
+    single spaces between words.
+    """
+    if not name.isascii():
+        name = unicodedata.normalize("NFKD", name)
+        name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", name.lower()).split())
+
+
+def trigrams(normalized):
+    """
+    Returns the trigrams of a normalized name, padded with spaces
+    so that the start and end of the name count too.
+    """
+    padded = f"  {normalized} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def split_birth(name):
+    """
+    Splits a name written as "Name (YYYY)" into the name and birth year.
+    Other names are returned with a birth year of None.
+    """
+    match = re.fullmatch(r"\s*(.*?)\s*\((\d{4})\)\s*", name)
+    if match:
+        return match.group(1), match.group(2)
+    return name, None
+
+
+def build_index(entries):
+    """
+    Returns a FuzzyNameIndex of the (person_id, name, birth, popularity)
+    tuples in `entries`.
+    """
+    index = FuzzyNameIndex()
+    for entry in entries:
+        index.append(*entry)
+    index.sort()
+    return index
+
+
+def load_index(directory, entries):
+    """
+    Returns the FuzzyNameIndex saved for the data in `directory`, or builds
+    one from `entries()` and saves it if there is none for the current CSV
+    files.
+    """
+    path = os.path.join(directory, NAME_INDEX)
+    key = snapshot_key(directory)
+    index = read_index(path, key)
+    if index is None:
+        index = build_index(entries())
+        try:
+            write_index(index, path, key)
+        except OSError:
+            pass
+    return index
+
+
+def write_index(index, path, key):
+    """
+    Write `index` to `path`: a JSON header holding the people and the
+    trigram list, followed by the popularity, sorted order, posting list
+    offsets and posting list arrays.
+    """
+    postings = array.array("i")
+    offsets = array.array("i", [0])
+    for postings_list in index.trigrams.values():
+        postings.extend(postings_list)
+        offsets.append(len(postings))
+    header = json.dumps({
+        "version": NAME_INDEX_VERSION,
+        "key": key,
+        "person_ids": index.person_ids,
+        "names": index.names,
+        "births": index.births,
+        "normalized": index.normalized,
+        "trigrams": list(index.trigrams),
+        "lengths": [len(postings), len(offsets)]
+    }).encode("utf-8")
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(NAME_INDEX_MAGIC + struct.pack("<I", len(header)) + header)
+        for values in [index.popularity, index.order, offsets, postings]:
+            values.tofile(f)
+    os.replace(temporary, path)
+
+
+def read_index(path, key):
+    """
+    Read a FuzzyNameIndex from `path`, or return None if it is missing
+    or was built for different CSV files.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        if f.read(len(NAME_INDEX_MAGIC)) != NAME_INDEX_MAGIC:
+            return None
+        length, = struct.unpack("<I", f.read(4))
+        try:
+            header = json.loads(f.read(length))
+        except ValueError:
+            return None
+        if (header.get("version") != NAME_INDEX_VERSION
+                or header.get("key") != key):
+            return None
+
+        people = len(header["person_ids"])
+        postings_length, offsets_length = header["lengths"]
+        index = FuzzyNameIndex()
+        try:
+            index.popularity.fromfile(f, people)
+            index.order.fromfile(f, people)
+            offsets = array.array("i")
+            offsets.fromfile(f, offsets_length)
+            postings = array.array("i")
+            postings.fromfile(f, postings_length)
+        except EOFError:
+            return None
+
+    index.person_ids = header["person_ids"]
+    index.names = header["names"]
+    index.births = header["births"]
+    index.normalized = header["normalized"]
+    index.positions = {
+        person_id: i for i, person_id in enumerate(index.person_ids)
+    }
+    for i, trigram in enumerate(header["trigrams"]):
+        index.trigrams[trigram] = postings[offsets[i]:offsets[i + 1]]
+    return index
@@ -0,0 +1,689 @@
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping, Sequence
+
+from ingest import IngestReport, read_chunks
+
+# Binary snapshot of a parsed dataset, written next to its CSV files
+SNAPSHOT = "degrees.snapshot"
+SNAPSHOT_MAGIC = b"DEGREES\0"
+SNAPSHOT_VERSION = 2
+
+
+class CompactGraph():
+    """
+    People and movies interned to dense integer indices, with the
+    person <-> movie graph stored as two CSR (compressed sparse row)
+    adjacency arrays.
+
+    The movies of person `p` are
+    `person_movies[person_offsets[p]:person_offsets[p + 1]]`,
+    and the stars of movie `m` are
+    `movie_people[movie_offsets[m]:movie_offsets[m + 1]]`.
+    """
+
+    def __init__(self, person_ids, person_names, person_births,
+                 movie_ids, movie_titles, movie_years,
+                 person_offsets, person_movies, movie_offsets, movie_people,
+                 person_index=None, movie_index=None, names=None,
+                 report=None):
+        self.person_ids = person_ids
+        self.person_names = person_names
+        self.person_births = person_births
+        self.movie_ids = movie_ids
+        self.movie_titles = movie_titles
+        self.movie_years = movie_years
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+        self.movie_offsets = movie_offsets
+        self.movie_people = movie_people
+
+        # Map IDs to indices, and lowercase names to a set of person_ids
+        if person_index is None:
+            person_index = {
+                person_id: i for i, person_id in enumerate(person_ids)
+            }
+        if movie_index is None:
+            movie_index = {
+                movie_id: i for i, movie_id in enumerate(movie_ids)
+            }
+        if names is None:
+            names = {}
+            for person_id, name in zip(person_ids, person_names):
+                names.setdefault(name.lower(), set()).add(person_id)
+        self.person_index = person_index
+        self.movie_index = movie_index
+        self.names = names
+
+        # Rows rejected while parsing the CSV files
+        self.report = report or IngestReport()
+
+        # Credits added by apply_delta, which are kept beside the CSR
+        # arrays rather than rebuilding them
+        self.extra_movies = {}
+        self.extra_people = {}
+
+        # Read-only views with the same shape as the degrees dicts
+        self.people = PeopleView(self)
+        self.movies = MoviesView(self)
+
+    def movies_of(self, person):
+        """
+        Returns the movie indices of the person with index `person`.
+        """
+        offsets = self.person_offsets
+        movies = self.person_movies[offsets[person]:offsets[person + 1]]
+        extra = self.extra_movies.get(person)
+        return movies if extra is None else list(movies) + extra
+
+    def stars_of(self, movie):
+        """
+        Returns the person indices of the movie with index `movie`.
+        """
+        offsets = self.movie_offsets
+        people = self.movie_people[offsets[movie]:offsets[movie + 1]]
+        extra = self.extra_people.get(movie)
+        return people if extra is None else list(people) + extra
+
+    def neighbors(self, person):
+        """
+        Returns (movie, person) index pairs for people who starred
+        with the person with index `person`.
+        """
+        return {
+            (movie, costar)
+            for movie in self.movies_of(person)
+            for costar in self.stars_of(movie)
+        }
+
+    def neighbors_for_person(self, person_id):
+        """
+        Returns (movie_id, person_id) pairs for people
+        who starred with a given person.
+        """
+        movie_ids = self.movie_ids
+        person_ids = self.person_ids
+        return {
+            (movie_ids[movie], person_ids[costar])
+            for movie, costar in self.neighbors(self.person_index[person_id])
+        }
+
+    def shortest_path(self, source, target):
+        """
+        Returns the shortest list of (movie_id, person_id) pairs
+        that connect the source to the target, running a breadth-first
+        search directly over the CSR arrays.
+
+        If no possible path, returns None.
+        """
+        source = self.person_index[source]
+        target = self.person_index[target]
+        if source == target:
+            return []
+
+        movies_of = self.movies_of
+        stars_of = self.stars_of
+
+        # Parent person and connecting movie of every reached person,
+        # and whether each movie has already been expanded
+        parent = array.array("i", [-1]) * len(self.person_ids)
+        via = array.array("i", [-1]) * len(self.person_ids)
+        seen_movie = bytearray(len(self.movie_ids))
+        parent[source] = source
+
+        frontier = [source]
+        while frontier:
+            next_frontier = []
+            for person in frontier:
+                for movie in movies_of(person):
+                    if seen_movie[movie]:
+                        continue
+                    seen_movie[movie] = 1
+                    for costar in stars_of(movie):
+                        if parent[costar] != -1:
+                            continue
+                        parent[costar] = person
+                        via[costar] = movie
+                        if costar == target:
+                            return self.trace_path(parent, via, target)
+                        next_frontier.append(costar)
+            frontier = next_frontier
+
+        return None
+
+    def thaw(self):
+        """
+        Copies any tables memory-mapped from a snapshot into Python
+        containers, so that people and movies can be appended.
+        """
+        if isinstance(self.person_ids, list):
+            return
+        self.person_ids = list(self.person_ids)
+        self.person_names = list(self.person_names)
+        self.person_births = array.array("H", self.person_births)
+        self.movie_ids = list(self.movie_ids)
+        self.movie_titles = list(self.movie_titles)
+        self.movie_years = array.array("H", self.movie_years)
+        self.person_offsets = array.array("i", self.person_offsets)
+        self.movie_offsets = array.array("i", self.movie_offsets)
+        self.person_index = {
+            person_id: i for i, person_id in enumerate(self.person_ids)
+        }
+        self.movie_index = {
+            movie_id: i for i, movie_id in enumerate(self.movie_ids)
+        }
+        self.names = {}
+        for person_id, name in zip(self.person_ids, self.person_names):
+            self.names.setdefault(name.lower(), set()).add(person_id)
+
+    def add_people(self, rows, report):
+        """
+        Appends people from people.csv rows, rejecting known IDs.
+        """
+        self.thaw()
+        for row in rows:
+            if not row["id"] or row["name"] is None:
+                report.reject("people.csv", "malformed row")
+            elif row["id"] in self.person_index:
+                report.reject("people.csv", "duplicate id")
+            else:
+                self.person_index[row["id"]] = len(self.person_ids)
+                self.person_ids.append(row["id"])
+                self.person_names.append(row["name"])
+                self.person_births.append(parse_year(row["birth"] or ""))
+                self.person_offsets.append(self.person_offsets[-1])
+                self.names.setdefault(row["name"].lower(), set()).add(
+                    row["id"]
+                )
+                report.accept("people.csv")
+
+    def add_movies(self, rows, report):
+        """
+        Appends movies from movies.csv rows, rejecting known IDs.
+        """
+        self.thaw()
+        for row in rows:
+            if not row["id"] or row["title"] is None:
+                report.reject("movies.csv", "malformed row")
+            elif row["id"] in self.movie_index:
+                report.reject("movies.csv", "duplicate id")
+            else:
+                self.movie_index[row["id"]] = len(self.movie_ids)
+                self.movie_ids.append(row["id"])
+                self.movie_titles.append(row["title"])
+                self.movie_years.append(parse_year(row["year"] or ""))
+                self.movie_offsets.append(self.movie_offsets[-1])
+                report.accept("movies.csv")
+
+    def add_stars(self, rows, report):
+        """
+        Adds credits from stars.csv rows, rejecting unknown people and
+        movies and credits already present.
+
+        Returns the person_ids whose co-stars have changed.
+        """
+        changed = set()
+        for row in rows:
+            person = self.person_index.get(row["person_id"])
+            movie = self.movie_index.get(row["movie_id"])
+            if person is None:
+                report.reject("stars.csv", "unknown person")
+            elif movie is None:
+                report.reject("stars.csv", "unknown movie")
+            elif movie in self.movies_of(person):
+                report.reject("stars.csv", "duplicate credit")
+            else:
+                self.extra_movies.setdefault(person, []).append(movie)
+                self.extra_people.setdefault(movie, []).append(person)
+                changed.update(
+                    self.person_ids[costar] for costar in self.stars_of(movie)
+                )
+                report.accept("stars.csv")
+        return changed
+
+    def trace_path(self, parent, via, person):
+        """
+        Follows `parent` links back from `person` to the root of a
+        search and returns the (movie_id, person_id) path to `person`.
+        """
+        path = []
+        while parent[person] != person:
+            path.append((self.movie_ids[via[person]], self.person_ids[person]))
+            person = parent[person]
+        path.reverse()
+        return path
+
+
+class PeopleView(Mapping):
+    """
+    Maps person_ids to a dictionary of: name, birth, movies
+    (a set of movie_ids), built on demand from a CompactGraph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, person_id):
+        graph = self.graph
+        person = graph.person_index[person_id]
+        birth = graph.person_births[person]
+        return {
+            "name": graph.person_names[person],
+            "birth": str(birth) if birth else "",
+            "movies": {graph.movie_ids[m] for m in graph.movies_of(person)}
+        }
+
+    def __iter__(self):
+        return iter(self.graph.person_ids)
+
+    def __len__(self):
+        return len(self.graph.person_ids)
+
+    def __contains__(self, person_id):
+        return person_id in self.graph.person_index
+
+
+class MoviesView(Mapping):
+    """
+    Maps movie_ids to a dictionary of: title, year, stars
+    (a set of person_ids), built on demand from a CompactGraph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, movie_id):
+        graph = self.graph
+        movie = graph.movie_index[movie_id]
+        year = graph.movie_years[movie]
+        return {
+            "title": graph.movie_titles[movie],
+            "year": str(year) if year else "",
+            "stars": {graph.person_ids[p] for p in graph.stars_of(movie)}
+        }
+
+    def __iter__(self):
+        return iter(self.graph.movie_ids)
+
+    def __len__(self):
+        return len(self.graph.movie_ids)
+
+    def __contains__(self, movie_id):
+        return movie_id in self.graph.movie_index
+
+
+class StringTable(Sequence):
+    """
+    Sequence of strings stored as one UTF-8 blob and an offsets array,
+    decoded on access.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+class SortedIndex(Mapping):
+    """
+    Maps strings to their position in `strings`, by binary search over
+    `order`, a permutation of the positions sorted by string.
+    """
+
+    def __init__(self, strings, order):
+        self.strings = strings
+        self.order = order
+
+    def __getitem__(self, key):
+        order = self.order
+        i = bisect.bisect_left(order, key, key=self.strings.__getitem__)
+        if i == len(order) or self.strings[order[i]] != key:
+            raise KeyError(key)
+        return order[i]
+
+    def __iter__(self):
+        return (self.strings[i] for i in self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+
+class NameIndex(Mapping):
+    """
+    Maps lowercase names to a set of corresponding person_ids, by binary
+    search over `order`, the person indices sorted by lowercase name.
+    """
+
+    def __init__(self, person_names, person_ids, order):
+        self.person_names = person_names
+        self.person_ids = person_ids
+        self.order = order
+
+    def lowercase_name(self, person):
+        return self.person_names[person].lower()
+
+    def __getitem__(self, name):
+        order = self.order
+        i = bisect.bisect_left(order, name, key=self.lowercase_name)
+        person_ids = set()
+        while i < len(order) and self.lowercase_name(order[i]) == name:
+            person_ids.add(self.person_ids[order[i]])
+            i += 1
+        if not person_ids:
+            raise KeyError(name)
+        return person_ids
+
+    def __iter__(self):
+        previous = None
+        for person in self.order:
+            name = self.lowercase_name(person)
+            if name != previous:
+                yield name
+                previous = name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def load_graph(directory, cache=True):
+    """
+    Load data into a CompactGraph.
+
+    With `cache`, the graph is memory-mapped from a snapshot next to the
+    CSV files when one exists for their current sizes and modification
+    times. Otherwise the CSV files are parsed and a new snapshot written.
+    """
+    if not cache:
+        return parse_graph(directory)
+
+    path = os.path.join(directory, SNAPSHOT)
+    key = snapshot_key(directory)
+    graph = read_snapshot(path, key)
+    if graph is None:
+        graph = parse_graph(directory)
+        try:
+            write_snapshot(graph, path, key)
+        except OSError:
+            pass
+    return graph
+
+
+def parse_graph(directory):
+    """
+    Load data from CSV files into a CompactGraph, streaming each file
+    in chunks and reporting the rows that are rejected.
+    """
+    report = IngestReport()
+
+    # Load people
+    person_ids, person_names, person_births = [], [], array.array("H")
+    person_index = {}
+    path = os.path.join(directory, "people.csv")
+    for chunk in read_chunks(path, "people.csv"):
+        for row in chunk:
+            if not row["id"] or row["name"] is None:
+                report.reject("people.csv", "malformed row")
+            elif row["id"] in person_index:
+                report.reject("people.csv", "duplicate id")
+            else:
+                person_index[row["id"]] = len(person_ids)
+                person_ids.append(row["id"])
+                person_names.append(row["name"])
+                person_births.append(parse_year(row["birth"] or ""))
+                report.accept("people.csv")
+
+    # Load movies
+    movie_ids, movie_titles, movie_years = [], [], array.array("H")
+    movie_index = {}
+    path = os.path.join(directory, "movies.csv")
+    for chunk in read_chunks(path, "movies.csv"):
+        for row in chunk:
+            if not row["id"] or row["title"] is None:
+                report.reject("movies.csv", "malformed row")
+            elif row["id"] in movie_index:
+                report.reject("movies.csv", "duplicate id")
+            else:
+                movie_index[row["id"]] = len(movie_ids)
+                movie_ids.append(row["id"])
+                movie_titles.append(row["title"])
+                movie_years.append(parse_year(row["year"] or ""))
+                report.accept("movies.csv")
+
+    # Load stars as parallel arrays of person and movie indices
+    edge_people, edge_movies = array.array("i"), array.array("i")
+    path = os.path.join(directory, "stars.csv")
+    for chunk in read_chunks(path, "stars.csv"):
+        for row in chunk:
+            person = person_index.get(row["person_id"])
+            movie = movie_index.get(row["movie_id"])
+            if person is None:
+                report.reject("stars.csv", "unknown person")
+            elif movie is None:
+                report.reject("stars.csv", "unknown movie")
+            else:
+                edge_people.append(person)
+                edge_movies.append(movie)
+
+    person_offsets, person_movies = build_csr(
+        len(person_ids), edge_people, edge_movies
+    )
+    movie_offsets, movie_people = transpose_csr(
+        len(movie_ids), person_offsets, person_movies
+    )
+    report.accept("stars.csv", len(person_movies))
+    report.reject(
+        "stars.csv", "duplicate credit", len(edge_people) - len(person_movies)
+    )
+    return CompactGraph(
+        person_ids, person_names, person_births,
+        movie_ids, movie_titles, movie_years,
+        person_offsets, person_movies, movie_offsets, movie_people,
+        person_index=person_index, movie_index=movie_index, report=report
+    )
+
+
+def snapshot_key(directory):
+    """
+    Returns the size and modification time of each CSV file, which
+    identify the version of the data a snapshot was built from.
+    """
+    key = []
+    for filename in ["people.csv", "movies.csv", "stars.csv"]:
+        stat = os.stat(os.path.join(directory, filename))
+        key.append([filename, stat.st_size, stat.st_mtime_ns])
+    return key
+
+
+def write_snapshot(graph, path, key):
+    """
+    Write `graph` to a binary snapshot at `path`.
+
+    The file holds a JSON header describing each section, followed by the
+    raw, 8-byte aligned contents of the graph's arrays and string tables.
+    """
+    person_ids = list(graph.person_ids)
+    person_names = list(graph.person_names)
+    movie_ids = list(graph.movie_ids)
+    sections = {
+        "person_births": graph.person_births,
+        "movie_years": graph.movie_years,
+        "person_offsets": graph.person_offsets,
+        "person_movies": graph.person_movies,
+        "movie_offsets": graph.movie_offsets,
+        "movie_people": graph.movie_people,
+        "person_id_order": array.array("i", sorted(
+            range(len(person_ids)), key=person_ids.__getitem__
+        )),
+        "movie_id_order": array.array("i", sorted(
+            range(len(movie_ids)), key=movie_ids.__getitem__
+        )),
+        "person_name_order": array.array("i", sorted(
+            range(len(person_names)),
+            key=lambda person: person_names[person].lower()
+        )),
+    }
+    for name, strings in [("person_ids", person_ids),
+                          ("person_names", person_names),
+                          ("movie_ids", movie_ids),
+                          ("movie_titles", graph.movie_titles)]:
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = array.array("q", [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        sections[f"{name}_blob"] = b"".join(encoded)
+        sections[f"{name}_offsets"] = offsets
+
+    layout = {}
+    offset = 0
+    for name, data in sections.items():
+        data = memoryview(data)
+        layout[name] = [data.format, offset, data.nbytes]
+        offset += align(data.nbytes)
+    header = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "byteorder": sys.byteorder,
+        "key": key,
+        "report": graph.report.to_dict(),
+        "sections": layout
+    }).encode("utf-8")
+
+    # Write to a temporary file first so readers never see a partial file
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(SNAPSHOT_MAGIC + struct.pack("<I", len(header)) + header)
+        f.write(bytes(align(f.tell()) - f.tell()))
+        for data in sections.values():
+            data = memoryview(data)
+            f.write(data)
+            f.write(bytes(align(data.nbytes) - data.nbytes))
+    os.replace(temporary, path)
+
+
+def read_snapshot(path, key):
+    """
+    Memory-map the snapshot at `path` as a CompactGraph.
+
+    Returns None if there is no snapshot, or if it was written by another
+    version or byte order, or for different CSV files than `key`.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            return None
+        length, = struct.unpack("<I", f.read(4))
+        try:
+            header = json.loads(f.read(length))
+        except ValueError:
+            return None
+        if (header.get("version") != SNAPSHOT_VERSION
+                or header.get("byteorder") != sys.byteorder
+                or header.get("key") != key):
+            return None
+        data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    start = align(len(SNAPSHOT_MAGIC) + 4 + length)
+    sections = {}
+    for name, (typecode, offset, size) in header["sections"].items():
+        sections[name] = data[start + offset:start + offset + size]
+        if typecode != "B":
+            sections[name] = sections[name].cast(typecode)
+
+    person_ids = StringTable(
+        sections["person_ids_blob"], sections["person_ids_offsets"]
+    )
+    person_names = StringTable(
+        sections["person_names_blob"], sections["person_names_offsets"]
+    )
+    movie_ids = StringTable(
+        sections["movie_ids_blob"], sections["movie_ids_offsets"]
+    )
+    movie_titles = StringTable(
+        sections["movie_titles_blob"], sections["movie_titles_offsets"]
+    )
+    return CompactGraph(
+        person_ids, person_names, sections["person_births"],
+        movie_ids, movie_titles, sections["movie_years"],
+        sections["person_offsets"], sections["person_movies"],
+        sections["movie_offsets"], sections["movie_people"],
+        person_index=SortedIndex(person_ids, sections["person_id_order"]),
+        movie_index=SortedIndex(movie_ids, sections["movie_id_order"]),
+        names=NameIndex(
+            person_names, person_ids, sections["person_name_order"]
+        ),
+        report=IngestReport.from_dict(header["report"])
+    )
+
+
+def align(size):
+    """
+    Rounds `size` up to a multiple of 8 bytes.
+    """
+    return (size + 7) // 8 * 8
+
+
+def build_csr(size, rows, columns):
+    """
+    Counting-sorts the (row, column) edges into CSR offset and column
+    arrays, dropping duplicate edges.
+    """
+    counts = array.array("i", [0]) * (size + 1)
+    for row in rows:
+        counts[row + 1] += 1
+    for i in range(size):
+        counts[i + 1] += counts[i]
+
+    cursor = counts[:-1]
+    values = array.array("i", [0]) * len(rows)
+    for row, column in zip(rows, columns):
+        values[cursor[row]] = column
+        cursor[row] += 1
+
+    # Remove duplicate columns within each row, compacting in place
+    offsets = array.array("i", [0]) * (size + 1)
+    end = 0
+    for row in range(size):
+        unique = sorted(set(values[counts[row]:counts[row + 1]]))
+        values[end:end + len(unique)] = array.array("i", unique)
+        end += len(unique)
+        offsets[row + 1] = end
+    del values[end:]
+    return offsets, values
+
+
+def transpose_csr(size, offsets, values):
+    """
+    Returns the CSR offset and column arrays of the transposed graph,
+    with `size` rows.
+    """
+    rows = array.array("i")
+    for row in range(len(offsets) - 1):
+        rows.extend([row] * (offsets[row + 1] - offsets[row]))
+    return build_csr(size, values, rows)
+
+
+def parse_year(value):
+    """
+    Returns a year as an int, or 0 if it is blank or not a valid year.
+    """
+    try:
+        year = int(value)
+    except ValueError:
+        return 0
+    return year if 0 < year < 65536 else 0
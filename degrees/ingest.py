@@ -0,0 +1,86 @@
+import csv
+from collections import Counter
+
+# Number of rows handed over at a time while reading a CSV file
+CHUNK_SIZE = 10000
+
+# Columns each data file must have
+FIELDS = {
+    "people.csv": ["id", "name", "birth"],
+    "movies.csv": ["id", "title", "year"],
+    "stars.csv": ["person_id", "movie_id"]
+}
+
+
+class IngestReport():
+    """
+    Counts the rows accepted from each data file, and the rows rejected
+    from each file by reason.
+    """
+
+    def __init__(self):
+        self.accepted = Counter()
+        self.rejected = {}
+
+    def accept(self, filename, count=1):
+        self.accepted[filename] += count
+
+    def reject(self, filename, reason, count=1):
+        if count:
+            self.rejected.setdefault(filename, Counter())[reason] += count
+
+    def rejected_count(self):
+        return sum(sum(reasons.values()) for reasons in self.rejected.values())
+
+    def to_dict(self):
+        return {
+            "accepted": dict(self.accepted),
+            "rejected": {
+                filename: dict(reasons)
+                for filename, reasons in self.rejected.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        report = cls()
+        report.accepted.update(data["accepted"])
+        for filename, reasons in data["rejected"].items():
+            report.rejected[filename] = Counter(reasons)
+        return report
+
+    def __str__(self):
+        lines = []
+        for filename, reasons in self.rejected.items():
+            details = ", ".join(
+                f"{reason} ({count})"
+                for reason, count in reasons.most_common()
+            )
+            lines.append(
+                f"Rejected {sum(reasons.values())} rows from {filename}: "
+                f"{details}"
+            )
+        return "\n".join(lines)
+
+
+def read_chunks(path, filename, chunk_size=CHUNK_SIZE):
+    """
+    Yields the rows of the CSV file at `path` as lists of at most
+    `chunk_size` dictionaries, after checking that it has the columns
+    of the data file `filename`.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+        missing = set(FIELDS[filename]) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(
+                f"{path} is missing columns: {', '.join(sorted(missing))}"
+            )
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
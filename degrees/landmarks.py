@@ -0,0 +1,289 @@
+import array
+import heapq
+import json
+import operator
+import os
+import struct
+
+from graph import snapshot_key
+
+# Precomputed landmark distances, written next to the CSV files
+LANDMARKS = "degrees.landmarks"
+LANDMARKS_MAGIC = b"LANDMARK"
+LANDMARKS_VERSION = 1
+
+# Distance stored for people a landmark cannot reach
+UNREACHABLE = 255
+
+
+class LandmarkOracle():
+    """
+    Distance oracle over a CompactGraph, holding the breadth-first
+    distance from each landmark person to every person.
+
+    `table` stores one row of landmark distances per person, so the
+    distances of person `p` are `table[p * k:(p + 1) * k]`.
+
+    By the triangle inequality, for any landmark L,
+    |d(L, s) - d(L, t)| <= d(s, t) <= d(L, s) + d(L, t).
+    """
+
+    def __init__(self, graph, landmarks, table):
+        self.graph = graph
+        self.landmarks = landmarks
+        self.table = table
+
+    def row(self, person):
+        """
+        Returns the landmark distances of the person with index `person`.
+        """
+        k = len(self.landmarks)
+        return self.table[person * k:(person + 1) * k]
+
+    def bounds(self, source, target):
+        """
+        Returns (lower, upper) bounds on the degrees of separation between
+        two person_ids. Both are None if the people are known not to be
+        connected, and upper is None if no landmark reaches either person.
+        """
+        source = self.graph.person_index[source]
+        target = self.graph.person_index[target]
+        if source == target:
+            return 0, 0
+        lower, upper = 1, None
+        for s, t in zip(self.row(source), self.row(target)):
+            if s == UNREACHABLE and t == UNREACHABLE:
+                continue
+            if s == UNREACHABLE or t == UNREACHABLE:
+                return None, None
+            lower = max(lower, abs(s - t))
+            upper = s + t if upper is None else min(upper, s + t)
+        return lower, upper
+
+    def shortest_path(self, source, target):
+        """
+        Returns the shortest list of (movie_id, person_id) pairs
+        that connect the source to the target.
+
+        Runs a bidirectional breadth-first search over the CSR arrays that
+        skips anyone whose landmark lower bound rules them out of every
+        path within the landmark upper bound, which also answers
+        disconnected pairs without searching.
+
+        If no possible path, returns None.
+        """
+        lower, upper = self.bounds(source, target)
+        if lower is None:
+            return None
+
+        graph = self.graph
+        source = graph.person_index[source]
+        target = graph.person_index[target]
+        if source == target:
+            return []
+        if upper is None:
+            upper = UNREACHABLE
+
+        person_offsets = graph.person_offsets
+        person_movies = graph.person_movies
+        movie_offsets = graph.movie_offsets
+        movie_people = graph.movie_people
+        table = self.table
+        k = len(self.landmarks)
+
+        # Maps each reached person to the (movie, person) step that leads
+        # back towards the source or onwards to the target
+        forward = {source: None}
+        backward = {target: None}
+        sides = {
+            True: ([source], forward, set(), self.row(target), 0),
+            False: ([target], backward, set(), self.row(source), 0)
+        }
+
+        while sides[True][0] and sides[False][0]:
+
+            # Expand one whole level of the smaller side
+            side = len(sides[True][0]) <= len(sides[False][0])
+            frontier, reached, seen_movie, goal_row, depth = sides[side]
+            other = sides[not side][1]
+            depth += 1
+
+            next_frontier = []
+            for person in frontier:
+                for i in range(person_offsets[person],
+                               person_offsets[person + 1]):
+                    movie = person_movies[i]
+                    if movie in seen_movie:
+                        continue
+                    seen_movie.add(movie)
+                    for j in range(movie_offsets[movie],
+                                   movie_offsets[movie + 1]):
+                        costar = movie_people[j]
+                        if costar in reached:
+                            continue
+
+                        # A landmark that reaches only one of the two people
+                        # gives a bound past `upper`, which prunes them too
+                        h = max(map(abs, map(
+                            operator.sub, table[costar * k:(costar + 1) * k],
+                            goal_row
+                        )))
+                        if depth + h > upper:
+                            continue
+                        reached[costar] = (movie, person)
+                        if costar in other:
+                            return self.join_paths(forward, backward, costar)
+                        next_frontier.append(costar)
+
+            sides[side] = (next_frontier, reached, seen_movie, goal_row, depth)
+
+        return None
+
+    def join_paths(self, forward, backward, meeting):
+        """
+        Builds the (movie_id, person_id) path through `meeting` from the
+        parent links of a bidirectional search.
+        """
+        movie_ids = self.graph.movie_ids
+        person_ids = self.graph.person_ids
+        path = []
+        person = meeting
+        while forward[person] is not None:
+            movie, parent = forward[person]
+            path.append((movie_ids[movie], person_ids[person]))
+            person = parent
+        path.reverse()
+
+        person = meeting
+        while backward[person] is not None:
+            movie, child = backward[person]
+            path.append((movie_ids[movie], person_ids[child]))
+            person = child
+        return path
+
+
+def distances_from(graph, source):
+    """
+    Returns an array of the breadth-first distance from the person with
+    index `source` to every person, with UNREACHABLE for everyone else.
+    """
+    person_offsets = graph.person_offsets
+    person_movies = graph.person_movies
+    movie_offsets = graph.movie_offsets
+    movie_people = graph.movie_people
+
+    distance = array.array("B", [UNREACHABLE]) * len(graph.person_ids)
+    seen_movie = bytearray(len(graph.movie_ids))
+    distance[source] = 0
+    frontier = [source]
+    level = 0
+    while frontier and level < UNREACHABLE - 1:
+        level += 1
+        next_frontier = []
+        for person in frontier:
+            for i in range(person_offsets[person], person_offsets[person + 1]):
+                movie = person_movies[i]
+                if seen_movie[movie]:
+                    continue
+                seen_movie[movie] = 1
+                for j in range(movie_offsets[movie], movie_offsets[movie + 1]):
+                    costar = movie_people[j]
+                    if distance[costar] == UNREACHABLE:
+                        distance[costar] = level
+                        next_frontier.append(costar)
+        frontier = next_frontier
+    return distance
+
+
+def choose_landmarks(graph, count):
+    """
+    Returns the indices of the `count` people with the highest degree,
+    counting one per co-star credit.
+    """
+    person_offsets = graph.person_offsets
+    person_movies = graph.person_movies
+    movie_offsets = graph.movie_offsets
+
+    def degree(person):
+        return sum(
+            movie_offsets[movie + 1] - movie_offsets[movie] - 1
+            for movie in person_movies[person_offsets[person]:
+                                       person_offsets[person + 1]]
+        )
+    return heapq.nlargest(count, range(len(graph.person_ids)), key=degree)
+
+
+def build_oracle(graph, count):
+    """
+    Picks `count` landmarks and computes their distance tables.
+    """
+    landmarks = choose_landmarks(graph, count)
+    table = bytearray(len(graph.person_ids) * len(landmarks))
+    for i, landmark in enumerate(landmarks):
+        table[i::len(landmarks)] = distances_from(graph, landmark)
+    return LandmarkOracle(graph, landmarks, table)
+
+
+def load_oracle(graph, directory, count):
+    """
+    Returns a LandmarkOracle with `count` landmarks for the data in
+    `directory`, read from the saved tables when they match the current
+    CSV files and were built with as many landmarks, or computed and
+    saved otherwise.
+    """
+    path = os.path.join(directory, LANDMARKS)
+    key = snapshot_key(directory)
+    oracle = read_oracle(graph, path, key, count)
+    if oracle is None:
+        oracle = build_oracle(graph, count)
+        try:
+            write_oracle(oracle, path, key)
+        except OSError:
+            pass
+    return oracle
+
+
+def write_oracle(oracle, path, key):
+    """
+    Write the landmark distance tables of `oracle` to `path`.
+    """
+    header = json.dumps({
+        "version": LANDMARKS_VERSION,
+        "key": key,
+        "landmarks": [oracle.graph.person_ids[i] for i in oracle.landmarks],
+        "people": len(oracle.graph.person_ids)
+    }).encode("utf-8")
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(LANDMARKS_MAGIC + struct.pack("<I", len(header)) + header)
+        f.write(oracle.table)
+    os.replace(temporary, path)
+
+
+def read_oracle(graph, path, key, count):
+    """
+    Read landmark distance tables from `path`, or return None if they are
+    missing, stale, or hold a different number of landmarks.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        if f.read(len(LANDMARKS_MAGIC)) != LANDMARKS_MAGIC:
+            return None
+        length, = struct.unpack("<I", f.read(4))
+        try:
+            header = json.loads(f.read(length))
+        except ValueError:
+            return None
+        if (header.get("version") != LANDMARKS_VERSION
+                or header.get("key") != key
+                or len(header.get("landmarks", [])) != count
+                or header.get("people") != len(graph.person_ids)):
+            return None
+        table = f.read(len(graph.person_ids) * count)
+        if len(table) != len(graph.person_ids) * count:
+            return None
+    landmarks = [graph.person_index[i] for i in header["landmarks"]]
+    return LandmarkOracle(graph, landmarks, table)
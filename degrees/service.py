@@ -0,0 +1,192 @@
+import csv
+import json
+import os
+import socketserver
+import stat
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def parse_pairs(lines):
+    """
+    Yields a (source, target) pair of names for each non-blank
+    `source,target` line, or None for lines that are not a pair.
+    """
+    for row in csv.reader(lines, skipinitialspace=True):
+        if not row or not any(field.strip() for field in row):
+            continue
+        if len(row) != 2:
+            yield None
+        else:
+            yield row[0].strip(), row[1].strip()
+
+
+def run_batch(lines, out, answer, workers=4):
+    """
+    Answers every `source,target` pair in `lines` with `answer` on a pool
+    of `workers` threads, writing one JSON object per line to `out` in
+    the same order as the input.
+    """
+    def answer_pair(pair):
+        if pair is None:
+            return {"error": "expected a line of the form source,target"}
+        return answer(*pair)
+
+    # Keep a bounded number of queries in flight, so long inputs are
+    # streamed rather than read up front
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for pair in parse_pairs(lines):
+            pending.append(executor.submit(answer_pair, pair))
+            if len(pending) >= workers * 4:
+                write_line(out, pending.popleft().result())
+        while pending:
+            write_line(out, pending.popleft().result())
+
+
+def write_line(out, result):
+    out.write(json.dumps(result) + "\n")
+    out.flush()
+
+
+class PoolMixIn():
+    """
+    Mix-in for socketserver servers that handles each request on a
+    fixed-size pool of worker threads.
+    """
+    workers = 4
+
+    def process_request(self, request, client_address):
+        if not hasattr(self, "executor"):
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.executor.submit(self.process_request_thread,
+                             request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if hasattr(self, "executor"):
+            self.executor.shutdown()
+
+
+class PooledHTTPServer(PoolMixIn, HTTPServer):
+    pass
+
+
+class PooledUnixServer(PoolMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    Answers `GET /path?source=NAME&target=NAME` with a JSON object,
+    `GET /stats` with the server's statistics, if it has any, and
+    `GET /names?q=TEXT[&limit=N]` with people whose names match TEXT,
+    if it can look them up.
+    `POST /delta?directory=PATH` applies the delta files in PATH,
+    if the server supports it.
+    """
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path != "/delta" or self.server.delta is None:
+            self.send_json(404, {"error": "not found"})
+        elif "directory" not in query:
+            self.send_json(400, {"error": "directory is required"})
+        else:
+            try:
+                result = self.server.delta(query["directory"][0])
+            except (OSError, ValueError) as error:
+                self.send_json(400, {"error": str(error)})
+            else:
+                self.send_json(200, result)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/stats" and self.server.stats is not None:
+            self.send_json(200, self.server.stats())
+        elif url.path == "/names" and self.server.names is not None:
+            if "q" not in query:
+                self.send_json(400, {"error": "q is required"})
+                return
+            try:
+                limit = int(query.get("limit", ["10"])[0])
+            except ValueError:
+                self.send_json(400, {"error": "limit must be a number"})
+                return
+            self.send_json(200, self.server.names(query["q"][0], limit))
+        elif url.path != "/path":
+            self.send_json(404, {"error": "not found"})
+        elif "source" not in query or "target" not in query:
+            self.send_json(400, {"error": "source and target are required"})
+        else:
+            self.send_json(200, self.server.answer(
+                query["source"][0], query["target"][0]
+            ))
+
+    def send_json(self, status, result):
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LineHandler(socketserver.StreamRequestHandler):
+    """
+    Answers each `source,target` line sent over a stream socket
+    with one line of JSON.
+    """
+
+    def handle(self):
+        lines = (line.decode("utf-8") for line in self.rfile)
+        for pair in parse_pairs(lines):
+            if pair is None:
+                result = {"error": "expected a line of the form source,target"}
+            else:
+                result = self.server.answer(*pair)
+            self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+
+
+def make_server(address, answer, workers=4, stats=None, delta=None,
+                names=None):
+    """
+    Returns a server for `address` that answers queries with `answer`.
+    Over HTTP, it also reports `stats()`, applies `delta(directory)` and
+    looks up `names(query, limit)`, if given.
+
+    An address of the form `unix:PATH` listens on a Unix socket and speaks
+    the line protocol of LineHandler. Anything else is taken as
+    `[HOST:]PORT` and served over HTTP by QueryHandler.
+    """
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        # Replace a socket left behind by an earlier server
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+        server = PooledUnixServer(path, LineHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = PooledHTTPServer((host or "127.0.0.1", int(port)),
+                                  QueryHandler)
+    server.workers = workers
+    server.answer = answer
+    server.stats = stats
+    server.delta = delta
+    server.names = names
+    return server
@@ -1,7 +1,11 @@
+import argparse
 import csv
 import itertools
 import sys
 
+import inference
+import sampling
+import service
 
 
 PROBS = {
@@ -40,51 +44,73 @@ PROBS = {
 
 
 def main():
-
-    # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
-
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
-        person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
-            }
-        }
-        for person in people
-    }
-
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
+    parser = argparse.ArgumentParser(
+        description="Infer how likely each person is to have the gene "
+                    "and trait."
+    )
+    parser.add_argument(
+        "data",
+        help="CSV file of the family, or with --batch, a directory of CSV "
+             "files or a JSONL file of families (- for stdin)"
+    )
+    parser.add_argument(
+        "--method", choices=["eliminate", "enumerate"] + sampling.METHODS,
+        default="eliminate",
+        help="exact inference by variable elimination (the default) or by "
+             "enumerating every assignment, for small families, or "
+             "approximate inference by likelihood weighting or Gibbs "
+             "sampling"
+    )
+    parser.add_argument(
+        "--samples", type=int, default=sampling.SAMPLES,
+        help="largest number of samples to draw when sampling"
+    )
+    parser.add_argument(
+        "--standard-error", type=float, default=sampling.STANDARD_ERROR,
+        help="stop sampling once every probability has this standard error"
+    )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="solve every family in DATA exactly and write the results "
+             "as JSONL"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=service.CACHE_SIZE,
+        help="distinct family structures whose results --batch reuses"
+    )
+    parser.add_argument(
+        "--workers", type=int,
+        help="processes to sample or to solve --batch families in "
+             "(default: one per CPU)"
+    )
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.batch:
+        if args.method in sampling.METHODS:
+            parser.error("--batch supports only exact methods")
+        counts = service.run_batch(
+            service.read_families(args.data), sys.stdout, PROBS, args.method,
+            args.workers, args.cache_size
         )
-        if fails_evidence:
-            continue
-
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
-
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
-
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
+        print(f"{counts['families']} families, {counts['solved']} solved, "
+              f"{counts['cached']} from cache", file=sys.stderr)
+        return
+
+    people = load_data(args.data)
+
+    intervals = None
+    if args.method == "enumerate":
+        probabilities = inference.enumerate_marginals(people, PROBS)
+    elif args.method in sampling.METHODS:
+        probabilities, intervals, samples = sampling.sample(
+            people, PROBS, args.method, args.samples, args.standard_error,
+            args.workers, args.seed
+        )
+        print(f"{samples} samples, {sampling.Z:g} standard errors "
+              f"either side:")
+    else:
+        probabilities = inference.eliminate(people, PROBS)
 
     # Print results
     for person in people:
@@ -93,7 +119,11 @@ def main():
             print(f"  {field.capitalize()}:")
             for value in probabilities[person][field]:
                 p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+                if intervals is None:
+                    print(f"    {value}: {p:.4f}")
+                else:
+                    low, high = intervals[person][field][value]
+                    print(f"    {value}: {p:.4f} [{low:.4f}, {high:.4f}]")
 
 
 def load_data(filename):
@@ -168,8 +198,6 @@ def joint_probability(people, one_gene, two_genes, have_trait):
                 person_proba *= (1 - mom_prob) * (1 - dad_prob)
 
         person_proba *= PROBS["trait"][gene_count[person]][person_trait]
-        print(person)
-        print(person_proba)
         joint_proba *= person_proba
 
 
@@ -211,7 +239,6 @@ def normalize(probabilities):
     Update `probabilities` such that each probability distribution
     is normalized (i.e., sums to 1, with relative proportions the same).
     """
-    print(probabilities)
     for person, value in probabilities.items():
         total_value = sum(value['gene'][i] for i in range(3))
         total_trait = value['trait'][True] + value['trait'][False]
@@ -0,0 +1,289 @@
+import string
+
+import numpy as np
+
+# Letters naming the axes of factors in einsum expressions
+AXES = string.ascii_letters
+
+# Assignments whose joint probabilities are computed at once
+# by enumerate_marginals
+CHUNK_SIZE = 1 << 16
+
+
+class Factor():
+    """
+    Nonnegative function of some people's gene counts, stored as an
+    array with one axis of length 3 per person in `names`.
+    """
+
+    def __init__(self, names, values):
+        self.names = tuple(names)
+        self.values = values
+
+
+def inheritance_table(probs):
+    """
+    Returns the probability of each gene count of a child given the gene
+    counts of their mother and father, indexed [child, mother, father].
+    """
+    mutation = probs["mutation"]
+
+    # Probability of passing the gene on, by the parent's gene count
+    passes = np.array([mutation, 0.5, 1 - mutation])
+    m = passes[:, np.newaxis]
+    f = passes[np.newaxis, :]
+    return np.stack([
+        (1 - m) * (1 - f),
+        m * (1 - f) + (1 - m) * f,
+        m * f
+    ])
+
+
+def gene_factors(people, probs):
+    """
+    Returns one factor per person: the probability of their gene count
+    given their parents' (or unconditionally, without parents), times
+    the probability of their trait if it is known.
+    """
+    inheritance = inheritance_table(probs)
+    trait = np.array([probs["trait"][g][True] for g in range(3)])
+    factors = []
+    for person in people:
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+        if not mother or not father:
+            names = [person]
+            values = np.array([probs["gene"][g] for g in range(3)])
+        else:
+            names = [person, mother, father]
+            values = inheritance
+
+        evidence = people[person]["trait"]
+        if evidence is not None:
+            likelihood = trait if evidence else 1 - trait
+            shape = [3] + [1] * (len(names) - 1)
+            values = values * likelihood.reshape(shape)
+        factors.append(Factor(names, values))
+    return factors
+
+
+def multiply_and_sum(factors, keep):
+    """
+    Returns the product of `factors` summed over every person
+    not in `keep`, as a Factor over the people in `keep`.
+    """
+    covered = set(name for factor in factors for name in factor.names)
+    factors = list(factors) + [
+        Factor([name], np.ones(3)) for name in sorted(set(keep) - covered)
+    ]
+    names = sorted(covered | set(keep))
+    axes = {name: AXES[i] for i, name in enumerate(names)}
+    keep = [name for name in names if name in keep]
+    if not factors:
+        return Factor([], np.array(1.0))
+    expression = ",".join(
+        "".join(axes[name] for name in factor.names) for factor in factors
+    ) + "->" + "".join(axes[name] for name in keep)
+    values = np.einsum(expression, *(factor.values for factor in factors))
+    return Factor(keep, values)
+
+
+def message(factors, keep):
+    """
+    Returns multiply_and_sum(factors, keep) scaled to a maximum of 1,
+    so that long chains of messages do not underflow.
+    """
+    factor = multiply_and_sum(factors, keep)
+    largest = factor.values.max()
+    if largest > 0:
+        factor.values = factor.values / largest
+    return factor
+
+
+def elimination_order(factors):
+    """
+    Returns an order in which to sum out everyone, greedily choosing the
+    person whose elimination joins the fewest unrelated people, and the
+    cluster of people joined when each person is summed out.
+    Pedigrees are nearly trees, so this keeps every cluster small.
+    """
+    neighbors = {}
+    for factor in factors:
+        for name in factor.names:
+            neighbors.setdefault(name, set()).update(factor.names)
+    for name in neighbors:
+        neighbors[name].discard(name)
+
+    def fill(name):
+        joined = list(neighbors[name])
+        return sum(
+            joined[j] not in neighbors[joined[i]]
+            for i in range(len(joined)) for j in range(i + 1, len(joined))
+        )
+
+    order = []
+    clusters = {}
+    while neighbors:
+        name = min(neighbors, key=lambda n: (fill(n), len(neighbors[n]), n))
+        order.append(name)
+        clusters[name] = neighbors[name] | {name}
+
+        # Summing out `name` joins all of its neighbors into one factor
+        for neighbor in neighbors[name]:
+            neighbors[neighbor].update(neighbors[name])
+            neighbors[neighbor].discard(neighbor)
+            neighbors[neighbor].discard(name)
+        del neighbors[name]
+    return order, clusters
+
+
+def gene_marginals(factors):
+    """
+    Returns the posterior distribution of everyone's gene count given the
+    trait evidence, by message passing over the junction tree built from
+    an elimination order.
+
+    The cluster of each person is linked to the cluster of whoever in it
+    is summed out next. Messages are passed up the tree in elimination
+    order and back down in reverse, after which each person's cluster has
+    received everything needed for their marginal.
+    """
+    order, clusters = elimination_order(factors)
+    position = {name: i for i, name in enumerate(order)}
+    separators = {name: clusters[name] - {name} for name in order}
+
+    # Each factor belongs to the cluster of its first person summed out
+    assigned = {name: [] for name in order}
+    for factor in factors:
+        assigned[min(factor.names, key=position.get)].append(factor)
+
+    parent = {}
+    children = {name: [] for name in order}
+    for name in order:
+        if separators[name]:
+            parent[name] = min(separators[name], key=position.get)
+            children[parent[name]].append(name)
+
+    up = {}
+    for name in order:
+        up[name] = message(
+            assigned[name] + [up[child] for child in children[name]],
+            separators[name]
+        )
+
+    down = {}
+    marginals = {}
+    for name in reversed(order):
+        incoming = list(assigned[name])
+        if name in down:
+            incoming.append(down[name])
+        for child in children[name]:
+            others = [up[c] for c in children[name] if c != child]
+            down[child] = message(incoming + others, separators[child])
+        values = multiply_and_sum(
+            incoming + [up[child] for child in children[name]], {name}
+        ).values
+        marginals[name] = values / values.sum()
+    return marginals
+
+
+def eliminate(people, probs):
+    """
+    Returns the gene and trait distributions of everyone in `people`,
+    in the same form as heredity.main prints them.
+
+    Trait distributions follow from the gene distribution, since
+    each trait depends only on its own person's gene count.
+    """
+    marginals = gene_marginals(gene_factors(people, probs))
+    trait = np.array([probs["trait"][g][True] for g in range(3)])
+    probabilities = {}
+    for person in people:
+        gene = marginals[person]
+        evidence = people[person]["trait"]
+        if evidence is None:
+            has_trait = float(gene @ trait)
+        else:
+            has_trait = 1.0 if evidence else 0.0
+        probabilities[person] = distributions(
+            gene, np.array([1 - has_trait, has_trait])
+        )
+    return probabilities
+
+
+def enumerate_marginals(people, probs, chunk_size=CHUNK_SIZE):
+    """
+    Returns the gene and trait distributions of everyone in `people` by
+    summing the joint probability of every assignment of gene counts, and
+    of traits to people whose trait is unknown.
+
+    Assignment `k` gives person `i` the gene count `k // 3**i % 3` and,
+    above `3**n`, the unknown traits the bits of `k // 3**n`. Assignments
+    are handled `chunk_size` at a time as rows of integer arrays.
+    """
+    names = list(people)
+    n = len(names)
+    index = {name: i for i, name in enumerate(names)}
+    children = np.array([
+        bool(people[name]["mother"] and people[name]["father"])
+        for name in names
+    ])
+    founders = ~children
+    mothers = np.array([index[people[name]["mother"]]
+                        for name in np.array(names)[children]], dtype=np.int64)
+    fathers = np.array([index[people[name]["father"]]
+                        for name in np.array(names)[children]], dtype=np.int64)
+    unknown = np.array(
+        [i for i, name in enumerate(names) if people[name]["trait"] is None],
+        dtype=np.int64
+    )
+    known = np.array([bool(people[name]["trait"]) for name in names], int)
+
+    prior = np.array([probs["gene"][g] for g in range(3)])
+    inheritance = inheritance_table(probs)
+    trait = np.array([
+        [probs["trait"][g][False], probs["trait"][g][True]] for g in range(3)
+    ])
+
+    gene_totals = np.zeros((n, 3))
+    trait_totals = np.zeros((n, 2))
+    people_axis = np.arange(n)[np.newaxis, :]
+    powers = 3 ** np.arange(n, dtype=np.int64)
+    bits = np.arange(len(unknown), dtype=np.int64)
+    total = 3 ** n * 2 ** len(unknown)
+    for start in range(0, total, chunk_size):
+        k = np.arange(start, min(start + chunk_size, total), dtype=np.int64)
+        genes = k[:, np.newaxis] // powers % 3
+        traits = np.tile(known, (len(k), 1))
+        traits[:, unknown] = (k[:, np.newaxis] // 3 ** n) >> bits & 1
+
+        p = prior[genes[:, founders]].prod(axis=1)
+        p *= inheritance[
+            genes[:, children],
+            genes[:, mothers],
+            genes[:, fathers]
+        ].prod(axis=1)
+        p *= trait[genes, traits].prod(axis=1)
+
+        weights = np.broadcast_to(p[:, np.newaxis], genes.shape)
+        np.add.at(gene_totals, (people_axis, genes), weights)
+        np.add.at(trait_totals, (people_axis, traits), weights)
+
+    return {
+        name: distributions(
+            gene_totals[i] / gene_totals[i].sum(),
+            trait_totals[i] / trait_totals[i].sum()
+        )
+        for i, name in enumerate(names)
+    }
+
+
+def distributions(gene, trait):
+    """
+    Returns a gene distribution indexed by count and a trait distribution
+    indexed by 0 and 1 as dictionaries in the order heredity.main prints.
+    """
+    return {
+        "gene": {g: float(gene[g]) for g in (2, 1, 0)},
+        "trait": {True: float(trait[1]), False: float(trait[0])}
+    }
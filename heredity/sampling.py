@@ -0,0 +1,339 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from inference import distributions, inheritance_table
+
+# Default largest number of samples drawn
+SAMPLES = 1000000
+
+# Default standard error of every marginal at which sampling stops
+STANDARD_ERROR = 0.002
+
+# Weighted samples drawn by each task of likelihood weighting
+BATCH_SIZE = 2000
+
+# Gibbs chains run by each task, and sweeps of every person per chain
+CHAINS = 256
+SWEEPS = 200
+
+# Sweeps discarded from the start of each Gibbs chain
+BURN_IN = 50
+
+# Effective number of weighted samples needed before their standard
+# errors are trusted, since a few dominant weights make them look small
+EFFECTIVE_SAMPLES = 1000
+
+# Standard errors either side of an estimate in its confidence interval
+Z = 1.96
+
+METHODS = ["weighting", "gibbs"]
+
+
+class Pedigree():
+    """
+    A family as arrays indexed by person, ordered so that parents come
+    before their children, with the tables of the model.
+    """
+
+    def __init__(self, people, probs):
+        self.names = topological_order(people)
+        index = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+
+        self.mothers = np.full(n, -1, dtype=np.int64)
+        self.fathers = np.full(n, -1, dtype=np.int64)
+        for i, name in enumerate(self.names):
+            if people[name]["mother"] and people[name]["father"]:
+                self.mothers[i] = index[people[name]["mother"]]
+                self.fathers[i] = index[people[name]["father"]]
+
+        # Known trait of each person as 1 or 0, or -1 if unknown
+        self.evidence = np.array([
+            -1 if people[name]["trait"] is None else int(people[name]["trait"])
+            for name in self.names
+        ], dtype=np.int64)
+
+        self.prior = np.array([probs["gene"][g] for g in range(3)])
+        self.inheritance = inheritance_table(probs)
+        self.trait = np.array([
+            [probs["trait"][g][False], probs["trait"][g][True]]
+            for g in range(3)
+        ])
+
+        # Children of each person as a mother and as a father
+        self.as_mother = [np.flatnonzero(self.mothers == i) for i in range(n)]
+        self.as_father = [np.flatnonzero(self.fathers == i) for i in range(n)]
+
+    def __len__(self):
+        return len(self.names)
+
+    def likelihood(self, person):
+        """
+        Returns the probability of the person's known trait for each gene
+        count, or ones if their trait is unknown.
+        """
+        if self.evidence[person] < 0:
+            return np.ones(3)
+        return self.trait[:, self.evidence[person]]
+
+    def forward(self, rng, count):
+        """
+        Returns `count` assignments of gene counts drawn parents first,
+        as rows, and the log likelihood of the known traits under each.
+        """
+        genes = np.empty((count, len(self)), dtype=np.int64)
+        log_weights = np.zeros(count)
+        for person in range(len(self)):
+            mother = self.mothers[person]
+            if mother < 0:
+                probabilities = np.broadcast_to(self.prior, (count, 3))
+            else:
+                probabilities = self.inheritance[
+                    :, genes[:, mother], genes[:, self.fathers[person]]
+                ].T
+            genes[:, person] = draw(rng, probabilities)
+            log_weights += np.log(self.likelihood(person)[genes[:, person]])
+        return genes, log_weights
+
+    def conditional(self, genes, person):
+        """
+        Returns the distribution of the person's gene count in each row of
+        `genes` given everyone else's gene count and the known traits.
+        """
+        mother = self.mothers[person]
+        if mother < 0:
+            probabilities = np.tile(self.prior, (len(genes), 1))
+        else:
+            probabilities = self.inheritance[
+                :, genes[:, mother], genes[:, self.fathers[person]]
+            ].T.copy()
+        probabilities *= self.likelihood(person)
+        for child in self.as_mother[person]:
+            probabilities *= self.inheritance[
+                genes[:, child], :, genes[:, self.fathers[child]]
+            ]
+        for child in self.as_father[person]:
+            probabilities *= self.inheritance[
+                genes[:, child], genes[:, self.mothers[child]], :
+            ]
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def features(self, gene):
+        """
+        Returns, from distributions of everyone's gene count with shape
+        (..., people, 3), the same with the probability that each person
+        has the trait appended, so that an estimate of everything is an
+        average of features.
+        """
+        trait = gene @ self.trait[:, 1]
+        known = self.evidence >= 0
+        trait[..., known] = self.evidence[known]
+        return np.concatenate([gene, trait[..., np.newaxis]], axis=-1)
+
+
+def topological_order(people):
+    """
+    Returns the names of `people` ordered so that everyone comes after
+    their parents.
+    """
+    order = []
+    placed = set()
+    for name in people:
+        stack = [name]
+        while stack:
+            person = stack[-1]
+            if person in placed:
+                stack.pop()
+                continue
+            parents = [
+                parent for parent in (people[person]["mother"],
+                                      people[person]["father"])
+                if parent and parent not in placed
+            ]
+            if parents:
+                stack.extend(parents)
+            else:
+                placed.add(person)
+                order.append(person)
+                stack.pop()
+    return order
+
+
+def draw(rng, probabilities):
+    """
+    Returns one index drawn from each row of `probabilities`.
+    """
+    cumulative = probabilities.cumsum(axis=1)
+    u = rng.random(len(probabilities)) * cumulative[:, -1]
+    return (u[:, np.newaxis] >= cumulative[:, :-1]).sum(axis=1)
+
+
+def weighting_task(pedigree, seed, count=BATCH_SIZE):
+    """
+    Draws `count` samples by likelihood weighting and returns the log of
+    the scale of their weights, and the sums of the weights, their
+    squares and their products with the features and squared features.
+    Weights are divided by the largest one so that they cannot underflow.
+    """
+    rng = np.random.default_rng(seed)
+    genes, log_weights = pedigree.forward(rng, count)
+    shift = log_weights.max()
+    weights = np.exp(log_weights - shift)
+    squares = weights * weights
+
+    # Unknown traits are averaged given the gene rather than drawn
+    x = pedigree.features(np.eye(3)[genes])
+    return shift, (
+        weights.sum(),
+        np.einsum("s,sij->ij", weights, x),
+        squares.sum(),
+        np.einsum("s,sij->ij", squares, x),
+        np.einsum("s,sij->ij", squares, x * x)
+    )
+
+
+def gibbs_task(pedigree, seed, chains=CHAINS, sweeps=SWEEPS,
+               burn_in=BURN_IN):
+    """
+    Runs `chains` Gibbs chains for `burn_in` and then `sweeps` sweeps and
+    returns the average features of each chain.
+
+    Chains start from samples drawn by likelihood weighting, so that they
+    start where the known traits are plausible. Each sweep redraws
+    everyone's gene count given the rest, and averages the conditional
+    distribution drawn from rather than the drawn gene count.
+    """
+    rng = np.random.default_rng(seed)
+    candidates, log_weights = pedigree.forward(rng, chains * 10)
+    weights = np.exp(log_weights - log_weights.max())
+    genes = candidates[rng.choice(len(candidates), chains,
+                                  p=weights / weights.sum())]
+
+    totals = np.zeros((chains, len(pedigree), 3))
+    for sweep in range(burn_in + sweeps):
+        for person in range(len(pedigree)):
+            probabilities = pedigree.conditional(genes, person)
+            genes[:, person] = draw(rng, probabilities)
+            if sweep >= burn_in:
+                totals[:, person] += probabilities
+    return pedigree.features(totals / sweeps)
+
+
+class WeightedEstimate():
+    """
+    Self-normalized estimate of the average features from the sums
+    returned by weighting tasks, with their standard errors.
+    """
+
+    def __init__(self):
+        self.shift = -np.inf
+        self.sums = None
+        self.samples = 0
+
+    def add(self, result, count):
+        shift, sums = result
+        if self.sums is None:
+            self.shift, self.sums = shift, list(sums)
+        else:
+            # Rescale both sets of sums to the larger of their scales
+            top = max(self.shift, shift)
+            old = np.exp(self.shift - top)
+            new = np.exp(shift - top)
+            scales = [old, old, old * old, old * old, old * old]
+            news = [new, new, new * new, new * new, new * new]
+            self.sums = [
+                a * s + b * t
+                for a, b, s, t in zip(self.sums, sums, scales, news)
+            ]
+            self.shift = top
+        self.samples += count
+
+    def estimate(self):
+        weights, weighted, squares, squared, squared_squares = self.sums
+        mean = weighted / weights
+        if weights * weights / squares < EFFECTIVE_SAMPLES:
+            return mean, np.full(mean.shape, np.inf)
+        variance = (squared_squares - 2 * mean * squared
+                    + mean * mean * squares) / (weights * weights)
+        return mean, np.sqrt(np.maximum(variance, 0))
+
+
+class ChainEstimate():
+    """
+    Average of the features over Gibbs chains, with standard errors from
+    the spread between independent chains.
+    """
+
+    def __init__(self):
+        self.means = []
+        self.samples = 0
+
+    def add(self, result, count):
+        self.means.append(result)
+        self.samples += count
+
+    def estimate(self):
+        means = np.concatenate(self.means)
+        if len(means) < 2:
+            return means.mean(axis=0), np.full(means.shape[1:], np.inf)
+        error = means.std(axis=0, ddof=1) / np.sqrt(len(means))
+        return means.mean(axis=0), error
+
+
+def sample(people, probs, method="weighting", samples=SAMPLES,
+           standard_error=STANDARD_ERROR, workers=None, seed=None):
+    """
+    Returns approximate gene and trait distributions of everyone in
+    `people`, in the same form as heredity.main prints them, the
+    confidence interval of every probability in the same form, and the
+    number of samples drawn.
+
+    Tasks of `method` run in rounds across `workers` processes, each
+    drawing from its own stream spawned from `seed`, until `samples` have
+    been drawn or every standard error is within `standard_error`.
+    For Gibbs sampling, a sample is one sweep of one chain.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown method: {method}")
+    pedigree = Pedigree(people, probs)
+    workers = workers or os.cpu_count() or 1
+    if method == "weighting":
+        task, count, estimate = weighting_task, BATCH_SIZE, WeightedEstimate()
+    else:
+        task, count, estimate = gibbs_task, CHAINS * SWEEPS, ChainEstimate()
+
+    streams = np.random.SeedSequence(seed)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while estimate.samples < samples:
+            tasks = min(workers, -(-(samples - estimate.samples) // count))
+            futures = [
+                executor.submit(task, pedigree, stream)
+                for stream in streams.spawn(tasks)
+            ]
+            for future in futures:
+                estimate.add(future.result(), count)
+            mean, error = estimate.estimate()
+            if error.max() <= standard_error:
+                break
+
+    mean, error = estimate.estimate()
+    probabilities = {}
+    intervals = {}
+    for i, name in enumerate(pedigree.names):
+        trait = np.array([1 - mean[i, 3], mean[i, 3]])
+        trait_error = np.array([error[i, 3], error[i, 3]])
+        probabilities[name] = distributions(mean[i, :3], trait)
+        low = distributions(np.clip(mean[i, :3] - Z * error[i, :3], 0, 1),
+                            np.clip(trait - Z * trait_error, 0, 1))
+        high = distributions(np.clip(mean[i, :3] + Z * error[i, :3], 0, 1),
+                             np.clip(trait + Z * trait_error, 0, 1))
+        intervals[name] = {
+            field: {
+                value: (low[field][value], high[field][value])
+                for value in low[field]
+            }
+            for field in low
+        }
+    return probabilities, intervals, estimate.samples
@@ -0,0 +1,277 @@
+import csv
+import json
+import os
+import sys
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import inference
+
+# Results of distinct family structures kept for reuse
+CACHE_SIZE = 10000
+
+# Families in flight per worker process
+QUEUED_PER_WORKER = 4
+
+
+def read_families(source):
+    """
+    Yields an (id, rows) pair for each family in `source`, where rows are
+    dictionaries with name, mother, father and trait, or an exception if
+    the family could not be read.
+
+    `source` is a directory of CSV files, whose families are identified by
+    filename, or a JSONL file (or - for stdin) of objects each holding
+    "people", a list of rows, and optionally an "id".
+    """
+    if source == "-":
+        yield from read_jsonl(sys.stdin)
+    elif not os.path.isdir(source):
+        with open(source, encoding="utf-8") as f:
+            yield from read_jsonl(f)
+    else:
+        for filename in sorted(os.listdir(source)):
+            if not filename.endswith(".csv"):
+                continue
+            try:
+                with open(os.path.join(source, filename)) as f:
+                    rows = list(csv.DictReader(f))
+            except (OSError, UnicodeDecodeError) as error:
+                yield filename, error
+            else:
+                yield filename, rows
+
+
+def read_jsonl(lines):
+    """
+    Yields an (id, rows) pair for each family in JSONL `lines`, numbering
+    families without an id by line, or an exception for invalid lines.
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            family = json.loads(line)
+            family_id, rows = family.get("id", number), list(family["people"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            family_id = number
+            rows = ValueError("expected an object with a people list")
+        yield family_id, rows
+
+
+def parse_people(rows):
+    """
+    Returns the people of a family from its rows, in the form of
+    heredity.load_data. Traits may be 1 or 0 as strings, numbers or
+    booleans, and blank or missing if unknown.
+    """
+    people = {}
+    for row in rows:
+        try:
+            name = str(row["name"])
+        except (KeyError, TypeError):
+            raise ValueError("every person needs a name")
+        trait = row.get("trait")
+        if trait in ("", None):
+            trait = None
+        elif str(trait).lower() in ("1", "true"):
+            trait = True
+        elif str(trait).lower() in ("0", "false"):
+            trait = False
+        else:
+            raise ValueError(f"trait of {name} must be 1, 0 or blank")
+        people[name] = {
+            "name": name,
+            "mother": row.get("mother") or None,
+            "father": row.get("father") or None,
+            "trait": trait
+        }
+    for name in people:
+        for parent in ("mother", "father"):
+            if people[name][parent] and people[name][parent] not in people:
+                raise ValueError(
+                    f"{parent} of {name} is not in the family: "
+                    f"{people[name][parent]}"
+                )
+    return people
+
+
+def canonical_form(people):
+    """
+    Returns a structure describing the family without its names, and the
+    names in the order the structure lists them.
+
+    The structure holds each person's trait and the positions of their
+    parents. People are ordered by color refinement: everyone starts
+    colored by their trait and whether they have parents, and is
+    recolored by their own, their parents' and their children's colors
+    until the colors stop splitting, so renamed or reordered copies of a
+    family usually get the same structure. People left with the same
+    color keep their order in the file, so some copies are not
+    recognized, but different families never share a structure.
+    """
+    names = list(people)
+    index = {name: i for i, name in enumerate(names)}
+    traits = [people[name]["trait"] for name in names]
+    mothers = [None] * len(names)
+    fathers = [None] * len(names)
+    children = [[] for name in names]
+    for i, name in enumerate(names):
+        if people[name]["mother"] and people[name]["father"]:
+            mothers[i] = index[people[name]["mother"]]
+            fathers[i] = index[people[name]["father"]]
+            children[mothers[i]].append((i, 0))
+            children[fathers[i]].append((i, 1))
+
+    colors = compress([
+        (-1 if trait is None else int(trait), mothers[i] is not None)
+        for i, trait in enumerate(traits)
+    ])
+    while True:
+        refined = compress([
+            (
+                colors[i],
+                -1 if mothers[i] is None else colors[mothers[i]],
+                -1 if fathers[i] is None else colors[fathers[i]],
+                tuple(sorted((colors[c], role) for c, role in children[i]))
+            )
+            for i in range(len(names))
+        ])
+        if len(set(refined)) == len(set(colors)):
+            break
+        colors = refined
+
+    order = sorted(range(len(names)), key=lambda i: (colors[i], i))
+    position = {person: p for p, person in enumerate(order)}
+    structure = tuple(
+        (
+            traits[i],
+            None if mothers[i] is None else position[mothers[i]],
+            None if fathers[i] is None else position[fathers[i]]
+        )
+        for i in order
+    )
+    return structure, [names[i] for i in order]
+
+
+def compress(signatures):
+    """
+    Returns each signature replaced by its rank among the distinct
+    signatures, which does not depend on how people are named.
+    """
+    ranks = {
+        signature: rank
+        for rank, signature in enumerate(sorted(set(signatures)))
+    }
+    return [ranks[signature] for signature in signatures]
+
+
+def solve(structure, probs, method):
+    """
+    Returns the distributions of everyone in a family structure, in
+    the order of the structure.
+    """
+    people = {
+        str(i): {
+            "name": str(i),
+            "mother": None if mother is None else str(mother),
+            "father": None if father is None else str(father),
+            "trait": trait
+        }
+        for i, (trait, mother, father) in enumerate(structure)
+    }
+    if method == "enumerate":
+        probabilities = inference.enumerate_marginals(people, probs)
+    else:
+        probabilities = inference.eliminate(people, probs)
+    return [probabilities[str(i)] for i in range(len(structure))]
+
+
+class ResultCache():
+    """
+    Futures of the results of at most `maxsize` family structures,
+    evicting the least recently used. Sharing futures also lets families
+    submitted while an identical one is being solved wait for it.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        future = self.entries.get(key)
+        if future is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return future
+
+    def put(self, key, future):
+        self.entries[key] = future
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+def run_batch(families, out, probs, method="eliminate", workers=None,
+              cache_size=CACHE_SIZE):
+    """
+    Computes the distributions of every family from read_families on a
+    pool of `workers` processes, writing one JSON object per line to
+    `out` in the same order as the input. Each family is solved once per
+    distinct structure. Returns counts of families, of those solved and
+    of those answered from the cache.
+    """
+    workers = workers or os.cpu_count() or 1
+    cache = ResultCache(cache_size)
+    families_read = 0
+
+    # Keep a bounded number of families in flight, so long inputs are
+    # streamed rather than read up front
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for family_id, rows in families:
+            families_read += 1
+            names = None
+            try:
+                if isinstance(rows, Exception):
+                    raise rows
+                structure, names = canonical_form(parse_people(rows))
+            except (OSError, ValueError) as error:
+                future = Future()
+                future.set_exception(error)
+            else:
+                future = cache.get(structure)
+                if future is None:
+                    future = executor.submit(solve, structure, probs, method)
+                    cache.put(structure, future)
+            pending.append((family_id, names, future))
+            if len(pending) >= workers * QUEUED_PER_WORKER:
+                write_result(out, *pending.popleft())
+        while pending:
+            write_result(out, *pending.popleft())
+
+    return {
+        "families": families_read,
+        "solved": cache.misses,
+        "cached": cache.hits
+    }
+
+
+def write_result(out, family_id, names, future):
+    """
+    Writes the distributions of a family by name, or its error, as one
+    line of JSON.
+    """
+    try:
+        result = {
+            "id": family_id,
+            "probabilities": dict(zip(names, future.result()))
+        }
+    except Exception as error:
+        result = {"id": family_id, "error": str(error)}
+    out.write(json.dumps(result) + "\n")
+    out.flush()
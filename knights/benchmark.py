@@ -0,0 +1,456 @@
+import argparse
+import itertools
+import random
+import time
+import tracemalloc
+
+import logic
+import puzzle
+import sat
+from logic import And, Biconditional, Implication, Not, Or, Symbol, model_check
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare entailment by SAT solving with model checking."
+    )
+    parser.add_argument("--people", type=int, default=200,
+                        help="people in the large generated puzzle")
+    parser.add_argument("--statements", type=int,
+                        help="statements in it (default: two per person)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--check", type=int, default=20, metavar="N",
+        help="also check N small generated puzzles against model_check, "
+             "the SAT solver on N random clause sets, compiled sentences "
+             "on N random sentences and counting models on N / 5 puzzles"
+    )
+    parser.add_argument(
+        "--enumerate", type=int, metavar="PEOPLE",
+        help="compare compiled model checking with evaluating every model "
+             "recursively on a puzzle of PEOPLE people instead"
+    )
+    parser.add_argument(
+        "--count", type=int, metavar="PEOPLE",
+        help="compare counting models in one process and across --workers "
+             "processes on a puzzle of PEOPLE people instead"
+    )
+    parser.add_argument(
+        "--workers", type=int,
+        help="processes for --count and for checking counts (default: one "
+             "per CPU)"
+    )
+    parser.add_argument(
+        "--simplify", action="store_true",
+        help="measure sharing and simplification of the large puzzle instead"
+    )
+    args = parser.parse_args()
+
+    statements = args.statements or 2 * args.people
+    if args.simplify:
+        benchmark_simplify(args.people, statements, args.seed)
+        return
+    if args.enumerate:
+        benchmark_enumeration(args.enumerate, args.seed)
+        return
+    if args.count:
+        benchmark_counting(args.count, args.seed, args.workers)
+        return
+    check_solver(args.check, args.seed)
+    check_compiled(args.check, args.seed)
+    check_counting(args.check // 5, args.seed, args.workers)
+    check_puzzles(args.check, args.seed)
+
+    knowledge, symbols = random_puzzle(args.people, statements, args.seed)
+    print(f"{len(symbols)} symbols, {statements} statements")
+    start = time.perf_counter()
+    entailed = [symbol for symbol in symbols if sat.entails(knowledge, symbol)]
+    elapsed = time.perf_counter() - start
+    print(f"  entails: {elapsed:.3f}s for {len(symbols)} queries, "
+          f"{len(entailed)} symbols entailed")
+
+    start = time.perf_counter()
+    forced = sat.KnowledgeBase(knowledge).classify(symbols)
+    elapsed = time.perf_counter() - start
+    print(f"  KnowledgeBase.classify: {elapsed:.3f}s, "
+          f"{len(forced.true)} forced true, {len(forced.false)} forced "
+          f"false, {len(forced.undetermined)} undetermined")
+    if forced.true != entailed:
+        raise AssertionError("classify disagrees with entails")
+
+
+def check_compiled(count, seed):
+    """
+    Checks that `count` random sentences, compiled, are true in the same
+    models as when evaluated recursively, with some of them over enough
+    symbols to span several blocks of models.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        symbols = [Symbol(f"P{j}") for j in range(rng.randint(1, 15))]
+
+        # Mention every symbol, so that some sentences have more than
+        # 2 ** BLOCK_BITS models
+        sentence = Biconditional(random_sentence(rng, symbols, 4),
+                                 Or(*symbols))
+        names = sorted(sentence.symbols())
+        expected = set()
+        for values in itertools.product([False, True], repeat=len(names)):
+            model = dict(zip(names, values))
+            if sentence.evaluate(model):
+                expected.add(values)
+        found = {
+            tuple(model[name] for name in names)
+            for model in logic.models(sentence)
+        }
+        program = sentence.compile()
+        model = {name: rng.random() < 0.5 for name in names}
+        if (found != expected
+                or program.evaluate(model) != sentence.evaluate(model)):
+            raise AssertionError(
+                f"compiled models differ for {sentence.formula()}"
+            )
+    print(f"{count} random sentences have the same models compiled")
+
+
+def check_counting(count, seed, workers):
+    """
+    Checks count_models, in one process and across `workers`, on `count`
+    generated puzzles of enough symbols to span several blocks of models,
+    against counting the models of each by evaluating it in every model.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        knowledge, symbols = random_puzzle(7, rng.randint(3, 14),
+                                           rng.randrange(2 ** 32))
+        names = sorted(knowledge.symbols())
+        expected = 0
+        for values in itertools.product([False, True], repeat=len(names)):
+            expected += knowledge.evaluate(dict(zip(names, values)))
+
+        query = rng.choice(symbols)
+        entailed = model_check(knowledge, query)
+        for processes in (1, workers or 2):
+            results = [
+                (logic.count_models(knowledge, None, processes),
+                 (None, expected, True)),
+                (logic.count_models(knowledge, query, processes, False),
+                 (entailed, expected, True))
+            ]
+            for result, correct in results:
+                if tuple(result) != correct:
+                    raise AssertionError(
+                        f"count_models with {processes} workers gave "
+                        f"{result}, not {correct}"
+                    )
+
+            # Stopping early must give the verdict, but may not count all
+            early = logic.count_models(knowledge, query, processes)
+            if (early.entailed != entailed
+                    or early.complete and early.models != expected):
+                raise AssertionError(
+                    f"count_models with {processes} workers stopping "
+                    f"early gave {early}"
+                )
+    print(f"{count} puzzles have the same model counts in parallel")
+
+
+def check_puzzles(count, seed):
+    """
+    Checks that entails, model_check, evaluating every model and
+    classifying every symbol at once agree on the puzzles of puzzle.py
+    and on `count` small generated puzzles, and compares their times.
+    """
+    puzzles = [
+        (knowledge, [puzzle.AKnight, puzzle.AKnave, puzzle.BKnight,
+                     puzzle.BKnave, puzzle.CKnight, puzzle.CKnave])
+        for knowledge in (puzzle.knowledge0, puzzle.knowledge1,
+                          puzzle.knowledge2, puzzle.knowledge3)
+    ]
+    rng = random.Random(seed)
+    for i in range(count):
+        people = rng.randint(2, 6)
+        puzzles.append(random_puzzle(people, rng.randint(1, 2 * people),
+                                     rng.randrange(2 ** 32)))
+
+    checks = [("recursive", recursive_model_check),
+              ("model_check", model_check), ("entails", sat.entails)]
+    times = dict.fromkeys([label for label, check in checks], 0.0)
+    times["classify"] = 0.0
+    for knowledge, symbols in puzzles:
+        answers = {}
+        for label, check in checks:
+            start = time.perf_counter()
+            answers[label] = [check(knowledge, symbol) for symbol in symbols]
+            times[label] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        forced = sat.KnowledgeBase(knowledge).classify(symbols)
+        times["classify"] += time.perf_counter() - start
+        answers["classify"] = [symbol in forced.true for symbol in symbols]
+        if len(set(map(tuple, answers.values()))) != 1:
+            raise AssertionError(f"answers differ for {knowledge.formula()}")
+        check_knowledge_base(knowledge, symbols, forced, rng)
+
+    # Inconsistent knowledge entails everything
+    contradiction = And(puzzle.AKnight, Not(puzzle.AKnight))
+    symbols = [puzzle.AKnight, puzzle.BKnave]
+    forced = sat.KnowledgeBase(contradiction).classify(symbols)
+    if forced != (symbols, symbols, []):
+        raise AssertionError("classify of inconsistent knowledge is wrong")
+    print(f"{len(puzzles)} small puzzles agree: " + ", ".join(
+        f"{label} {elapsed:.3f}s" for label, elapsed in times.items()
+    ))
+
+
+def check_knowledge_base(knowledge, symbols, forced, rng):
+    """
+    Checks the Classification `forced` of `symbols` against model_check,
+    and that a KnowledgeBase given the knowledge a part at a time, and
+    queried in between, agrees with model_check on what it knows so far.
+    """
+    false = [symbol for symbol in symbols
+             if model_check(knowledge, Not(symbol))]
+    undetermined = [symbol for symbol in symbols
+                    if symbol not in forced.true and symbol not in false]
+    if forced.false != false or forced.undetermined != undetermined:
+        raise AssertionError(f"classify is wrong for {knowledge.formula()}")
+
+    base = sat.KnowledgeBase()
+    known = And()
+    for conjunct in knowledge.conjuncts:
+        base.add(conjunct)
+        known.add(conjunct)
+        query = rng.choice(symbols)
+        if rng.random() < 0.5:
+            query = Not(query)
+        if base.entails(query) != model_check(known, query):
+            raise AssertionError(
+                f"KnowledgeBase is wrong about {query.formula()} given "
+                f"{known.formula()}"
+            )
+
+
+def check_solver(count, seed):
+    """
+    Checks the SAT solver on `count` random 3-SAT clause sets, each
+    solved under several sets of assumptions as clauses are added,
+    against trying every assignment.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        variables = rng.randint(3, 12)
+        solver = sat.Solver()
+        for v in range(variables):
+            solver.new_variable()
+        clauses = []
+        for _ in range(round(4.3 * variables)):
+            clause = [rng.choice([-1, 1]) * v
+                      for v in rng.sample(range(1, variables + 1), 3)]
+            clauses.append(clause)
+            solver.add_clause(clause)
+            assumptions = [rng.choice([-1, 1]) * v for v in rng.sample(
+                range(1, variables + 1), rng.randint(0, 2)
+            )]
+            constraints = clauses + [[literal] for literal in assumptions]
+            satisfiable = solver.solve(assumptions)
+            if satisfiable != brute_force_sat(variables, constraints):
+                raise AssertionError(f"solver is wrong about {clauses} "
+                                     f"assuming {assumptions}")
+            if satisfiable and not all(
+                any(solver.model[abs(literal)] == (literal > 0)
+                    for literal in clause)
+                for clause in constraints
+            ):
+                raise AssertionError(f"solver model fails {clauses}")
+    print(f"{count} random clause sets agree with trying every assignment")
+
+
+def brute_force_sat(variables, clauses):
+    """
+    Returns whether some assignment of `variables` variables satisfies
+    every clause.
+    """
+    return any(
+        all(any(values[abs(literal) - 1] == (literal > 0)
+                for literal in clause)
+            for clause in clauses)
+        for values in itertools.product([False, True], repeat=variables)
+    )
+
+
+def benchmark_enumeration(people, seed):
+    """
+    Times model_check, which evaluates compiled sentences in blocks of
+    models, against evaluating the sentence tree in every model, on
+    queries that are entailed where possible.
+    """
+    knowledge, symbols = random_puzzle(people, 2 * people, seed)
+    print(f"{len(symbols)} symbols, {2 ** len(symbols)} models")
+
+    # Entailed symbols need every model checked
+    queries = [
+        symbol for symbol in symbols if sat.entails(knowledge, symbol)
+    ][:2] or symbols[:2]
+    for label, check in (("model_check", model_check),
+                         ("recursive", recursive_model_check)):
+        start = time.perf_counter()
+        answers = [check(knowledge, symbol) for symbol in queries]
+        elapsed = time.perf_counter() - start
+        print(f"  {label}: {elapsed / len(answers):.4f}s per query, "
+              f"answers {answers}")
+
+
+def benchmark_counting(people, seed, workers):
+    """
+    Times counting the models of a generated puzzle and checking an
+    entailed and a refuted query, in one process and across `workers`.
+    """
+    knowledge, symbols = random_puzzle(people, 2 * people, seed)
+    print(f"{len(symbols)} symbols, {2 ** len(symbols)} models")
+    forced = sat.KnowledgeBase(knowledge).classify(symbols)
+    queries = [None] + (forced.true + forced.undetermined)[:1]
+    queries += (forced.false + forced.undetermined)[:1]
+    for query in queries:
+        for processes in (1, workers or None):
+            start = time.perf_counter()
+            result = logic.count_models(knowledge, query, processes)
+            elapsed = time.perf_counter() - start
+            print(f"  {query}, {processes or 'all'} workers: "
+                  f"{elapsed:.3f}s, {result}")
+
+
+def benchmark_simplify(people, statements, seed):
+    """
+    Reports the memory taken by a generated puzzle with its equal parts
+    shared, the time to hash it, and how much simplifying it shrinks it
+    and speeds up entailment.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    knowledge, symbols = random_puzzle(people, statements, seed)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total, distinct = logic.count_nodes(knowledge)
+    print(f"{len(symbols)} symbols, {statements} statements: built in "
+          f"{elapsed:.3f}s, {size / 1024:.0f} KiB")
+    print(f"  {total} nodes in the tree, {distinct} distinct sentences")
+
+    for label in ("first", "cached"):
+        start = time.perf_counter()
+        hash(knowledge)
+        print(f"  {label} hash: {time.perf_counter() - start:.6f}s")
+
+    start = time.perf_counter()
+    simplified = logic.simplify(knowledge)
+    elapsed = time.perf_counter() - start
+    total, distinct = logic.count_nodes(simplified)
+    print(f"  simplified in {elapsed:.3f}s to {total} nodes, "
+          f"{distinct} distinct")
+
+    queries = symbols[:50]
+    for label, sentence in (("original", knowledge),
+                            ("simplified", simplified)):
+        start = time.perf_counter()
+        answers = [sat.entails(sentence, query) for query in queries]
+        elapsed = time.perf_counter() - start
+        print(f"  entails on {label}: {elapsed:.3f}s for {len(queries)} "
+              f"queries, {sum(answers)} entailed")
+
+
+def recursive_model_check(knowledge, query):
+    """
+    Checks if knowledge base entails query by evaluating both in every
+    model in turn, as model_check did before sentences were compiled.
+    """
+
+    def check_all(symbols, model):
+        if not symbols:
+            if knowledge.evaluate(model):
+                return query.evaluate(model)
+            return True
+        remaining = symbols.copy()
+        p = remaining.pop()
+        model_true = model.copy()
+        model_true[p] = True
+        model_false = model.copy()
+        model_false[p] = False
+        return (check_all(remaining, model_true) and
+                check_all(remaining, model_false))
+
+    return check_all(set.union(knowledge.symbols(), query.symbols()), dict())
+
+
+def random_puzzle(people, statements, seed):
+    """
+    Returns the knowledge of a random knights and knaves puzzle with
+    `people` people making `statements` statements, and its symbols.
+
+    A hidden assignment decides who is a knight, and every statement is
+    worded to be true if its speaker is a knight and false otherwise,
+    so the knowledge is always consistent.
+    """
+    rng = random.Random(seed)
+    knights = [Symbol(f"{i} is a Knight") for i in range(people)]
+    knaves = [Symbol(f"{i} is a Knave") for i in range(people)]
+    model = {}
+    for i in range(people):
+        model[knights[i].name] = rng.random() < 0.5
+        model[knaves[i].name] = not model[knights[i].name]
+
+    knowledge = And()
+    for i in range(people):
+        knowledge.add(Or(knights[i], knaves[i]))
+        knowledge.add(Not(And(knights[i], knaves[i])))
+
+    for _ in range(statements):
+        speaker = rng.randrange(people)
+        claim = random_claim(rng, knights, knaves)
+        if claim.evaluate(model) != model[knights[speaker].name]:
+            claim = Not(claim)
+        knowledge.add(Implication(knights[speaker], claim))
+        knowledge.add(Implication(knaves[speaker], Not(claim)))
+    return knowledge, knights + knaves
+
+
+def random_sentence(rng, symbols, depth):
+    """
+    Returns a random sentence over `symbols` nested up to `depth` deep.
+    """
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice(symbols)
+    parts = [random_sentence(rng, symbols, depth - 1)
+             for _ in range(rng.randint(1, 3))]
+    form = rng.randrange(5)
+    if form == 0:
+        return Not(parts[0])
+    if form == 1:
+        return And(*parts)
+    if form == 2:
+        return Or(*parts)
+    if form == 3:
+        return Implication(parts[0], parts[-1])
+    return Biconditional(parts[0], parts[-1])
+
+
+def random_claim(rng, knights, knaves):
+    """
+    Returns a random claim about some of the people.
+    """
+    kind = rng.choice([knights, knaves])
+    x, y, z = (rng.randrange(len(knights)) for _ in range(3))
+    form = rng.randrange(5)
+    if form == 0:
+        return kind[x]
+    if form == 1:
+        return Biconditional(knights[x], knights[y])
+    if form == 2:
+        return Or(kind[x], kind[y], kind[z])
+    if form == 3:
+        return And(kind[x], Not(kind[y]))
+    return Implication(knights[x], kind[y])
+
+
+if __name__ == "__main__":
+    main()
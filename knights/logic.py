@@ -1,8 +1,26 @@
 import itertools
+import multiprocessing
+import os
+import threading
+import weakref
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Models evaluated at once by compiled sentences, as the bits of one integer
+BLOCK_BITS = 12
+
+# Every shared sentence by its class and parts, so that equal sentences
+# are built once
+interned = weakref.WeakValueDictionary()
 
 
 class Sentence():
 
+    __slots__ = ("fixed", "_hash", "_symbols", "_program", "__weakref__")
+
+    # Incremented whenever a sentence changes, to invalidate cached results
+    version = 0
+
     def evaluate(self, model):
         """Evaluates the logical sentence."""
         raise Exception("nothing to evaluate")
@@ -13,8 +31,47 @@ class Sentence():
 
     def symbols(self):
         """Returns a set of all symbols in the logical sentence."""
+        return set(self.cached("_symbols",
+                               lambda: frozenset(self.find_symbols())))
+
+    def find_symbols(self):
+        """Returns the symbols of the sentence without using the cache."""
         return set()
 
+    def compile(self):
+        """Returns the sentence compiled into a Program."""
+        return self.cached("_program", lambda: Program(self))
+
+    def cached(self, slot, compute):
+        """
+        Returns the value cached in `slot`, computing it first if there is
+        none. Values of fixed sentences, which cannot change, are kept for
+        good, and others until any sentence changes.
+        """
+        entry = getattr(self, slot, None)
+        if entry is None or (entry[0] is not None
+                             and entry[0] != Sentence.version):
+            fixed = getattr(self, "fixed", False)
+            entry = (None if fixed else Sentence.version, compute())
+            setattr(self, slot, entry)
+        return entry[1]
+
+    @classmethod
+    def share(cls, key, **fields):
+        """
+        Returns the sentence of this class with `fields`, creating it only
+        if there is none. `key` identifies the fields, by the identity of
+        any sentences among them.
+        """
+        key = (cls,) + key
+        sentence = interned.get(key)
+        if sentence is None:
+            sentence = object.__new__(cls)
+            for name, value in fields.items():
+                setattr(sentence, name, value)
+            interned[key] = sentence
+        return sentence
+
     @classmethod
     def validate(cls, sentence):
         if not isinstance(sentence, Sentence):
@@ -44,14 +101,19 @@ class Sentence():
 
 class Symbol(Sentence):
 
-    def __init__(self, name):
-        self.name = name
+    __slots__ = ("name",)
+
+    def __new__(cls, name):
+        return cls.share((name,), name=name, fixed=True)
+
+    def __reduce__(self):
+        return (type(self), (self.name,))
 
     def __eq__(self, other):
         return isinstance(other, Symbol) and self.name == other.name
 
     def __hash__(self):
-        return hash(("symbol", self.name))
+        return self.cached("_hash", lambda: hash(("symbol", self.name)))
 
     def __repr__(self):
         return self.name
@@ -65,20 +127,28 @@ class Symbol(Sentence):
     def formula(self):
         return self.name
 
-    def symbols(self):
+    def find_symbols(self):
         return {self.name}
 
 
 class Not(Sentence):
-    def __init__(self, operand):
+
+    __slots__ = ("operand",)
+
+    def __new__(cls, operand):
         Sentence.validate(operand)
-        self.operand = operand
+        return cls.share((id(operand),), operand=operand,
+                         fixed=operand.fixed)
+
+    def __reduce__(self):
+        return (type(self), (self.operand,))
 
     def __eq__(self, other):
-        return isinstance(other, Not) and self.operand == other.operand
+        return self is other or (isinstance(other, Not)
+                                 and self.operand == other.operand)
 
     def __hash__(self):
-        return hash(("not", hash(self.operand)))
+        return self.cached("_hash", lambda: hash(("not", hash(self.operand))))
 
     def __repr__(self):
         return f"Not({self.operand})"
@@ -89,23 +159,39 @@ class Not(Sentence):
     def formula(self):
         return "¬" + Sentence.parenthesize(self.operand.formula())
 
-    def symbols(self):
+    def find_symbols(self):
         return self.operand.symbols()
 
 
 class And(Sentence):
+    """
+    Conjunction, which unlike other sentences can be added to, so each
+    one is separate. intern() returns an equal, shared conjunction that
+    can no longer be added to.
+    """
+
+    __slots__ = ("conjuncts", "frozen")
+
     def __init__(self, *conjuncts):
         for conjunct in conjuncts:
             Sentence.validate(conjunct)
         self.conjuncts = list(conjuncts)
+        self.frozen = False
+        self.fixed = False
+
+    def __reduce__(self):
+        if self.frozen:
+            return (intern, (And(*self.conjuncts),))
+        return (type(self), tuple(self.conjuncts))
 
     def __eq__(self, other):
-        return isinstance(other, And) and self.conjuncts == other.conjuncts
+        return self is other or (isinstance(other, And)
+                                 and self.conjuncts == other.conjuncts)
 
     def __hash__(self):
-        return hash(
+        return self.cached("_hash", lambda: hash(
             ("and", tuple(hash(conjunct) for conjunct in self.conjuncts))
-        )
+        ))
 
     def __repr__(self):
         conjunctions = ", ".join(
@@ -114,8 +200,11 @@ class And(Sentence):
         return f"And({conjunctions})"
 
     def add(self, conjunct):
+        if self.frozen:
+            raise TypeError("cannot add to an interned conjunction")
         Sentence.validate(conjunct)
         self.conjuncts.append(conjunct)
+        Sentence.version += 1
 
     def evaluate(self, model):
         return all(conjunct.evaluate(model) for conjunct in self.conjuncts)
@@ -126,23 +215,35 @@ class And(Sentence):
         return " ∧ ".join([Sentence.parenthesize(conjunct.formula())
                            for conjunct in self.conjuncts])
 
-    def symbols(self):
-        return set.union(*[conjunct.symbols() for conjunct in self.conjuncts])
+    def find_symbols(self):
+        return set().union(*[conjunct.symbols()
+                             for conjunct in self.conjuncts])
 
 
 class Or(Sentence):
-    def __init__(self, *disjuncts):
+
+    __slots__ = ("disjuncts",)
+
+    def __new__(cls, *disjuncts):
         for disjunct in disjuncts:
             Sentence.validate(disjunct)
-        self.disjuncts = list(disjuncts)
+        return cls.share(
+            tuple(id(disjunct) for disjunct in disjuncts),
+            disjuncts=list(disjuncts),
+            fixed=all(disjunct.fixed for disjunct in disjuncts)
+        )
+
+    def __reduce__(self):
+        return (type(self), tuple(self.disjuncts))
 
     def __eq__(self, other):
-        return isinstance(other, Or) and self.disjuncts == other.disjuncts
+        return self is other or (isinstance(other, Or)
+                                 and self.disjuncts == other.disjuncts)
 
     def __hash__(self):
-        return hash(
+        return self.cached("_hash", lambda: hash(
             ("or", tuple(hash(disjunct) for disjunct in self.disjuncts))
-        )
+        ))
 
     def __repr__(self):
         disjuncts = ", ".join([str(disjunct) for disjunct in self.disjuncts])
@@ -157,24 +258,36 @@ class Or(Sentence):
         return " ∨  ".join([Sentence.parenthesize(disjunct.formula())
                             for disjunct in self.disjuncts])
 
-    def symbols(self):
-        return set.union(*[disjunct.symbols() for disjunct in self.disjuncts])
+    def find_symbols(self):
+        return set().union(*[disjunct.symbols()
+                             for disjunct in self.disjuncts])
 
 
 class Implication(Sentence):
-    def __init__(self, antecedent, consequent):
+
+    __slots__ = ("antecedent", "consequent")
+
+    def __new__(cls, antecedent, consequent):
         Sentence.validate(antecedent)
         Sentence.validate(consequent)
-        self.antecedent = antecedent
-        self.consequent = consequent
+        return cls.share(
+            (id(antecedent), id(consequent)),
+            antecedent=antecedent, consequent=consequent,
+            fixed=antecedent.fixed and consequent.fixed
+        )
+
+    def __reduce__(self):
+        return (type(self), (self.antecedent, self.consequent))
 
     def __eq__(self, other):
-        return (isinstance(other, Implication)
-                and self.antecedent == other.antecedent
-                and self.consequent == other.consequent)
+        return self is other or (isinstance(other, Implication)
+                                 and self.antecedent == other.antecedent
+                                 and self.consequent == other.consequent)
 
     def __hash__(self):
-        return hash(("implies", hash(self.antecedent), hash(self.consequent)))
+        return self.cached("_hash", lambda: hash(
+            ("implies", hash(self.antecedent), hash(self.consequent))
+        ))
 
     def __repr__(self):
         return f"Implication({self.antecedent}, {self.consequent})"
@@ -188,76 +301,453 @@ class Implication(Sentence):
         consequent = Sentence.parenthesize(self.consequent.formula())
         return f"{antecedent} => {consequent}"
 
-    def symbols(self):
+    def find_symbols(self):
         return set.union(self.antecedent.symbols(), self.consequent.symbols())
 
 
 class Biconditional(Sentence):
-    def __init__(self, left, right):
+
+    __slots__ = ("left", "right")
+
+    def __new__(cls, left, right):
         Sentence.validate(left)
         Sentence.validate(right)
-        self.left = left
-        self.right = right
+        return cls.share((id(left), id(right)), left=left, right=right,
+                         fixed=left.fixed and right.fixed)
+
+    def __reduce__(self):
+        return (type(self), (self.left, self.right))
 
     def __eq__(self, other):
-        return (isinstance(other, Biconditional)
-                and self.left == other.left
-                and self.right == other.right)
+        return self is other or (isinstance(other, Biconditional)
+                                 and self.left == other.left
+                                 and self.right == other.right)
 
     def __hash__(self):
-        return hash(("biconditional", hash(self.left), hash(self.right)))
+        return self.cached("_hash", lambda: hash(
+            ("biconditional", hash(self.left), hash(self.right))
+        ))
 
     def __repr__(self):
         return f"Biconditional({self.left}, {self.right})"
 
     def evaluate(self, model):
-        return ((self.left.evaluate(model)
-                 and self.right.evaluate(model))
-                or (not self.left.evaluate(model)
-                    and not self.right.evaluate(model)))
+        return self.left.evaluate(model) == self.right.evaluate(model)
 
     def formula(self):
         left = Sentence.parenthesize(str(self.left))
         right = Sentence.parenthesize(str(self.right))
         return f"{left} <=> {right}"
 
-    def symbols(self):
+    def find_symbols(self):
         return set.union(self.left.symbols(), self.right.symbols())
 
 
-def model_check(knowledge, query):
-    """Checks if knowledge base entails query."""
-
-    def check_all(knowledge, query, symbols, model):
-        """Checks if knowledge base entails query, given a particular model."""
-
-        # If model has an assignment for each symbol
-        if not symbols:
-
-            # If knowledge base is true in model, then query must also be true
-            if knowledge.evaluate(model):
-                return query.evaluate(model)
-            return True
+def intern(sentence):
+    """
+    Returns the shared sentence equal to `sentence`, in which every
+    conjunction is shared too and can no longer be added to.
+    """
+    if sentence.fixed:
+        return sentence
+    if isinstance(sentence, And):
+        return conjunction([intern(conjunct)
+                            for conjunct in sentence.conjuncts])
+    if isinstance(sentence, Not):
+        return Not(intern(sentence.operand))
+    if isinstance(sentence, Or):
+        return Or(*[intern(disjunct) for disjunct in sentence.disjuncts])
+    if isinstance(sentence, Implication):
+        return Implication(intern(sentence.antecedent),
+                           intern(sentence.consequent))
+    if isinstance(sentence, Biconditional):
+        return Biconditional(intern(sentence.left), intern(sentence.right))
+    raise TypeError(f"cannot intern {type(sentence).__name__}")
+
+
+def conjunction(conjuncts):
+    """
+    Returns the shared conjunction of shared `conjuncts`.
+    """
+    key = (And,) + tuple(id(conjunct) for conjunct in conjuncts)
+    sentence = interned.get(key)
+    if sentence is None:
+        sentence = And(*conjuncts)
+        sentence.frozen = sentence.fixed = True
+        interned[key] = sentence
+    return sentence
+
+
+# The empty conjunction is always true and the empty disjunction false
+TRUE = conjunction([])
+FALSE = Or()
+
+
+def simplify(sentence):
+    """
+    Returns a shared sentence equivalent to `sentence` and no larger:
+    nested conjunctions and disjunctions are flattened, repeated parts
+    removed, double negations cancelled, and parts that are always true
+    or always false folded away. The result may have fewer symbols, if
+    some never affected its value.
+    """
+    done = {}
+
+    def visit(sentence):
+        key = id(sentence)
+        if key not in done:
+            done[key] = (sentence, reduce(sentence))
+        return done[key][1]
+
+    def reduce(sentence):
+        if isinstance(sentence, Symbol):
+            return sentence
+        if isinstance(sentence, Not):
+            return negate(visit(sentence.operand))
+        if isinstance(sentence, And):
+            return combine(And, sentence.conjuncts, FALSE)
+        if isinstance(sentence, Or):
+            return combine(Or, sentence.disjuncts, TRUE)
+        if isinstance(sentence, Implication):
+            antecedent = visit(sentence.antecedent)
+            consequent = visit(sentence.consequent)
+            if (antecedent is FALSE or consequent is TRUE
+                    or antecedent is consequent):
+                return TRUE
+            if antecedent is TRUE:
+                return consequent
+            if consequent is FALSE:
+                return negate(antecedent)
+            if negate(antecedent) is consequent:
+                return consequent
+            return Implication(antecedent, consequent)
+        if isinstance(sentence, Biconditional):
+            left = visit(sentence.left)
+            right = visit(sentence.right)
+            if left is right:
+                return TRUE
+            if negate(left) is right:
+                return FALSE
+            for a, b in ((left, right), (right, left)):
+                if a is TRUE:
+                    return b
+                if a is FALSE:
+                    return negate(b)
+            return Biconditional(left, right)
+        raise TypeError(f"cannot simplify {type(sentence).__name__}")
+
+    def combine(cls, parts, absorbing):
+        """
+        Returns the flattened conjunction or disjunction of `parts`, or
+        `absorbing` if it is decided by any one part or complementary parts.
+        """
+        kept = {}
+        for part in parts:
+            part = visit(part)
+            if part is absorbing:
+                return absorbing
+            nested = (part.conjuncts if cls is And else part.disjuncts
+                      ) if isinstance(part, cls) else [part]
+            for item in nested:
+                kept.setdefault(id(item), item)
+        for item in kept.values():
+            if isinstance(item, Not) and id(item.operand) in kept:
+                return absorbing
+        items = list(kept.values())
+        if len(items) == 1:
+            return items[0]
+        return conjunction(items) if cls is And else Or(*items)
+
+    return visit(intern(sentence))
+
+
+def negate(sentence):
+    """
+    Returns the negation of a shared sentence, without double negations
+    or negated constants.
+    """
+    if isinstance(sentence, Not):
+        return sentence.operand
+    if sentence is TRUE:
+        return FALSE
+    if sentence is FALSE:
+        return TRUE
+    return Not(sentence)
+
+
+def count_nodes(sentence):
+    """
+    Returns the number of nodes in the tree of `sentence`, counting
+    shared parts every time they appear, and the number of distinct
+    sentence objects among them.
+    """
+    total = 0
+    distinct = set()
+    stack = [sentence]
+    while stack:
+        node = stack.pop()
+        total += 1
+        distinct.add(id(node))
+        stack.extend(children(node))
+    return total, len(distinct)
+
+
+def children(sentence):
+    if isinstance(sentence, Not):
+        return [sentence.operand]
+    if isinstance(sentence, And):
+        return sentence.conjuncts
+    if isinstance(sentence, Or):
+        return sentence.disjuncts
+    if isinstance(sentence, Implication):
+        return [sentence.antecedent, sentence.consequent]
+    if isinstance(sentence, Biconditional):
+        return [sentence.left, sentence.right]
+    return []
+
+
+class Program():
+    """
+    Sentences compiled into a list of instructions over bit vectors,
+    where bit `m` of each value is its truth in the `m`th model, so one
+    pass evaluates the sentences in many models at once. Subsentences
+    that appear more than once are evaluated once.
+
+    Models are numbered so that bit `i` of `m` is the value of the `i`th
+    of `symbols` in model `m`, and are taken 2 ** BLOCK_BITS at a time:
+    within a block, the first BLOCK_BITS symbols take every combination
+    of values, and the block number gives the values of the rest.
+    """
+
+    def __init__(self, *sentences):
+        self.symbols = sorted(set().union(
+            *[sentence.symbols() for sentence in sentences]
+        ))
+        self.index = {name: i for i, name in enumerate(self.symbols)}
+        self.instructions = []
+        registers = {}
+        self.outputs = [self.emit(sentence, registers)
+                        for sentence in sentences]
+        self.output = self.outputs[0]
+
+        self.low = min(len(self.symbols), BLOCK_BITS)
+        width = 2 ** self.low
+        self.mask = (1 << width) - 1
+        self.patterns = [
+            self.mask // ((1 << 2 ** (i + 1)) - 1)
+            * (self.mask >> (width - 2 ** i) << 2 ** i)
+            for i in range(self.low)
+        ]
+
+    def emit(self, sentence, registers):
+        """
+        Appends instructions computing `sentence`, and those of its parts
+        not already in `registers`, returning where its value is stored.
+        """
+        if sentence in registers:
+            return registers[sentence]
+        if isinstance(sentence, Symbol):
+            instruction = ("symbol", self.index[sentence.name])
+        elif isinstance(sentence, Not):
+            instruction = ("not", self.emit(sentence.operand, registers))
+        elif isinstance(sentence, And):
+            instruction = ("and", [self.emit(conjunct, registers)
+                                   for conjunct in sentence.conjuncts])
+        elif isinstance(sentence, Or):
+            instruction = ("or", [self.emit(disjunct, registers)
+                                  for disjunct in sentence.disjuncts])
+        elif isinstance(sentence, Implication):
+            instruction = ("implies", (
+                self.emit(sentence.antecedent, registers),
+                self.emit(sentence.consequent, registers)
+            ))
+        elif isinstance(sentence, Biconditional):
+            instruction = ("iff", (self.emit(sentence.left, registers),
+                                   self.emit(sentence.right, registers)))
         else:
+            raise TypeError(f"cannot compile {type(sentence).__name__}")
+        self.instructions.append(instruction)
+        registers[sentence] = len(self.instructions) - 1
+        return registers[sentence]
+
+    def execute(self, inputs, mask):
+        """
+        Returns the bits of the models in which each instruction is true,
+        given the bits of the models in which each symbol is true and a
+        `mask` of all the models.
+        """
+        values = []
+        for operation, operands in self.instructions:
+            if operation == "symbol":
+                value = inputs[operands]
+            elif operation == "not":
+                value = mask ^ values[operands]
+            elif operation == "and":
+                value = mask
+                for operand in operands:
+                    value &= values[operand]
+            elif operation == "or":
+                value = 0
+                for operand in operands:
+                    value |= values[operand]
+            elif operation == "implies":
+                value = (mask ^ values[operands[0]]) | values[operands[1]]
+            else:
+                value = mask ^ values[operands[0]] ^ values[operands[1]]
+            values.append(value)
+        return values
+
+    def run(self, inputs, mask):
+        """
+        Returns the bits of the models in which the first sentence is
+        true, as execute does.
+        """
+        return self.execute(inputs, mask)[self.output]
 
-            # Choose one of the remaining unused symbols
-            remaining = symbols.copy()
-            p = remaining.pop()
-
-            # Create a model where the symbol is true
-            model_true = model.copy()
-            model_true[p] = True
-
-            # Create a model where the symbol is false
-            model_false = model.copy()
-            model_false[p] = False
+    def evaluate(self, model):
+        """Evaluates the sentence in one model, as Sentence.evaluate."""
+        try:
+            inputs = [int(bool(model[name])) for name in self.symbols]
+        except KeyError as error:
+            raise Exception(f"variable {error.args[0]} not in model")
+        return bool(self.run(inputs, 1))
+
+    def block_count(self):
+        return 2 ** (len(self.symbols) - self.low)
+
+    def inputs(self, block):
+        """
+        Returns the bits of the models of `block` in which each symbol
+        is true.
+        """
+        return self.patterns + [
+            self.mask if block >> j & 1 else 0
+            for j in range(len(self.symbols) - self.low)
+        ]
+
+    def blocks(self, start=0, stop=None):
+        """
+        Yields the bits of the models in which the first sentence is true
+        for each block from `start` up to `stop`, and the mask of the block.
+        """
+        if stop is None:
+            stop = self.block_count()
+        for block in range(start, stop):
+            yield self.run(self.inputs(block), self.mask), self.mask
+
+    def models(self):
+        """
+        Yields every model in which the first sentence is true, as a
+        dictionary from symbol names to values.
+        """
+        for block, (value, mask) in enumerate(self.blocks()):
+            while value:
+                bit = value & -value
+                value ^= bit
+                m = block << self.low | bit.bit_length() - 1
+                yield {
+                    name: bool(m >> i & 1)
+                    for i, name in enumerate(self.symbols)
+                }
 
-            # Ensure entailment holds in both models
-            return (check_all(knowledge, query, remaining, model_true) and
-                    check_all(knowledge, query, remaining, model_false))
 
-    # Get all symbols in both knowledge and query
-    symbols = set.union(knowledge.symbols(), query.symbols())
+def model_check(knowledge, query):
+    """Checks if knowledge base entails query."""
 
-    # Check that knowledge entails query
-    return check_all(knowledge, query, symbols, dict())
+    # The query must be true in every model where knowledge is true
+    program = Implication(knowledge, query).compile()
+    return all(value == mask for value, mask in program.blocks())
+
+
+def models(sentence):
+    """Yields every model in which sentence is true."""
+    return sentence.compile().models()
+
+
+# Ranges of blocks handed to each worker of count_models
+TASKS_PER_WORKER = 8
+
+# Set in worker processes of count_models once a counterexample is found
+stopped = None
+
+ModelCount = namedtuple("ModelCount", ["entailed", "models", "complete"])
+
+
+def count_models(knowledge, query=None, workers=None, stop_early=True):
+    """
+    Counts the models in which knowledge is true and, given a query,
+    checks if knowledge entails it, returning a ModelCount of the verdict
+    (None without a query), the number of models and whether every model
+    was counted.
+
+    Blocks of models are split by the values of the symbols that are
+    fixed within a block into ranges checked by `workers` processes (by
+    default, one per CPU). If `stop_early`, every process stops at its
+    next block once any of them finds a model of the knowledge in which
+    the query is false, so the verdict is known but the count is not
+    complete.
+    """
+    sentences = [knowledge] if query is None else [knowledge, query]
+    program = Program(*sentences)
+    workers = workers or os.cpu_count() or 1
+    blocks = program.block_count()
+    size = max(1, -(-blocks // (workers * TASKS_PER_WORKER)))
+    ranges = [(start, min(start + size, blocks))
+              for start in range(0, blocks, size)]
+
+    if workers == 1 or len(ranges) == 1:
+        start_worker(threading.Event())
+        results = [check_blocks(program, start, stop, stop_early)
+                   for start, stop in ranges]
+    else:
+        event = multiprocessing.Event()
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=start_worker,
+                                 initargs=(event,)) as executor:
+            futures = [
+                executor.submit(check_blocks, program, start, stop,
+                                stop_early)
+                for start, stop in ranges
+            ]
+            results = []
+            for future in as_completed(futures):
+                results.append(future.result())
+                if stop_early and results[-1][0]:
+                    executor.shutdown(cancel_futures=True)
+                    break
+
+    counterexample = any(result[0] for result in results)
+    return ModelCount(
+        None if query is None else not counterexample,
+        sum(result[1] for result in results),
+        len(results) == len(ranges) and all(result[2] for result in results)
+    )
+
+
+def start_worker(event):
+    global stopped
+    stopped = event
+
+
+def check_blocks(program, start, stop, stop_early):
+    """
+    Checks the blocks of `program` from `start` up to `stop`, returning
+    whether some model of its first sentence falsifies its second, the
+    number of models of its first sentence and whether every block
+    was checked.
+    """
+    models = 0
+    counterexample = False
+    for block in range(start, stop):
+        if stopped.is_set():
+            return counterexample, models, False
+        values = program.execute(program.inputs(block), program.mask)
+        knowledge = values[program.outputs[0]]
+        models += bin(knowledge).count("1")
+        if (len(program.outputs) > 1
+                and knowledge & ~values[program.outputs[1]]):
+            counterexample = True
+            if stop_early:
+                stopped.set()
+                return counterexample, models, block + 1 == stop
+    return counterexample, models, True
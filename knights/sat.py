@@ -0,0 +1,522 @@
+import heapq
+from collections import namedtuple
+
+from logic import And, Biconditional, Implication, Not, Or, Symbol
+
+# Conflicts before the first restart, scaled by the Luby sequence
+RESTART_BASE = 100
+
+# Factor by which variable activities decay after every conflict
+ACTIVITY_DECAY = 0.95
+
+# Symbols a knowledge base forces to be true or false, and the rest
+Classification = namedtuple("Classification",
+                            ["true", "false", "undetermined"])
+
+
+class CNF():
+    """
+    Clauses over numbered variables, with literals as signed integers:
+    `v` is variable `v` being true and `-v` it being false.
+    """
+
+    def __init__(self):
+        self.variables = 0
+        self.clauses = []
+
+    def new_variable(self):
+        self.variables += 1
+        return self.variables
+
+    def add_clause(self, literals):
+        self.clauses.append(list(literals))
+        return True
+
+
+class Encoder():
+    """
+    Tseitin encoding of sentences into the clauses of `cnf`, which is a
+    CNF or a Solver. Every symbol gets a variable, and so does every
+    compound sentence, with clauses making it equivalent to its parts.
+    Sentences encoded again reuse their variable.
+    """
+
+    def __init__(self, cnf):
+        self.cnf = cnf
+        self.symbols = {}
+        self.literals = {}
+
+    def variable(self, name):
+        """
+        Returns the variable of the symbol called `name`.
+        """
+        if name not in self.symbols:
+            self.symbols[name] = self.cnf.new_variable()
+        return self.symbols[name]
+
+    def encode(self, sentence):
+        """
+        Returns a literal that is true exactly when `sentence` is.
+        """
+        if isinstance(sentence, Symbol):
+            return self.variable(sentence.name)
+        if isinstance(sentence, Not):
+            return -self.encode(sentence.operand)
+        literal = self.literals.get(sentence)
+        if literal is None:
+            literal = self.encode_compound(sentence)
+            self.literals[sentence] = literal
+        return literal
+
+    def encode_compound(self, sentence):
+        if isinstance(sentence, And):
+            return self.conjunction(
+                [self.encode(conjunct) for conjunct in sentence.conjuncts]
+            )
+        if isinstance(sentence, Or):
+            return -self.conjunction(
+                [-self.encode(disjunct) for disjunct in sentence.disjuncts]
+            )
+        if isinstance(sentence, Implication):
+            return -self.conjunction([
+                self.encode(sentence.antecedent),
+                -self.encode(sentence.consequent)
+            ])
+        if isinstance(sentence, Biconditional):
+            left = self.encode(sentence.left)
+            right = self.encode(sentence.right)
+            x = self.cnf.new_variable()
+            self.cnf.add_clause([-x, -left, right])
+            self.cnf.add_clause([-x, left, -right])
+            self.cnf.add_clause([x, left, right])
+            self.cnf.add_clause([x, -left, -right])
+            return x
+        raise TypeError(f"cannot encode {type(sentence).__name__}")
+
+    def conjunction(self, literals):
+        """
+        Returns a literal equivalent to the conjunction of `literals`.
+        """
+        if len(literals) == 1:
+            return literals[0]
+        x = self.cnf.new_variable()
+        for literal in literals:
+            self.cnf.add_clause([-x, literal])
+        self.cnf.add_clause([x] + [-literal for literal in literals])
+        return x
+
+
+def tseitin(sentence):
+    """
+    Returns a CNF that is satisfiable exactly when `sentence` is, and the
+    variable of each of its symbols.
+    """
+    cnf = CNF()
+    encoder = Encoder(cnf)
+    cnf.add_clause([encoder.encode(sentence)])
+    return cnf, encoder.symbols
+
+
+class Solver():
+    """
+    CDCL SAT solver: unit propagation with two watched literals per
+    clause, clause learning at the first unique implication point with
+    non-chronological backjumping, VSIDS decisions with saved phases,
+    and Luby restarts.
+
+    Clauses can be added between calls to solve, and learned clauses
+    are kept, so one solver can answer many related questions.
+    """
+
+    def __init__(self):
+        self.variables = 0
+        self.ok = True
+
+        # Indexed by variable: 1 if true, -1 if false, 0 if unassigned
+        self.assigns = [0]
+        self.level = [0]
+        self.reason = [None]
+        self.activity = [0.0]
+        self.phase = [False]
+        self.increment = 1.0
+        self.heap = []
+
+        self.watches = {}
+        self.clauses = []
+        self.learnts = []
+        self.trail = []
+        self.trail_lim = []
+        self.head = 0
+        self.model = None
+        self.conflicts = 0
+
+    def new_variable(self):
+        self.variables += 1
+        v = self.variables
+        self.assigns.append(0)
+        self.level.append(0)
+        self.reason.append(None)
+        self.activity.append(0.0)
+        self.phase.append(False)
+        self.watches[v] = []
+        self.watches[-v] = []
+        heapq.heappush(self.heap, (0.0, v))
+        return v
+
+    def value(self, literal):
+        value = self.assigns[abs(literal)]
+        return value if literal > 0 else -value
+
+    def add_clause(self, literals):
+        """
+        Adds a clause, simplified by what is known without decisions.
+        Returns False if the clauses have become unsatisfiable.
+        """
+        if not self.ok:
+            return False
+        self.cancel_until(0)
+        clause = []
+        for literal in literals:
+            value = self.value(literal)
+            if value > 0 or -literal in clause:
+                return True
+            if value == 0 and literal not in clause:
+                clause.append(literal)
+
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self.assign(clause[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.watch(clause)
+            self.clauses.append(clause)
+        return self.ok
+
+    def watch(self, clause):
+        self.watches[clause[0]].append(clause)
+        self.watches[clause[1]].append(clause)
+
+    def assign(self, literal, reason):
+        v = abs(literal)
+        self.assigns[v] = 1 if literal > 0 else -1
+        self.level[v] = len(self.trail_lim)
+        self.reason[v] = reason
+        self.trail.append(literal)
+
+    def propagate(self):
+        """
+        Assigns every literal implied by unit clauses, returning a clause
+        with every literal false if there is a conflict, or None.
+
+        Each clause watches its first two literals. When a watched literal
+        becomes false, the clause looks for another literal to watch, and
+        if there is none, its other watched literal is implied.
+        """
+        assigns = self.assigns
+        while self.head < len(self.trail):
+            false = -self.trail[self.head]
+            self.head += 1
+            watching = self.watches[false]
+            i = j = 0
+            while i < len(watching):
+                clause = watching[i]
+                i += 1
+                if clause[0] == false:
+                    clause[0], clause[1] = clause[1], false
+                first = clause[0]
+                value = assigns[abs(first)]
+                if (value if first > 0 else -value) > 0:
+                    watching[j] = clause
+                    j += 1
+                    continue
+
+                for k in range(2, len(clause)):
+                    literal = clause[k]
+                    value = assigns[abs(literal)]
+                    if (value if literal > 0 else -value) >= 0:
+                        clause[1], clause[k] = literal, false
+                        self.watches[literal].append(clause)
+                        break
+                else:
+                    watching[j] = clause
+                    j += 1
+                    value = assigns[abs(first)]
+                    if (value if first > 0 else -value) < 0:
+                        # Keep the clauses not yet visited watching
+                        watching[j:] = watching[i:]
+                        self.head = len(self.trail)
+                        return clause
+                    self.assign(first, clause)
+            del watching[j:]
+        return None
+
+    def analyze(self, conflict):
+        """
+        Returns the clause learned from a conflict, with the literal it
+        implies after backjumping first, and the level to backjump to.
+        """
+        level = len(self.trail_lim)
+        seen = set()
+        learnt = [None]
+        pending = 0
+        index = len(self.trail) - 1
+        clause = conflict
+        literal = None
+        while True:
+            for q in (clause if literal is None else clause[1:]):
+                v = abs(q)
+                if v not in seen and self.level[v] > 0:
+                    seen.add(v)
+                    self.bump(v)
+                    if self.level[v] == level:
+                        pending += 1
+                    else:
+                        learnt.append(q)
+
+            # Resolve on the most recent literal of this level involved
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            literal = self.trail[index]
+            index -= 1
+            clause = self.reason[abs(literal)]
+            pending -= 1
+            if pending == 0:
+                break
+        learnt[0] = -literal
+
+        if len(learnt) == 1:
+            return learnt, 0
+        second = max(range(1, len(learnt)),
+                     key=lambda i: self.level[abs(learnt[i])])
+        learnt[1], learnt[second] = learnt[second], learnt[1]
+        return learnt, self.level[abs(learnt[1])]
+
+    def bump(self, v):
+        self.activity[v] += self.increment
+        if self.activity[v] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.increment *= 1e-100
+            self.rebuild_heap()
+        elif not self.assigns[v]:
+            heapq.heappush(self.heap, (-self.activity[v], v))
+
+    def rebuild_heap(self):
+        self.heap = [(-self.activity[v], v)
+                     for v in range(1, self.variables + 1)
+                     if not self.assigns[v]]
+        heapq.heapify(self.heap)
+
+    def cancel_until(self, level):
+        if len(self.trail_lim) <= level:
+            return
+        start = self.trail_lim[level]
+        for literal in self.trail[start:]:
+            v = abs(literal)
+            self.assigns[v] = 0
+            self.reason[v] = None
+            self.phase[v] = literal > 0
+            heapq.heappush(self.heap, (-self.activity[v], v))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.head = start
+
+        # Variables are pushed again rather than moved up, so drop the
+        # stale entries before they pile up
+        if len(self.heap) > 4 * self.variables + 100:
+            self.rebuild_heap()
+
+    def decide(self):
+        """
+        Returns an unassigned variable of the highest activity,
+        or None if every variable is assigned.
+        """
+        while self.heap:
+            _, v = heapq.heappop(self.heap)
+            if not self.assigns[v]:
+                return v
+        return None
+
+    def solve(self, assumptions=()):
+        """
+        Returns whether the clauses are satisfiable with every literal in
+        `assumptions` true. If so, `model` maps every variable to its
+        value in a satisfying assignment.
+        """
+        self.model = None
+        if not self.ok:
+            return False
+        self.cancel_until(0)
+        if self.propagate() is not None:
+            self.ok = False
+            return False
+
+        restarts = 0
+        while True:
+            budget = RESTART_BASE * luby(restarts)
+            restarts += 1
+            result = self.search(budget, assumptions)
+            if result is not None:
+                self.cancel_until(0)
+                return result
+
+    def search(self, budget, assumptions):
+        """
+        Searches until a model is found (True), unsatisfiability is proven
+        (False), or `budget` conflicts have passed (None).
+        """
+        conflicts = 0
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                conflicts += 1
+                self.conflicts += 1
+                if not self.trail_lim:
+                    self.ok = False
+                    return False
+                learnt, level = self.analyze(conflict)
+                self.cancel_until(level)
+                if len(learnt) == 1:
+                    self.assign(learnt[0], None)
+                else:
+                    self.watch(learnt)
+                    self.learnts.append(learnt)
+                    self.assign(learnt[0], learnt)
+                self.increment /= ACTIVITY_DECAY
+                continue
+
+            if conflicts >= budget:
+                self.cancel_until(0)
+                return None
+
+            # Assume each of `assumptions` in turn, one per level
+            literal = None
+            while len(self.trail_lim) < len(assumptions):
+                assumption = assumptions[len(self.trail_lim)]
+                value = self.value(assumption)
+                if value > 0:
+                    self.trail_lim.append(len(self.trail))
+                elif value < 0:
+                    return False
+                else:
+                    literal = assumption
+                    break
+
+            if literal is None:
+                v = self.decide()
+                if v is None:
+                    self.model = {
+                        u: self.assigns[u] > 0
+                        for u in range(1, self.variables + 1)
+                    }
+                    return True
+                literal = v if self.phase[v] else -v
+            self.trail_lim.append(len(self.trail))
+            self.assign(literal, None)
+
+
+def luby(i):
+    """
+    Returns the `i`th term (from 0) of the Luby sequence 1, 1, 2, 1, 1,
+    2, 4, 1, ...
+    """
+    size, exponent = 1, 0
+    while size < i + 1:
+        exponent += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) // 2
+        exponent -= 1
+        i = i % size
+    return 2 ** exponent
+
+
+class KnowledgeBase():
+    """
+    Sentences encoded into one solver as they are added, so that the
+    clauses it learns and the literals it finds implied carry over from
+    one query to the next.
+    """
+
+    def __init__(self, *sentences):
+        self.solver = Solver()
+        self.encoder = Encoder(self.solver)
+        for sentence in sentences:
+            self.add(sentence)
+
+    def add(self, sentence):
+        """
+        Adds `sentence` to the knowledge. Conjunctions are added part by
+        part, and later additions to them are not seen.
+        """
+        if isinstance(sentence, And):
+            for conjunct in sentence.conjuncts:
+                self.add(conjunct)
+        else:
+            self.solver.add_clause([self.encoder.encode(sentence)])
+
+    def consistent(self):
+        return self.solver.solve()
+
+    def entails(self, query):
+        """Checks if the knowledge entails query."""
+        return not self.solver.solve([-self.encoder.encode(query)])
+
+    def classify(self, symbols):
+        """
+        Returns a Classification of `symbols` (or any sentences) into
+        those the knowledge forces to be true, those it forces to be false
+        and the undetermined rest, each in the order given. If the
+        knowledge is inconsistent, it entails everything, so every symbol
+        is both forced true and forced false.
+
+        One solve finds a model, and each symbol can only be forced to
+        its value there. Each remaining symbol is then checked by solving
+        with it assumed to have the other value: if that fails, it is
+        forced, and is added as a fact for the checks after it; if not,
+        the new model also rules out every other symbol whose value in it
+        differs.
+        """
+        symbols = list(symbols)
+        literals = [self.encoder.encode(symbol) for symbol in symbols]
+        if not self.solver.solve():
+            return Classification(symbols, list(symbols), [])
+
+        # Literal of each symbol true in the first model
+        model = self.solver.model
+        candidates = [
+            literal if model[abs(literal)] == (literal > 0) else -literal
+            for literal in literals
+        ]
+        forced = set()
+        undecided = set(range(len(symbols)))
+        for i in range(len(symbols)):
+            if i not in undecided:
+                continue
+            undecided.discard(i)
+            if self.solver.solve([-candidates[i]]):
+                model = self.solver.model
+                undecided = set(
+                    j for j in undecided
+                    if model[abs(candidates[j])] == (candidates[j] > 0)
+                )
+            else:
+                forced.add(i)
+                self.solver.add_clause([candidates[i]])
+
+        return Classification(
+            [symbols[i] for i in range(len(symbols))
+             if i in forced and candidates[i] == literals[i]],
+            [symbols[i] for i in range(len(symbols))
+             if i in forced and candidates[i] != literals[i]],
+            [symbols[i] for i in range(len(symbols)) if i not in forced]
+        )
+
+
+def entails(knowledge, query):
+    """
+    Checks if knowledge base entails query, as model_check does, by
+    checking that the knowledge base and the negated query cannot both
+    be true.
+    """
+    return KnowledgeBase(knowledge).entails(query)
@@ -0,0 +1,458 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import crawler
+import pagerank
+import personalized
+import solvers
+import sparse
+
+# Sample corpora checked along with random ones
+CORPORA = ["corpus0", "corpus1", "corpus2"]
+
+# Largest L1 distance from the reference ranks accepted by the checks
+ITERATION_ERROR = 1e-5
+SAMPLING_ERROR = 0.1
+
+# Samples taken by the samplers in the checks
+CHECK_SAMPLES = 20000
+
+# Seed sets from which --personalized requires the batch to be faster
+# than solving for them one at a time; fewer are within timing noise
+BATCH_SEEDS = 16
+
+# Runs of each side of that comparison, of which the fastest is kept
+BATCH_RUNS = 3
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the PageRank implementations."
+    )
+    parser.add_argument(
+        "corpus", nargs="?",
+        help="directory of HTML pages; a random corpus is used if omitted"
+    )
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--links", type=int, default=8,
+                        help="average number of links per random page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--check", type=int, default=20, metavar="N",
+        help="also check the engines on the sample corpora and on N small "
+             "random corpora against the original implementations"
+    )
+    parser.add_argument(
+        "--samples", type=int, metavar="N",
+        help="compare the samplers with N samples each instead"
+    )
+    parser.add_argument(
+        "--incremental", type=int, metavar="K",
+        help="compare a warm-started update after changing K pages "
+             "with a cold start"
+    )
+    parser.add_argument(
+        "--personalized", type=int, metavar="K",
+        help="compare personalized ranks for K seeds in one batch with "
+             "solving them one at a time and with local push"
+    )
+    parser.add_argument(
+        "--solvers", action="store_true",
+        help="compare the convergence of the accelerated solvers"
+    )
+    parser.add_argument(
+        "--sparse-only", action="store_true",
+        help="skip the original pure-Python iteration, for large corpora"
+    )
+    args = parser.parse_args()
+
+    check_engines(args.check, args.seed)
+    if args.corpus:
+        corpus = pagerank.crawl(args.corpus)
+    else:
+        corpus = random_corpus(args.pages, args.links, args.seed)
+    links = sum(len(corpus[page]) for page in corpus)
+    print(f"{len(corpus)} pages, {links} links")
+
+    start = time.perf_counter()
+    matrix = sparse.LinkMatrix.from_corpus(corpus)
+    built = time.perf_counter()
+    rank, iterations = sparse.power_iteration(matrix, pagerank.DAMPING)
+    ranks = matrix.to_dict(rank)
+    elapsed = time.perf_counter() - built
+    print(f"  sparse: {built - start:.3f}s to build, "
+          f"{elapsed:.3f}s for {iterations} iterations")
+
+    if args.solvers:
+        benchmark_solvers(matrix, rank)
+        return
+    if args.personalized:
+        benchmark_personalized(matrix, args.personalized, args.seed)
+        return
+    if args.incremental:
+        benchmark_incremental(matrix, rank, args.incremental, args.seed)
+        return
+    if args.samples:
+        benchmark_sampling(
+            corpus, matrix, rank, args.samples, args.sparse_only
+        )
+        return
+    if args.sparse_only:
+        return
+    start = time.perf_counter()
+    expected = reference_iterate_pagerank(corpus, pagerank.DAMPING)
+    print(f"  original iterate_pagerank: {time.perf_counter() - start:.3f}s")
+    difference = max(abs(ranks[page] - expected[page]) for page in corpus)
+    print(f"  largest difference in rank: {difference:.6f}")
+
+
+def check_engines(count, seed):
+    """
+    Checks the PageRank engines against the original implementations on
+    the sample corpora and on `count` small random corpora.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    corpora = [
+        crawler.crawl(os.path.join(directory, name)) for name in CORPORA
+    ]
+    for name in CORPORA:
+        check_crawl_cache(os.path.join(directory, name))
+    corpora.append(star_corpus(50))
+    rng = random.Random(seed)
+    for i in range(count):
+        corpora.append(random_corpus(rng.randint(2, 30), rng.randint(1, 5),
+                                     rng.randrange(2 ** 32)))
+
+    for corpus in corpora:
+        expected = reference_iterate_pagerank(
+            corpus, pagerank.DAMPING, threshold=1e-10
+        )
+        check_close("iterate_pagerank",
+                    pagerank.iterate_pagerank(corpus, pagerank.DAMPING),
+                    expected, ITERATION_ERROR)
+        check_close("sparse.sample_pagerank", sparse.sample_pagerank(
+            corpus, pagerank.DAMPING, CHECK_SAMPLES,
+            seed=rng.randrange(2 ** 32)
+        ), expected, SAMPLING_ERROR)
+        check_update(corpus, rng)
+        check_personalized(corpus, expected, rng)
+        check_solvers(corpus, expected)
+    print(f"{len(corpora)} corpora agree with the original implementations")
+
+
+def check_crawl_cache(directory):
+    """
+    Checks that crawling a copy of a corpus with its links saved gives
+    the same corpus as crawling it afresh, before and after a page is
+    added and a page is changed.
+    """
+    with tempfile.TemporaryDirectory() as temporary:
+        copy = os.path.join(temporary, "corpus")
+        shutil.copytree(directory, copy,
+                        ignore=shutil.ignore_patterns(crawler.LINKS))
+        for change in range(2):
+            if change:
+                pages = crawler.find_pages(copy)
+                with open(os.path.join(copy, pages[0]), "a") as f:
+                    f.write(f'<a href="{pages[-1]}">changed</a>')
+                with open(os.path.join(copy, "added.html"), "w") as f:
+                    f.write(f'<a href="{pages[0]}">added</a>')
+            expected = crawler.crawl(copy)
+            for _ in range(2):
+                if crawler.crawl(copy, cache=True) != expected:
+                    raise AssertionError(
+                        f"cached crawl of {directory} differs"
+                    )
+
+
+def check_update(corpus, rng):
+    """
+    Checks that updating the ranks of `corpus` after relinking, adding
+    and removing pages agrees with ranking the changed corpus afresh.
+    """
+    pages = sorted(corpus)
+    changes = {}
+    for page in rng.sample(pages, min(3, len(pages))):
+        changes[page] = set(rng.sample(pages, rng.randint(0, len(pages))))
+    changes["added.html"] = set(rng.sample(pages, 1))
+    changes[rng.choice(pages)] = None
+
+    changed = {
+        page: set(links) for page, links in corpus.items()
+        if changes.get(page, links) is not None
+    }
+    for page, links in changes.items():
+        if links is not None:
+            changed[page] = set(links)
+    for page in changed:
+        changed[page] = (changed[page] & set(changed)) - {page}
+
+    matrix = sparse.LinkMatrix.from_corpus(corpus)
+    rank, _ = sparse.power_iteration(matrix, pagerank.DAMPING)
+    update = sparse.update_ranks(matrix, rank, pagerank.DAMPING, changes)
+    expected = reference_iterate_pagerank(
+        changed, pagerank.DAMPING, threshold=1e-10
+    )
+    check_close("sparse.update_ranks", update.matrix.to_dict(update.rank),
+                expected, ITERATION_ERROR)
+
+
+def check_personalized(corpus, expected, rng):
+    """
+    Checks batched personalized ranks for random seed sets against
+    solving for each seed set directly, and that seeding every page
+    gives the reference ranks `expected`. Also checks that local push
+    underestimates the ranks of one seed by at most its residual bound.
+    """
+    matrix = sparse.LinkMatrix.from_corpus(corpus)
+    n = len(matrix)
+    seed_sets = [matrix.pages]
+    seed_sets += [rng.sample(matrix.pages, rng.randint(1, n))
+                  for _ in range(3)]
+    ranks, _ = personalized.personalized_pagerank(
+        matrix, seed_sets, pagerank.DAMPING, tolerance=1e-10
+    )
+    check_close("personalized_pagerank", matrix.to_dict(ranks[0]),
+                expected, ITERATION_ERROR)
+
+    # The ranks of each seed set solve (I - d (M + t g)) r = (1 - d) t,
+    # where t is its teleport vector and g marks the dangling pages
+    links = np.zeros((n, n))
+    np.add.at(links, (matrix.targets, matrix.sources), matrix.weights)
+    teleport = personalized.teleport_matrix(matrix, seed_sets)
+    for row, t in zip(ranks, teleport):
+        system = np.eye(n) - pagerank.DAMPING * (
+            links + np.outer(t, matrix.dangling)
+        )
+        exact = np.linalg.solve(system, (1 - pagerank.DAMPING) * t)
+        check_close("personalized_pagerank", matrix.to_dict(row),
+                    matrix.to_dict(exact), ITERATION_ERROR)
+
+    seed = seed_sets[1][0]
+    local = personalized.local_pagerank(matrix, seed, pagerank.DAMPING)
+    single, _ = personalized.personalized_pagerank(
+        matrix, [[seed]], pagerank.DAMPING, tolerance=1e-10
+    )
+    exact = matrix.to_dict(single[0])
+    bound = personalized.EPSILON * (len(matrix.targets) + n)
+    missing = sum(exact.values()) - sum(local.values())
+    if (any(local[page] > exact[page] + 1e-9 for page in local)
+            or missing > bound):
+        raise AssertionError(f"local_pagerank of {seed} is outside its "
+                             f"bound, missing {missing:.2e}")
+
+
+def check_solvers(corpus, expected):
+    """
+    Checks that every solver reaches the reference ranks `expected`.
+    """
+    matrix = sparse.LinkMatrix.from_corpus(corpus)
+    for method in solvers.METHODS:
+        solved, report = solvers.solve(matrix, pagerank.DAMPING, method)
+        check_close(f"solvers.solve with {method}", matrix.to_dict(solved),
+                    expected, ITERATION_ERROR)
+
+
+def check_close(label, ranks, expected, tolerance):
+    """
+    Raises AssertionError if the ranks `ranks` of a corpus are further
+    than `tolerance` from `expected` in L1 distance.
+    """
+    error = sum(abs(ranks[page] - expected[page]) for page in expected)
+    if error > tolerance:
+        raise AssertionError(
+            f"{label} is {error:.2e} from the reference ranks in L1"
+        )
+
+
+def benchmark_sampling(corpus, matrix, rank, samples, sparse_only):
+    """
+    Times the samplers and prints the L1 error of their estimates
+    against the power-iteration ranks `rank` of `matrix`.
+    """
+    samplers = [("vectorized", sparse.sample_pagerank)]
+    if not sparse_only:
+        samplers.append(("sample_pagerank", pagerank.sample_pagerank))
+    for label, sample in samplers:
+        start = time.perf_counter()
+        ranks = sample(corpus, pagerank.DAMPING, samples)
+        elapsed = time.perf_counter() - start
+        error = sum(
+            abs(ranks[page] - rank[matrix.index[page]]) for page in corpus
+        )
+        print(f"  {label}: {elapsed:.3f}s, L1 error {error:.4f}")
+
+
+def benchmark_incremental(matrix, rank, count, seed):
+    """
+    Relinks `count` random pages, adds and removes a page, and compares
+    re-converging from `rank` with starting over.
+    """
+    rng = random.Random(seed)
+    pages = matrix.pages
+    changes = {}
+    for page in rng.sample(pages, min(count, len(pages))):
+        changes[page] = set(rng.sample(pages, min(8, len(pages))))
+    changes["new.html"] = set(rng.sample(pages, 1))
+    changes[pages[0]] = None
+
+    start = time.perf_counter()
+    update = sparse.update_ranks(matrix, rank, pagerank.DAMPING, changes)
+    elapsed = time.perf_counter() - start
+    print(f"  warm start: {update.iterations} iterations, {elapsed:.3f}s")
+
+    start = time.perf_counter()
+    cold, iterations = sparse.power_iteration(update.matrix, pagerank.DAMPING)
+    elapsed = time.perf_counter() - start
+    print(f"  cold start: {iterations} iterations, {elapsed:.3f}s")
+    print(f"  largest difference in rank: "
+          f"{np.abs(update.rank - cold).max():.2e}")
+
+
+def benchmark_personalized(matrix, count, seed):
+    """
+    Times personalized ranks for `count` random single-page seeds, batched
+    and one at a time, and the local push approximation for the first.
+    Fails if there are at least BATCH_SEEDS seeds and the fastest of
+    BATCH_RUNS batches is not faster than the fastest of as many loops,
+    or if the push touches more pages than EPSILON allows.
+    """
+    rng = random.Random(seed)
+    seeds = [[page] for page in rng.sample(matrix.pages, count)]
+
+    batched = []
+    for run in range(BATCH_RUNS):
+        start = time.perf_counter()
+        ranks, iterations = personalized.personalized_pagerank(
+            matrix, seeds, pagerank.DAMPING
+        )
+        batched.append(time.perf_counter() - start)
+    print(f"  batched: {iterations} iterations, {min(batched):.3f}s")
+
+    single = []
+    for run in range(BATCH_RUNS):
+        start = time.perf_counter()
+        teleport = personalized.teleport_matrix(matrix, seeds)
+        for row in teleport:
+            single_pagerank(matrix, row, pagerank.DAMPING)
+        single.append(time.perf_counter() - start)
+    print(f"  one at a time: {min(single):.3f}s")
+    if count >= BATCH_SEEDS and min(batched) >= min(single):
+        raise AssertionError("batched personalized ranks are not faster "
+                             "than solving one seed set at a time")
+
+    start = time.perf_counter()
+    local = personalized.local_pagerank(matrix, seeds[0][0], pagerank.DAMPING)
+    elapsed = time.perf_counter() - start
+    error = ranks[0].sum() - sum(local.values())
+    print(f"  local push: {len(local)} of {len(matrix)} pages touched, "
+          f"{elapsed:.3f}s, L1 error {error:.4f}")
+    if len(local) > 1 / ((1 - pagerank.DAMPING) * personalized.EPSILON):
+        raise AssertionError("local push touched more pages than its "
+                             "bound for EPSILON")
+
+
+def single_pagerank(matrix, teleport, damping_factor,
+                    tolerance=sparse.TOLERANCE):
+    """
+    Returns the personalized ranks for one teleport vector by power
+    iteration with LinkMatrix.multiply, as the fastest way to solve for
+    seed sets one at a time.
+    """
+    rank = teleport.copy()
+    for _ in range(sparse.MAX_ITERATIONS):
+        stranded = rank[matrix.dangling].sum()
+        updated = (
+            damping_factor * (matrix.multiply(rank) + teleport * stranded)
+            + (1 - damping_factor) * teleport
+        )
+        difference = np.abs(updated - rank).sum()
+        rank = updated
+        if difference <= tolerance:
+            break
+    return rank
+
+
+def benchmark_solvers(matrix, rank):
+    """
+    Prints the convergence report of every solver and its L1 distance
+    from the power-iteration ranks `rank`.
+    """
+    for method in solvers.METHODS:
+        solved, report = solvers.solve(matrix, pagerank.DAMPING, method)
+        print(f"  {report}, L1 difference {np.abs(solved - rank).sum():.2e}")
+
+
+def star_corpus(pages):
+    """
+    Returns a corpus in which one page links to every other page and they
+    all link back to it, whose ranks are far from uniform.
+    """
+    names = [f"{i}.html" for i in range(pages)]
+    corpus = {name: {names[0]} for name in names[1:]}
+    corpus[names[0]] = set(names[1:])
+    return corpus
+
+
+def reference_iterate_pagerank(corpus, damping_factor, threshold=0.001):
+    """
+    Return PageRank values for each page by updating them in place, one
+    page at a time, until no value changes by more than `threshold`, as
+    pagerank.iterate_pagerank did before it used the sparse engine.
+    """
+    page_rank = dict()
+    for pg in corpus:
+        page_rank[pg] = 1.0/len(corpus)
+
+    page_rank, difference = reference_update_rank(
+        corpus, page_rank, damping_factor
+    )
+    while difference > threshold:
+        page_rank, difference = reference_update_rank(
+            corpus, page_rank, damping_factor
+        )
+    return page_rank
+
+
+def reference_update_rank(corpus, page_rank, damping_factor):
+    d = damping_factor
+    max_diff = 0
+    damping_value = (1-d)/len(corpus)
+    for page in list(page_rank):
+        new_value = damping_value
+        for key, links in corpus.items():
+            if page in links:
+                new_value += d*(page_rank[key]/len(links))
+            elif not links:
+                new_value += d*(page_rank[key]/len(corpus))
+        diff = abs(new_value - page_rank[page])
+        if diff > max_diff:
+            max_diff = diff
+        page_rank[page] = new_value
+
+    return page_rank, max_diff
+
+
+def random_corpus(pages, links, seed):
+    """
+    Returns a corpus of `pages` pages named like HTML files, each linking
+    to a random number of other pages averaging `links`, with some
+    pages linking nowhere.
+    """
+    rng = random.Random(seed)
+    names = [f"{i}.html" for i in range(pages)]
+    corpus = {}
+    for name in names:
+        count = min(int(rng.expovariate(1 / links)), pages - 1)
+        corpus[name] = set(rng.sample(names, count)) - {name}
+    return corpus
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import array
+import json
+import os
+import posixpath
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Links found in each page, saved in the corpus directory
+LINKS = "pagerank.links"
+LINKS_MAGIC = b"PAGELINK"
+LINKS_VERSION = 1
+
+# Characters of HTML read from a page at a time
+CHUNK_SIZE = 65536
+
+# Files parsed at once
+WORKERS = 8
+
+# The href of an <a> tag, in either kind of quotes
+LINK = re.compile(
+    r"<a\s+(?:[^>]*?)href\s*=\s*(?:\"([^\"]*)\"|'([^']*)')", re.IGNORECASE
+)
+
+
+def find_pages(directory):
+    """
+    Returns the path of every .html file under `directory`, relative to
+    it and with / separators, so pages at the top level keep their
+    plain filenames.
+    """
+    pages = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith(".html"):
+                path = os.path.relpath(os.path.join(root, filename), directory)
+                pages.append(path.replace(os.sep, "/"))
+    return pages
+
+
+def iter_links(directory, page):
+    """
+    Yields the links in `page` as they are found, reading the file in
+    chunks. Relative links are resolved against the page's directory,
+    and links starting with / against `directory`.
+    """
+    base = posixpath.dirname(page)
+    pending = ""
+    with open(os.path.join(directory, page), encoding="utf-8",
+              errors="replace") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            text = pending + chunk
+
+            # Hold back a tag that may continue in the next chunk
+            end = len(text) if not chunk else text.rfind(">") + 1
+            for match in LINK.finditer(text, 0, end):
+                yield resolve(base, match.group(1) or match.group(2) or "")
+            pending = text[end:]
+            if not chunk:
+                return
+
+
+def resolve(base, link):
+    """
+    Returns `link` as a path relative to the corpus directory, if it is
+    a relative or root-relative link, or unchanged otherwise.
+    """
+    if ":" in link or link.startswith("#"):
+        return link
+    link = link.split("#")[0].split("?")[0]
+    if link.startswith("/"):
+        return posixpath.normpath(link.lstrip("/"))
+    return posixpath.normpath(posixpath.join(base, link))
+
+
+def stamp(directory, page):
+    """
+    Returns the size and modification time of a page, which change
+    whenever it is edited.
+    """
+    info = os.stat(os.path.join(directory, page))
+    return [info.st_size, info.st_mtime_ns]
+
+
+def crawl_links(directory, pages, workers=WORKERS):
+    """
+    Yields a (page, links) pair for each of `pages` as soon as it has
+    been parsed, parsing `workers` files at once.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(list, iter_links(directory, page)): page
+            for page in pages
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def crawl(directory, workers=WORKERS, cache=False):
+    """
+    Parse every HTML page under `directory` for links to other pages.
+    Return a dictionary where each key is a page, and values are
+    the set of other pages in the corpus that are linked to by the page.
+
+    With `cache`, the links of each page are saved in the directory, and
+    only pages that were added or changed since are parsed.
+    """
+    pages = find_pages(directory)
+    stamps = {page: stamp(directory, page) for page in pages}
+    path = os.path.join(directory, LINKS)
+
+    links = {}
+    saved_stamps = {}
+    if cache:
+        saved_stamps, saved_links = read_links(path)
+        for page in pages:
+            if saved_stamps.get(page) == stamps[page]:
+                links[page] = saved_links[page]
+
+    changed = [page for page in pages if page not in links]
+    for page, page_links in crawl_links(directory, changed, workers):
+        links[page] = page_links
+
+    # Save the links again if pages were added, changed or removed
+    if cache and (changed or len(saved_stamps) != len(pages)):
+        try:
+            write_links(path, stamps, links)
+        except OSError:
+            pass
+
+    # Only include links to other pages in the corpus
+    return {
+        page: set(link for link in links[page] if link in links) - {page}
+        for page in pages
+    }
+
+
+def write_links(path, stamps, links):
+    """
+    Write the links of each page to `path`: a JSON header holding the
+    pages, their stamps and the distinct link targets, followed by CSR
+    arrays of offsets into the links and the index of each link target.
+    """
+    pages = sorted(links)
+    strings = {}
+    offsets = array.array("i", [0])
+    targets = array.array("i")
+    for page in pages:
+        for link in links[page]:
+            targets.append(strings.setdefault(link, len(strings)))
+        offsets.append(len(targets))
+    header = json.dumps({
+        "version": LINKS_VERSION,
+        "pages": pages,
+        "stamps": [stamps[page] for page in pages],
+        "strings": list(strings),
+        "links": len(targets)
+    }).encode("utf-8")
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(LINKS_MAGIC + struct.pack("<I", len(header)) + header)
+        offsets.tofile(f)
+        targets.tofile(f)
+    os.replace(temporary, path)
+
+
+def read_links(path):
+    """
+    Read the saved links from `path`, returning dictionaries of each
+    page's stamp and links, which are empty if there are none.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return {}, {}
+    with f:
+        if f.read(len(LINKS_MAGIC)) != LINKS_MAGIC:
+            return {}, {}
+        length, = struct.unpack("<I", f.read(4))
+        try:
+            header = json.loads(f.read(length))
+        except ValueError:
+            return {}, {}
+        if header.get("version") != LINKS_VERSION:
+            return {}, {}
+        offsets = array.array("i")
+        targets = array.array("i")
+        try:
+            offsets.fromfile(f, len(header["pages"]) + 1)
+            targets.fromfile(f, header["links"])
+        except EOFError:
+            return {}, {}
+
+    strings = header["strings"]
+    stamps = {}
+    links = {}
+    for i, page in enumerate(header["pages"]):
+        stamps[page] = header["stamps"][i]
+        links[page] = [strings[t] for t in targets[offsets[i]:offsets[i + 1]]]
+    return stamps, links
@@ -1,17 +1,23 @@
-import os
+import argparse
 import random
-import re
-import sys
-import copy
+
+import crawler
+import sparse
 
 DAMPING = 0.85
 SAMPLES = 10000
 
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Rank the pages of a corpus.")
+    parser.add_argument("corpus", help="directory of HTML pages")
+    parser.add_argument(
+        "--cache", action="store_true",
+        help=f"save the links found in {crawler.LINKS} in the corpus, and "
+             "only parse pages changed since the last run"
+    )
+    args = parser.parse_args()
+    corpus = crawl(args.corpus, args.cache)
     ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
     print(f"PageRank Results from Sampling (n = {SAMPLES})")
     for page in sorted(ranks):
@@ -22,31 +28,17 @@ def main():
         print(f"  {page}: {ranks[page]:.4f}")
 
 
-def crawl(directory):
+def crawl(directory, cache=False):
     """
     Parse a directory of HTML pages and check for links to other pages.
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
-    """
-    pages = dict()
-
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".html"):
-            continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
-
-    # Only include links to other pages in the corpus
-    for filename in pages:
-        pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
-        )
 
-    return pages
+    Pages in subdirectories are included, named by their path relative
+    to `directory`. With `cache`, links are saved in the directory so
+    that unchanged pages are not parsed again.
+    """
+    return crawler.crawl(directory, cache=cache)
 
 
 def transition_model(corpus, page, damping_factor):
@@ -89,20 +81,23 @@ def sample_pagerank(corpus, damping_factor, n):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    current_page = random.choice(list(corpus.keys()))
-    page_rank = dict()
-    for pg in corpus:
-        page_rank[pg] = 0
-
-    sample_num = n
-
-    while n > 0:
-        proba = transition_model(corpus, current_page, damping_factor)
-        current_page = random.choices(list(proba.keys()), weights=list(proba.values()), k=1)[0]
-        page_rank[current_page] += 1/sample_num
-        n -= 1
-    print(proba)
-
+    # Each step is drawn in two stages, which matches transition_model:
+    # with probability `damping_factor` follow a random link of the page,
+    # and otherwise (or if it has no links) go to a random page
+    pages = list(corpus)
+    links = {page: list(corpus[page]) for page in corpus}
+    page_rank = dict.fromkeys(pages, 0)
+
+    current_page = random.choice(pages)
+    for _ in range(n):
+        if links[current_page] and random.random() < damping_factor:
+            current_page = random.choice(links[current_page])
+        else:
+            current_page = random.choice(pages)
+        page_rank[current_page] += 1
+
+    for pg in page_rank:
+        page_rank[pg] /= n
     return page_rank
 
 
@@ -114,36 +109,10 @@ def iterate_pagerank(corpus, damping_factor):
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
-    """
-    page_rank = dict()
-    # corpus = {'1': {'2'}, '2': {'1', '3'}, '3': {'2', '5', '4'}, '4': {'2', '1'}, '5': set()}
-    for pg in corpus:
-        page_rank[pg] = 1.0/len(corpus)
 
-    page_rank, difference = update_rank(corpus, page_rank, damping_factor)
-    while difference > 0.001:
-        page_rank, difference = update_rank(corpus, page_rank, damping_factor)
-    return page_rank
-
-
-def update_rank(corpus, page_rank, damping_factor):
-    d = damping_factor
-    max_diff = 0
-    rank = copy.deepcopy(page_rank)
-    damping_value = (1-d)/len(corpus)
-    for page in rank:
-        new_value = damping_value
-        for key, links in corpus.items():
-            if page in links:
-                new_value += d*(page_rank[key]/len(links))
-            elif not links:
-                new_value += d*(page_rank[key]/len(corpus))
-        diff = abs(new_value - page_rank[page])
-        if diff > max_diff:
-            max_diff = diff
-        page_rank[page] = new_value
-
-    return page_rank, max_diff
+    Iterates over the sparse link matrix of the corpus; see sparse.py.
+    """
+    return sparse.iterate_pagerank(corpus, damping_factor)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+from collections import deque
+from collections.abc import Mapping
+
+import numpy as np
+
+from sparse import MAX_ITERATIONS, TOLERANCE, BatchProduct
+
+# Default residual per link left unpushed by local_pagerank, which bounds
+# the pages it touches regardless of the size of the corpus
+EPSILON = 1e-4
+
+
+def teleport_matrix(matrix, seed_sets):
+    """
+    Returns a matrix with one teleport vector per seed set as rows.
+
+    A seed set is either a collection of pages, which are teleported to
+    equally, or a mapping of pages to weights, for topic-sensitive ranks.
+    Each row is normalized to sum to 1.
+    """
+    teleport = np.zeros((len(seed_sets), len(matrix)))
+    for i, seeds in enumerate(seed_sets):
+        if not isinstance(seeds, Mapping):
+            seeds = dict.fromkeys(seeds, 1.0)
+        for page, weight in seeds.items():
+            teleport[i, matrix.index[page]] = weight
+        total = teleport[i].sum()
+        if total <= 0:
+            raise ValueError(f"seed set {i} has no weight")
+        teleport[i] /= total
+    return teleport
+
+
+def personalized_pagerank(matrix, seed_sets, damping_factor,
+                          tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """
+    Returns the personalized PageRank of every page for each seed set in
+    `seed_sets`, as a matrix with one row per seed set, and the number
+    of iterations taken.
+
+    The random surfer of each row jumps to its seed set instead of to
+    any page, including from dangling pages. All rows are iterated
+    together, each until its L1 change is within `tolerance`.
+    """
+    teleport = teleport_matrix(matrix, seed_sets)
+    ranks = teleport.copy()
+    product = BatchProduct(matrix)
+
+    # Seed sets still changing by more than `tolerance`, with their ranks
+    # and teleport vectors as columns
+    active = np.arange(len(ranks))
+    current = np.ascontiguousarray(teleport.T)
+    jump = current.copy()
+    dangling = matrix.dangling.astype(float)
+    for iteration in range(1, max_iterations + 1):
+        # Rank left on dangling pages jumps to the seeds with the rest
+        stranded = dangling @ current
+        updated = product.multiply(current)
+        updated *= damping_factor
+        updated += jump * (damping_factor * stranded + 1 - damping_factor)
+
+        # The previous ranks are no longer needed after the difference
+        np.subtract(updated, current, out=current)
+        difference = np.abs(current, out=current).sum(axis=0)
+        current = updated
+
+        # Drop the columns of converged seed sets
+        converged = difference <= tolerance
+        if converged.any():
+            ranks[active[converged]] = current[:, converged].T
+            active = active[~converged]
+            current = np.ascontiguousarray(current[:, ~converged])
+            jump = np.ascontiguousarray(jump[:, ~converged])
+            if not len(active):
+                break
+    ranks[active] = current.T
+    return ranks, iteration
+
+
+def local_pagerank(matrix, seed, damping_factor, epsilon=EPSILON):
+    """
+    Returns an approximate personalized PageRank for the single page
+    `seed`, as a dictionary of only the pages it reached.
+
+    Uses the push algorithm of Andersen, Chung and Lang: residual
+    probability starts at the seed, and any page holding more than
+    `epsilon` per link keeps 1 - `damping_factor` of it as rank and pushes
+    the rest evenly along its links, or back to the seed if it has none.
+    Estimates never exceed the exact ranks, the residual left unpushed at
+    each page is at most `epsilon` per link, and the links of the pages
+    pushed from total at most 1 / ((1 - `damping_factor`) * `epsilon`),
+    so only the seed's neighborhood is touched.
+    """
+    offsets = matrix.offsets
+    targets = matrix.targets
+    source = matrix.index[seed]
+
+    rank = {}
+    residual = {source: 1.0}
+    queue = deque([source])
+    queued = {source}
+    while queue:
+        page = queue.popleft()
+        queued.discard(page)
+        mass = residual.pop(page)
+        rank[page] = rank.get(page, 0.0) + (1 - damping_factor) * mass
+
+        links = targets[offsets[page]:offsets[page + 1]].tolist() or [source]
+        share = damping_factor * mass / len(links)
+        for link in links:
+            residual[link] = residual.get(link, 0.0) + share
+            degree = max(int(offsets[link + 1] - offsets[link]), 1)
+            if residual[link] > epsilon * degree and link not in queued:
+                queue.append(link)
+                queued.add(link)
+
+    return {matrix.pages[page]: value for page, value in rank.items()}
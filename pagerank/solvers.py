@@ -0,0 +1,203 @@
+import time
+
+import numpy as np
+
+from sparse import MAX_ITERATIONS, TOLERANCE
+
+# Power iterations between extrapolation steps
+EXTRAPOLATION_PERIOD = 10
+
+# Groups of pages updated one after another by Gauss-Seidel sweeps
+BLOCKS = 32
+
+# Iterations whose residuals are averaged into the convergence rate
+RATE_WINDOW = 10
+
+
+class ConvergenceReport():
+    """
+    Residual (L1 change from the previous iterate) and time taken by
+    every iteration of a solver.
+    """
+
+    def __init__(self, method, tolerance, max_iterations):
+        self.method = method
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.residuals = []
+        self.times = []
+
+    def record(self, residual, elapsed):
+        self.residuals.append(residual)
+        self.times.append(elapsed)
+
+    def iterations(self):
+        return len(self.residuals)
+
+    def converged(self):
+        return bool(self.residuals) and self.residuals[-1] <= self.tolerance
+
+    def elapsed(self):
+        return sum(self.times)
+
+    def rate(self):
+        """
+        Returns the average factor by which the residual shrank per
+        iteration over the last RATE_WINDOW iterations, or None if there
+        are too few. Rates close to 1 mean slow convergence.
+        """
+        residuals = [r for r in self.residuals[-RATE_WINDOW - 1:] if r > 0]
+        if len(residuals) < 2:
+            return None
+        return (residuals[-1] / residuals[0]) ** (1 / (len(residuals) - 1))
+
+    def __str__(self):
+        status = "converged" if self.converged() else "did not converge"
+        line = (f"{self.method}: {status} in {self.iterations()} iterations "
+                f"({self.elapsed():.3f}s)")
+        if self.residuals:
+            line += f", residual {self.residuals[-1]:.2e}"
+        rate = self.rate()
+        if rate is not None:
+            line += f", rate {rate:.3f}"
+        return line
+
+
+class IncomingLinks():
+    """
+    Links of a LinkMatrix ordered by target page, split into `blocks`
+    ranges of pages for Gauss-Seidel sweeps.
+    """
+
+    def __init__(self, matrix, blocks=BLOCKS):
+        order = np.argsort(matrix.targets, kind="stable")
+        self.sources = matrix.sources[order]
+        self.targets = matrix.targets[order]
+        self.weights = matrix.weights[order]
+        self.bounds = np.linspace(
+            0, len(matrix), min(blocks, len(matrix)) + 1
+        ).astype(np.int64)
+        self.link_bounds = np.searchsorted(self.targets, self.bounds)
+
+
+def gauss_seidel_sweep(matrix, incoming, rank, damping_factor):
+    """
+    Returns the rank vector after one Gauss-Seidel sweep, which updates
+    the pages block by block, each block using the ranks already updated
+    earlier in the sweep.
+    """
+    n = len(matrix)
+    rank = rank.copy()
+    stranded = rank[matrix.dangling].sum()
+    for b in range(len(incoming.bounds) - 1):
+        low, high = incoming.bounds[b], incoming.bounds[b + 1]
+        links = slice(incoming.link_bounds[b], incoming.link_bounds[b + 1])
+        linked = np.bincount(
+            incoming.targets[links] - low,
+            weights=rank[incoming.sources[links]] * incoming.weights[links],
+            minlength=high - low
+        )
+        updated = (damping_factor * (linked + stranded / n)
+                   + (1 - damping_factor) / n)
+        dangling = matrix.dangling[low:high]
+        stranded += (updated[dangling] - rank[low:high][dangling]).sum()
+        rank[low:high] = updated
+    return rank / rank.sum()
+
+
+def aitken(history):
+    """
+    Returns Aitken's delta-squared extrapolation of the last three
+    iterates, computed page by page, keeping the last iterate wherever
+    the second difference vanishes.
+    """
+    x0, x1, x2 = history[-3:]
+    second = x2 - 2 * x1 + x0
+    safe = np.abs(second) > 1e-15
+    extrapolated = x2.copy()
+    extrapolated[safe] -= (x2 - x1)[safe] ** 2 / second[safe]
+    return normalize(extrapolated, x2)
+
+
+def quadratic(history):
+    """
+    Returns the quadratic extrapolation of Kamvar et al. from the last
+    four iterates, which removes the two largest non-principal
+    eigenvector components on the assumption that they dominate the error.
+    """
+    x0, x1, x2, x3 = history[-4:]
+    y = np.stack([x1 - x0, x2 - x0], axis=1)
+    gamma, *_ = np.linalg.lstsq(y, -(x3 - x0), rcond=None)
+    gamma = np.append(gamma, 1.0)
+    beta = [gamma.sum(), gamma[1:].sum(), gamma[2]]
+    extrapolated = beta[0] * x1 + beta[1] * x2 + beta[2] * x3
+    return normalize(extrapolated, x3)
+
+
+def normalize(rank, fallback):
+    """
+    Returns `rank` without negative entries and rescaled to sum to 1,
+    or `fallback` if nothing is left.
+    """
+    rank = np.maximum(rank, 0)
+    total = rank.sum()
+    if not np.isfinite(total) or total <= 0:
+        return fallback
+    return rank / total
+
+
+# Extrapolation of each method and the iterates it needs
+EXTRAPOLATIONS = {
+    "aitken": (aitken, 3),
+    "quadratic": (quadratic, 4)
+}
+
+METHODS = ["power", "gauss-seidel"] + list(EXTRAPOLATIONS)
+
+
+def solve(matrix, damping_factor, method="power", tolerance=TOLERANCE,
+          max_iterations=MAX_ITERATIONS, callback=None):
+    """
+    Returns the PageRank vector of a LinkMatrix and a ConvergenceReport,
+    iterating with `method` until the L1 change is within `tolerance`.
+
+    "power" is plain power iteration, "gauss-seidel" sweeps pages in
+    place, and "aitken" and "quadratic" are power iteration extrapolated
+    every EXTRAPOLATION_PERIOD iterations.
+
+    `callback(iteration, residual, elapsed)`, if given, is called after
+    every iteration with its residual and time in seconds.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown method: {method}")
+    if method == "gauss-seidel":
+        incoming = IncomingLinks(matrix)
+    extrapolate, needed = EXTRAPOLATIONS.get(method, (None, 0))
+
+    report = ConvergenceReport(method, tolerance, max_iterations)
+    n = len(matrix)
+    rank = np.full(n, 1.0 / n)
+    history = [rank]
+    for iteration in range(1, max_iterations + 1):
+        start = time.perf_counter()
+        if method == "gauss-seidel":
+            updated = gauss_seidel_sweep(matrix, incoming, rank,
+                                         damping_factor)
+        else:
+            updated = matrix.step(rank, damping_factor)
+        if extrapolate is not None:
+            history = history[-needed + 1:] + [updated]
+            if (iteration % EXTRAPOLATION_PERIOD == 0
+                    and len(history) == needed):
+                updated = extrapolate(history)
+                history = [updated]
+        residual = float(np.abs(updated - rank).sum())
+        rank = updated
+        elapsed = time.perf_counter() - start
+
+        report.record(residual, elapsed)
+        if callback is not None:
+            callback(iteration, residual, elapsed)
+        if residual <= tolerance:
+            break
+    return rank, report
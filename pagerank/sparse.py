@@ -0,0 +1,342 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Default L1 distance between successive rank vectors at convergence
+TOLERANCE = 1e-6
+
+# Give up on converging after this many iterations
+MAX_ITERATIONS = 1000
+
+# Values (links times rank vectors) gathered at once by BatchProduct,
+# which keeps its temporary arrays small enough to stay in cache
+PRODUCT_SIZE = 1 << 16
+
+# Random surfers advanced together by sample_ranks
+SURFERS = 10000
+
+# Steps every surfer takes before their positions are counted, so that
+# they forget their uniform start: its weight shrinks by the damping
+# factor each step, to 0.85 ** 50 < 1e-3
+BURN_IN = 50
+
+# Result of update_ranks: the updated LinkMatrix, its PageRank vector,
+# and the number of iterations taken to re-converge
+Update = namedtuple("Update", ["matrix", "rank", "iterations"])
+
+
+class LinkMatrix():
+    """
+    Sparse column-stochastic link matrix of a corpus, stored as the
+    source and target page index of every link, ordered by source so
+    that the links of page `j` are `targets[offsets[j]:offsets[j + 1]]`.
+
+    Column `j` holds 1 / outdegree(j) for each page that page `j`
+    links to. Pages without links (dangling pages) have empty columns;
+    their rank is spread evenly over every page by `step`.
+    """
+
+    def __init__(self, pages, sources, targets):
+        self.pages = pages
+        self.index = {page: i for i, page in enumerate(pages)}
+        order = np.argsort(sources, kind="stable")
+        self.sources = sources[order]
+        self.targets = targets[order]
+        self.outdegree = np.bincount(sources, minlength=len(pages))
+        self.offsets = np.concatenate(([0], np.cumsum(self.outdegree)))
+        self.dangling = self.outdegree == 0
+
+        # Weight of each link in its source's column
+        self.weights = 1.0 / self.outdegree[self.sources]
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Builds the link matrix of a corpus as returned by `crawl`.
+        """
+        pages = sorted(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+        counts = np.fromiter(
+            (len(corpus[page]) for page in pages), np.int64, len(pages)
+        )
+        sources = np.repeat(np.arange(len(pages), dtype=np.int32), counts)
+        targets = np.fromiter(
+            (index[link] for page in pages for link in corpus[page]),
+            np.int32, int(counts.sum())
+        )
+        return cls(pages, sources, targets)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def update(self, changes):
+        """
+        Returns a new LinkMatrix with `changes` applied, where `changes`
+        maps each added or changed page to its new set of links, and each
+        removed page to None. Added pages come after the existing ones.
+
+        Links to pages not in the updated corpus are dropped, so pages
+        that newly link to an added page must be listed as changed too.
+        """
+        removed = np.zeros(len(self.pages), bool)
+        removed[[self.index[page] for page in changes
+                 if changes[page] is None and page in self.index]] = True
+        added = [page for page in changes
+                 if changes[page] is not None and page not in self.index]
+        pages = [page for page, gone in zip(self.pages, removed) if not gone]
+        pages += added
+
+        # Old index of each page to its new index, or -1 if removed
+        renumber = np.full(len(self.pages), -1, np.int64)
+        kept = np.flatnonzero(~removed)
+        renumber[kept] = np.arange(len(kept))
+        index = {page: len(kept) + i for i, page in enumerate(added)}
+
+        def new_index(page):
+            if page in self.index:
+                return renumber[self.index[page]]
+            return index.get(page, -1)
+
+        # Keep the links of unchanged pages to pages that still exist
+        relinked = np.zeros(len(self.pages), bool)
+        relinked[[self.index[page] for page in changes
+                  if page in self.index]] = True
+        keep = ~relinked[self.sources] & (renumber[self.targets] >= 0)
+        sources = [renumber[self.sources[keep]]]
+        targets = [renumber[self.targets[keep]]]
+
+        for page, links in changes.items():
+            if links is None:
+                continue
+            linked = sorted(
+                i for i in map(new_index, set(links) - {page}) if i >= 0
+            )
+            sources.append(np.full(len(linked), new_index(page), np.int64))
+            targets.append(np.array(linked, np.int64))
+        return LinkMatrix(
+            pages, np.concatenate(sources).astype(np.int32),
+            np.concatenate(targets).astype(np.int32)
+        )
+
+    def multiply(self, rank):
+        """
+        Returns the product of the link matrix and the vector `rank`.
+        """
+        return np.bincount(
+            self.targets, weights=rank[self.sources] * self.weights,
+            minlength=len(self.pages)
+        )
+
+    def step(self, rank, damping_factor):
+        """
+        Returns the rank vector after one step of the random surfer,
+        who follows a link with probability `damping_factor` and jumps to
+        a random page otherwise, or always from a dangling page.
+        """
+        n = len(self.pages)
+        spread = rank[self.dangling].sum() / n
+        return (damping_factor * (self.multiply(rank) + spread)
+                + (1 - damping_factor) / n)
+
+    def to_dict(self, rank):
+        """
+        Returns a rank vector as a dictionary of page names to ranks.
+        """
+        return dict(zip(self.pages, rank.tolist()))
+
+
+def stable_order(keys):
+    """
+    Returns the indices that sort an array of non-negative integers below
+    2 ** 32, keeping equal keys in order. Sorts by the low and then the
+    high 16 bits, for which NumPy uses radix sort, several times faster
+    than sorting the keys whole.
+    """
+    order = np.argsort((keys & 0xFFFF).astype(np.uint16), kind="stable")
+    if len(keys) and keys.max() > 0xFFFF:
+        high = (keys[order] >> 16).astype(np.uint16)
+        order = order[np.argsort(high, kind="stable")]
+    return order
+
+
+class BatchProduct():
+    """
+    Multiplies a LinkMatrix by many rank vectors at once, stored as the
+    columns of a (pages, k) array so that each link reads and writes k
+    contiguous values.
+
+    Ranks are first divided by their page's outdegree. Links are ordered
+    by target page, and cut into chunks of whole pages of up to
+    PRODUCT_SIZE values for the number of vectors multiplied, so each
+    chunk gathers the scaled ranks of its links' sources and sums them
+    per target page while they are still in cache.
+    """
+
+    def __init__(self, matrix):
+        order = stable_order(matrix.targets)
+        self.matrix = matrix
+        self.sources = matrix.sources[order]
+        self.scale = np.zeros((len(matrix), 1))
+        linked = ~matrix.dangling
+        self.scale[linked, 0] = 1.0 / matrix.outdegree[linked]
+
+        # Pages with incoming links, and where their links start, with
+        # the number of links after the last
+        indegree = np.bincount(matrix.targets, minlength=len(matrix))
+        self.targets = np.flatnonzero(indegree)
+        self.starts = np.append(
+            (np.cumsum(indegree) - indegree)[self.targets],
+            len(self.sources)
+        )
+        self.chunked = {}
+
+    def chunks(self, columns):
+        """
+        Returns the (first, last) ranges of target pages of the chunks
+        for multiplying `columns` vectors.
+        """
+        if columns not in self.chunked:
+            step = max(1, PRODUCT_SIZE // columns)
+            cuts = np.searchsorted(self.starts[:-1],
+                                   np.arange(0, len(self.sources), step))
+            cuts = np.unique(np.append(cuts, len(self.targets)))
+            self.chunked[columns] = list(
+                zip(cuts[:-1].tolist(), cuts[1:].tolist())
+            )
+        return self.chunked[columns]
+
+    def multiply(self, ranks):
+        """
+        Returns the product of the link matrix and each column of `ranks`.
+        A single column is left to LinkMatrix.multiply, which is faster.
+        """
+        if ranks.shape[1] == 1:
+            result = np.empty_like(ranks)
+            result[:, 0] = self.matrix.multiply(ranks[:, 0])
+            return result
+        scaled = ranks * self.scale
+        result = np.zeros_like(scaled)
+        for low, high in self.chunks(ranks.shape[1]):
+            first, last = self.starts[low], self.starts[high]
+            values = np.take(scaled, self.sources[first:last], axis=0)
+            result[self.targets[low:high]] = np.add.reduceat(
+                values, self.starts[low:high] - first, axis=0
+            )
+        return result
+
+
+def sample_ranks(matrix, damping_factor, n, surfers=SURFERS, seed=None,
+                 burn_in=BURN_IN):
+    """
+    Returns the PageRank vector of a LinkMatrix estimated from `n` samples
+    of `surfers` independent random surfers, all advanced together.
+
+    Surfers start at random pages and take `burn_in` steps before their
+    positions are counted, then their positions after each further step
+    are counted until `n` samples have been taken.
+    """
+    rng = np.random.default_rng(seed)
+    pages = len(matrix)
+    counts = np.zeros(pages, np.int64)
+    position = rng.integers(pages, size=surfers)
+    for _ in range(burn_in):
+        surf(matrix, damping_factor, position, rng)
+    taken = 0
+    while taken < n:
+        surf(matrix, damping_factor, position, rng)
+        count = min(surfers, n - taken)
+        counts += np.bincount(position[:count], minlength=pages)
+        taken += count
+    return counts / n
+
+
+def surf(matrix, damping_factor, position, rng):
+    """
+    Moves each surfer in the array of pages `position` one step: each
+    follows a random link of their page with probability `damping_factor`,
+    and otherwise, or from a dangling page, jumps to a random page.
+    """
+    outdegree = matrix.outdegree[position]
+    follow = (rng.random(len(position)) < damping_factor) & (outdegree > 0)
+    link = matrix.offsets[position[follow]] + (
+        rng.random(int(follow.sum())) * outdegree[follow]
+    ).astype(np.int64)
+    position[follow] = matrix.targets[link]
+    position[~follow] = rng.integers(len(matrix),
+                                     size=len(position) - len(link))
+
+
+def sample_pagerank(corpus, damping_factor, n, surfers=SURFERS, seed=None,
+                    burn_in=BURN_IN):
+    """
+    Return PageRank values for each page by sampling `n` pages with
+    many random surfers at once, after `burn_in` steps of each.
+
+    Return a dictionary where keys are page names, and values are
+    their estimated PageRank value (a value between 0 and 1). All
+    PageRank values should sum to 1.
+    """
+    matrix = LinkMatrix.from_corpus(corpus)
+    rank = sample_ranks(matrix, damping_factor, n, surfers, seed, burn_in)
+    return matrix.to_dict(rank)
+
+
+def power_iteration(matrix, damping_factor, tolerance=TOLERANCE,
+                    max_iterations=MAX_ITERATIONS, start=None):
+    """
+    Returns the PageRank vector of a LinkMatrix and the number of
+    iterations taken, starting from the vector `start`, or the uniform
+    vector by default, and stepping until successive vectors are within
+    `tolerance` in L1 distance.
+    """
+    n = len(matrix)
+    rank = np.full(n, 1.0 / n) if start is None else start
+    for iteration in range(1, max_iterations + 1):
+        updated = matrix.step(rank, damping_factor)
+        difference = np.abs(updated - rank).sum()
+        rank = updated
+        if difference <= tolerance:
+            break
+    return rank, iteration
+
+
+def iterate_pagerank(corpus, damping_factor, tolerance=TOLERANCE):
+    """
+    Return PageRank values for each page by power iteration over the
+    sparse link matrix of the corpus, until the L1 change in ranks is
+    at most `tolerance`.
+
+    Return a dictionary where keys are page names, and values are
+    their estimated PageRank value (a value between 0 and 1). All
+    PageRank values should sum to 1.
+    """
+    matrix = LinkMatrix.from_corpus(corpus)
+    rank, _ = power_iteration(matrix, damping_factor, tolerance)
+    return matrix.to_dict(rank)
+
+
+def update_ranks(matrix, rank, damping_factor, changes, tolerance=TOLERANCE):
+    """
+    Returns an Update with the link matrix after `changes` and its
+    PageRank vector, found by power iteration warm-started from the
+    previous vector `rank` of `matrix`.
+
+    Pages that were already ranked start from their previous rank and
+    added pages from 1/N, rescaled to sum to 1, so a small change to the
+    corpus re-converges in fewer iterations than a cold start.
+    """
+    updated = matrix.update(changes)
+    n = len(updated)
+
+    # Pages that were kept come first in the updated matrix, in order
+    removed = np.zeros(len(matrix), bool)
+    removed[[matrix.index[page] for page in changes
+             if changes[page] is None and page in matrix.index]] = True
+    kept = rank[~removed]
+    start = np.full(n, 1.0 / n)
+    start[:len(kept)] = kept
+    start /= start.sum()
+    rank, iterations = power_iteration(
+        updated, damping_factor, tolerance, start=start
+    )
+    return Update(updated, rank, iterations)